@@ -1,5 +1,7 @@
 import streamlit as st
 from utils.gsheets import gsheets_manager
+from utils.esquema import para_mostrar
+from utils.metricas import medir_pagina
 from datetime import datetime, date, time
 import pandas as pd
 
@@ -11,6 +13,55 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Conexión y datos se cargan en un hilo mientras se pinta la página
+gsheets_manager.precalentar()
+
+def mostrar_estadisticas():
+    """Estadísticas rápidas del sidebar (con manejo de errores)"""
+    try:
+        citas_hoy = gsheets_manager.get_today_appointments()
+        if citas_hoy is not None and not citas_hoy.empty and 'Estado' in citas_hoy.columns:
+            total_citas = len(citas_hoy)
+            citas_pendientes = len(citas_hoy[citas_hoy["Estado"] == "Agendada"])
+            citas_en_progreso = len(citas_hoy[citas_hoy["Estado"] == "En Progreso"])
+            
+            st.metric("📅 Citas Hoy", total_citas)
+            col1, col2 = st.columns(2)
+            col1.metric("⏳ Pendientes", citas_pendientes)
+            col2.metric("🔴 En Progreso", citas_en_progreso)
+        else:
+            st.metric("📅 Citas Hoy", 0)
+            st.info("No hay citas para hoy")
+    except Exception as e:
+        st.metric("📅 Citas Hoy", 0)
+        st.info("Cargando estadísticas...")
+
+def mostrar_proximas_citas():
+    """Columna de próximas citas de hoy"""
+    try:
+        citas_hoy = gsheets_manager.get_today_appointments()
+        if citas_hoy is not None and not citas_hoy.empty and 'Cliente' in citas_hoy.columns and 'Hora_Cita' in citas_hoy.columns:
+            # Ordenar por hora (minutos desde medianoche)
+            citas_hoy = citas_hoy.sort_values('Hora_Cita')
+            for _, cita in para_mostrar(citas_hoy.head(5)).iterrows():
+                status_color = {
+                    "Agendada": "🟡",
+                    "En Progreso": "🔴", 
+                    "Completada": "🟢",
+                    "Cancelada": "⚫"
+                }.get(cita.get("Estado", "Agendada"), "⚪")
+                
+                st.write(f"{status_color} **{cita['Hora_Cita']}** - {cita['Cliente']}")
+                st.caption(f"Servicio: {cita.get('Servicio', 'No especificado')}")
+                st.markdown("---")
+            
+            if len(citas_hoy) > 5:
+                st.caption(f"Y {len(citas_hoy) - 5} citas más...")
+        else:
+            st.info("✅ No hay citas para hoy")
+    except Exception as e:
+        st.info("✅ No hay citas para hoy")
+
 def main():
     # Sidebar con información general
     with st.sidebar:
@@ -18,24 +69,8 @@ def main():
         st.title("💈 Mi Peluquería")
         st.markdown("---")
         
-        # Mostrar estadísticas rápidas (con manejo de errores)
-        try:
-            citas_hoy = gsheets_manager.get_today_appointments()
-            if citas_hoy is not None and not citas_hoy.empty and 'Estado' in citas_hoy.columns:
-                total_citas = len(citas_hoy)
-                citas_pendientes = len(citas_hoy[citas_hoy["Estado"] == "Agendada"])
-                citas_en_progreso = len(citas_hoy[citas_hoy["Estado"] == "En Progreso"])
-                
-                st.metric("📅 Citas Hoy", total_citas)
-                col1, col2 = st.columns(2)
-                col1.metric("⏳ Pendientes", citas_pendientes)
-                col2.metric("🔴 En Progreso", citas_en_progreso)
-            else:
-                st.metric("📅 Citas Hoy", 0)
-                st.info("No hay citas para hoy")
-        except Exception as e:
-            st.metric("📅 Citas Hoy", 0)
-            st.info("Cargando estadísticas...")
+        # Estadísticas rápidas: se completan al final, cuando el resto de la página ya se ve
+        contenedor_estadisticas = st.container()
         
         st.markdown("---")
         st.markdown("### Navegación")
@@ -76,29 +111,7 @@ def main():
     
     with col2:
         st.subheader("📅 Próximas Citas Hoy")
-        try:
-            citas_hoy = gsheets_manager.get_today_appointments()
-            if citas_hoy is not None and not citas_hoy.empty and 'Cliente' in citas_hoy.columns and 'Hora_Cita' in citas_hoy.columns:
-                # Ordenar por hora
-                citas_hoy = citas_hoy.sort_values('Hora_Cita')
-                for _, cita in citas_hoy.head(5).iterrows():
-                    status_color = {
-                        "Agendada": "🟡",
-                        "En Progreso": "🔴", 
-                        "Completada": "🟢",
-                        "Cancelada": "⚫"
-                    }.get(cita.get("Estado", "Agendada"), "⚪")
-                    
-                    st.write(f"{status_color} **{cita['Hora_Cita']}** - {cita['Cliente']}")
-                    st.caption(f"Servicio: {cita.get('Servicio', 'No especificado')}")
-                    st.markdown("---")
-                
-                if len(citas_hoy) > 5:
-                    st.caption(f"Y {len(citas_hoy) - 5} citas más...")
-            else:
-                st.info("✅ No hay citas para hoy")
-        except Exception as e:
-            st.info("✅ No hay citas para hoy")
+        contenedor_proximas = st.container()
     
     # Información de contacto
     st.markdown("---")
@@ -126,6 +139,15 @@ def main():
         Contacta al administrador  
         admin@peluqueria.com
         """)
+    
+    # Lo que depende de Google Sheets se carga al final: la conexión se abre en
+    # el primer uso y no retrasa el resto de la página
+    with contenedor_estadisticas:
+        mostrar_estadisticas()
+    with contenedor_proximas:
+        mostrar_proximas_citas()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Tiempo de cada ejecución de la página, visible en el panel de diagnóstico
+    with medir_pagina("inicio"):
+        main()
\ No newline at end of file
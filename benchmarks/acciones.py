@@ -0,0 +1,284 @@
+"""Benchmark de llamadas a la API de Google Sheets por acción de usuario
+
+Reproduce, contra FakeSpreadsheet, las llamadas que cada página hace a
+gsheets_manager y reporta por acción: llamadas a la API, bytes transferidos
+y tiempo de pared.
+
+Uso (desde la raíz del repositorio):
+    
+    python -m benchmarks.acciones --filas 5000 --latencia 0.05
+    python -m benchmarks.acciones --guardar base.json
+    python -m benchmarks.acciones --comparar base.json   # sale con 1 si alguna acción hace más llamadas
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time as time_mod
+from datetime import datetime, timedelta
+
+from utils.cuota import ClienteCuota, HojaConCuota
+from utils.fake_sheets import FakeSpreadsheet
+from utils.gsheets import GoogleSheetsManager
+from utils.storage import COLUMNAS_CITAS, CONFIG_INICIAL, SheetsBackend
+
+SERVICIOS = ["Corte de cabello", "Afeitado", "Corte y barba", "Tinte", "Peinado"]
+CITAS_HOY = 8
+SESIONES_CONCURRENTES = 10
+
+
+def crear_hoja_de_prueba(filas, latencia=0.0, semilla=42):
+    """Crea un spreadsheet en memoria con `filas` citas de historial y CITAS_HOY citas para hoy"""
+    rnd = random.Random(semilla)
+    hoy = datetime.now().date()
+    valores = [list(COLUMNAS_CITAS)]
+    
+    # Como en la hoja real, las filas van en el orden en que se reservaron:
+    # las fechas del historial avanzan hasta hoy
+    dias_atras = sorted((rnd.randint(1, 730) for _ in range(max(filas - CITAS_HOY, 0))), reverse=True)
+    for i in range(1, filas + 1):
+        if i > filas - CITAS_HOY:
+            fecha, estado = hoy, "Agendada"
+            hora = f"{9 + (filas - i):02d}:00"
+        else:
+            fecha = hoy - timedelta(days=dias_atras[i - 1])
+            estado = rnd.choice(["Completada", "Completada", "Completada", "Cancelada"])
+            hora = f"{rnd.randint(9, 17):02d}:{rnd.choice(['00', '30'])}"
+        creada = f"{fecha - timedelta(days=3)} 10:00:00"
+        valores.append([
+            i, f"Cliente {i}", f"cliente{i}@correo.com", f"809{rnd.randint(1000000, 9999999)}",
+            fecha.strftime("%Y-%m-%d"), hora, estado, "", "",
+            rnd.choice(SERVICIOS), "", creada, creada
+        ])
+    
+    spreadsheet = FakeSpreadsheet(latencia=latencia)
+    spreadsheet.cargar("Citas", valores, cols=len(COLUMNAS_CITAS))
+    spreadsheet.cargar("Horarios_Config", CONFIG_INICIAL)
+    return spreadsheet
+
+
+# -- Acciones: mismas llamadas a gsheets_manager que hace cada página --
+
+def render_inicio(manager, ctx):
+    """app.py: métricas del sidebar y la columna de próximas citas de hoy"""
+    manager.get_today_appointments()
+    manager.get_today_appointments()
+
+
+def render_panel(manager, ctx):
+    """Panel Administrador: en cada rerun se ejecutan el sidebar y solo la sección visible"""
+    manager.get_today_appointments()  # sidebar
+    manager.get_today_appointments()  # 📅 Citas de Hoy (sección por defecto)
+
+
+def refresco_cache(manager, ctx):
+    """Cualquier página tras expirar la cache de citas (5 minutos), incluido el refresco de fondo"""
+    manager._citas.expirar()
+    manager.get_all_appointments()
+    manager._citas.esperar_refresco()
+
+
+def sesiones_concurrentes(manager, ctx):
+    """Varias sesiones abren la app a la vez con la cache de citas vacía"""
+    manager.clear_cache()
+    hilos = [threading.Thread(target=manager.get_all_appointments) for _ in range(SESIONES_CONCURRENTES)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+
+def cuota_excedida(manager, ctx):
+    """Cualquier página con la cache vacía mientras Google responde 429 dos veces"""
+    ctx["spreadsheet"].inyectar_errores(2, codigo=429)
+    manager.clear_cache()
+    manager.get_all_appointments()
+
+
+def buscar_horarios(manager, ctx):
+    """Agendar Cita: búsqueda y nueva consulta tras st.rerun()"""
+    manager.get_available_slots(ctx["fecha"])
+    manager.get_available_slots(ctx["fecha"])
+
+
+def reservar(manager, ctx):
+    """Agendar Cita: confirmar la cita seleccionada"""
+    manager.create_appointment({
+        "cliente": "Cliente Benchmark",
+        "correo": "bench@correo.com",
+        "Teléfono": "8090000000",
+        "fecha_cita": ctx["fecha"].strftime("%Y-%m-%d"),
+        "hora_cita": manager.get_available_slots(ctx["fecha"])[0],
+        "servicio": "Corte de cabello",
+        "notas": ""
+    })
+
+
+def reserva_en_conflicto(manager, ctx):
+    """Agendar Cita: otra instancia de la app tomó el horario después de la búsqueda"""
+    hora = manager.get_available_slots(ctx["fecha"])[0]
+    # La otra instancia escribe directamente en la hoja (sin contar llamadas)
+    hoja = ctx["spreadsheet"]._hojas["Citas"]
+    hoja._escribir(hoja._ultima_fila() + 1, 1, [[
+        "99999", "Otra Sesión", "", "", ctx["fecha"].strftime("%Y-%m-%d"), hora, "Agendada",
+        "", "", "Afeitado", "", "", ""
+    ]])
+    resultado = manager.create_appointment({
+        "cliente": "Cliente Benchmark",
+        "correo": "bench@correo.com",
+        "Teléfono": "8090000000",
+        "fecha_cita": ctx["fecha"].strftime("%Y-%m-%d"),
+        "hora_cita": hora,
+        "servicio": "Corte de cabello",
+        "notas": ""
+    })
+    assert resultado.conflicto, "la reserva duplicada no se detectó"
+
+
+def iniciar(manager, ctx):
+    """Panel: ▶️ Iniciar y rerun"""
+    manager.update_appointment_status(ctx["ids_hoy"][0], "En Progreso", datetime.now())
+    render_panel(manager, ctx)
+
+
+def finalizar(manager, ctx):
+    """Panel: ⏹️ Finalizar y rerun"""
+    manager.update_appointment_status(ctx["ids_hoy"][0], "Completada", None, datetime.now())
+    render_panel(manager, ctx)
+
+
+def cancelar(manager, ctx):
+    """Panel: ❌ Cancelar y rerun"""
+    manager.update_appointment_status(ctx["ids_hoy"][1], "Cancelada")
+    render_panel(manager, ctx)
+
+
+def tablero_hoy(manager, ctx):
+    """Panel: 💾 Guardar cambios de estado del tablero (varias citas a la vez) y rerun"""
+    estados = ["En Progreso", "Completada", "Cancelada"]
+    manager.update_appointment_statuses({
+        cita_id: estados[i % len(estados)] for i, cita_id in enumerate(ctx["ids_hoy"][2:])
+    })
+    render_panel(manager, ctx)
+
+
+def guardar_estados(manager, ctx):
+    """Hilo de la cola de escritura: guarda en la hoja los cambios de estado anteriores"""
+    manager.flush_pending_writes(timeout=60)
+
+
+def exportar(manager, ctx):
+    """Panel: ⬇️ CSV de Todas las Citas y la misma descarga otra vez (sale de la cache)"""
+    manager.export_appointments("csv", {})
+    manager.export_appointments("csv", {})
+
+
+def guardar_config(manager, ctx):
+    """Panel: 💾 Guardar Configuración y rerun"""
+    config = manager.get_configuracion()
+    config["DURACION_CITA"] = "45" if str(config.get("DURACION_CITA")) == "30" else "30"
+    manager.update_configuracion(config)
+    render_panel(manager, ctx)
+
+
+ACCIONES = [
+    ("inicio", render_inicio),
+    ("inicio_repetido", render_inicio),
+    ("buscar_horarios", buscar_horarios),
+    ("reservar", reservar),
+    ("reserva_en_conflicto", reserva_en_conflicto),
+    ("panel_admin", render_panel),
+    ("iniciar", iniciar),
+    ("finalizar", finalizar),
+    ("cancelar", cancelar),
+    ("tablero_hoy", tablero_hoy),
+    ("guardar_estados", guardar_estados),
+    ("exportar", exportar),
+    ("guardar_config", guardar_config),
+    ("refresco_cache", refresco_cache),
+    ("sesiones_concurrentes", sesiones_concurrentes),
+    ("cuota_excedida", cuota_excedida),
+]
+
+
+def ejecutar(filas=2000, latencia=0.0):
+    """Ejecuta todas las acciones en orden sobre un manager nuevo y devuelve las mediciones"""
+    # El contador de IDs y el diario de la cola se crean en un directorio temporal
+    with tempfile.TemporaryDirectory() as directorio:
+        return _ejecutar(filas, latencia, directorio)
+
+
+def _ejecutar(filas, latencia, directorio):
+    spreadsheet = crear_hoja_de_prueba(filas, latencia)
+    # Sin límite de fichas que distorsione los tiempos; reintentos con esperas cortas
+    cuota = ClienteCuota(lecturas_por_minuto=100000, escrituras_por_minuto=100000, espera_base=0.05)
+    ajustes = {
+        "ruta_contador_ids": os.path.join(directorio, "contador_ids.txt"),
+        "ruta_cola_escritura": os.path.join(directorio, "cola_escritura.jsonl"),
+    }
+    manager = GoogleSheetsManager(backend=SheetsBackend(HojaConCuota(spreadsheet, cuota)), cuota=cuota, ajustes=ajustes)
+    hoy = datetime.now().date()
+    ctx = {
+        "spreadsheet": spreadsheet,
+        "fecha": hoy + timedelta(days=1),
+        "ids_hoy": list(range(filas - CITAS_HOY + 1, filas + 1)),
+    }
+    
+    resultados = {}
+    for nombre, accion in ACCIONES:
+        spreadsheet.estadisticas.reiniciar()
+        inicio = time_mod.perf_counter()
+        accion(manager, ctx)
+        resumen = spreadsheet.estadisticas.resumen()
+        resumen["ms"] = round((time_mod.perf_counter() - inicio) * 1000, 2)
+        resultados[nombre] = resumen
+    return resultados
+
+
+def imprimir(resultados):
+    print(f"{'acción':<22}{'llamadas':>10}{'bytes':>12}{'ms':>10}  detalle")
+    for nombre, r in resultados.items():
+        detalle = ", ".join(f"{m}={n}" for m, n in sorted(r["por_metodo"].items()))
+        if r.get("errores"):
+            detalle += " | rechazadas: " + ", ".join(f"{m}={n}" for m, n in sorted(r["errores"].items()))
+        print(f"{nombre:<22}{r['llamadas']:>10}{r['bytes']:>12}{r['ms']:>10}  {detalle}")
+
+
+def comparar(resultados, base):
+    """Devuelve las acciones que hacen más llamadas que en la medición base"""
+    return [
+        f"{nombre}: {r['llamadas']} llamadas (base {base[nombre]['llamadas']})"
+        for nombre, r in resultados.items()
+        if nombre in base and r["llamadas"] > base[nombre]["llamadas"]
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=2000, help="citas de historial en la hoja simulada")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos de latencia por llamada")
+    parser.add_argument("--guardar", help="guardar las mediciones en este JSON")
+    parser.add_argument("--comparar", help="comparar contra un JSON guardado con --guardar")
+    args = parser.parse_args(argv)
+    
+    resultados = ejecutar(args.filas, args.latencia)
+    imprimir(resultados)
+    
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f))
+        for linea in regresiones:
+            print(f"❌ Regresión: {linea}")
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
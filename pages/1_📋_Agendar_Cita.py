@@ -1,7 +1,9 @@
 import streamlit as st
 from utils.gsheets import gsheets_manager
+from utils.metricas import medir_pagina
 from datetime import datetime, date, time, timedelta
 import pandas as pd
+import plotly.graph_objects as go
 
 st.set_page_config(
     page_title="Agendar Cita - Mi Peluquería",
@@ -9,6 +11,19 @@ st.set_page_config(
     layout="centered"
 )
 
+# Conexión y datos se cargan en un hilo mientras se pinta la página
+gsheets_manager.precalentar()
+
+# Servicios que se ofrecen, con su icono
+ICONOS_SERVICIO = {
+    "Corte de cabello": "💇",
+    "Afeitado": "🧔",
+    "Corte y barba": "✂️",
+    "Tinte": "🎨",
+    "Peinado": "💇‍♂️",
+    "Otro": "🔧"
+}
+
 def mostrar_horarios_disponibles(horarios):
     """Muestra horarios disponibles en formato de botones optimizado para móvil"""
     if not horarios:
@@ -46,6 +61,39 @@ def mostrar_horarios_disponibles(horarios):
     
     return None
 
+def mostrar_calendario_disponibilidad(disponibilidad):
+    """Calendario por semanas coloreado según los horarios libres de cada día"""
+    fechas = pd.to_datetime(disponibilidad['Fecha'])
+    lunes = fechas - pd.to_timedelta(fechas.dt.weekday, unit="D")
+    semanas = (lunes - lunes.min()).dt.days // 7
+    # Proporción libre de cada día; los días cerrados quedan en blanco
+    proporcion = (disponibilidad['Libres'] / disponibilidad['Ofrecidos']).where(disponibilidad['Ofrecidos'] > 0)
+    texto = fechas.dt.strftime("%d/%m") + "<br>" + disponibilidad['Libres'].astype(str)
+    
+    def tabla(valores):
+        return (pd.DataFrame({'semana': semanas, 'dia': fechas.dt.weekday, 'valor': valores})
+                .pivot(index='semana', columns='dia', values='valor').reindex(columns=range(7)))
+    
+    etiquetas = lunes.groupby(semanas).first().dt.strftime("Sem. %d/%m").tolist()
+    fig = go.Figure(go.Heatmap(
+        z=tabla(proporcion).to_numpy(dtype=float),
+        x=["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"],
+        y=etiquetas,
+        text=tabla(texto).fillna("").to_numpy(),
+        texttemplate="%{text}",
+        hovertemplate="%{text} libres<extra></extra>",
+        colorscale="RdYlGn",
+        zmin=0,
+        zmax=1,
+        showscale=False,
+        xgap=2,
+        ygap=2
+    ))
+    fig.update_yaxes(autorange="reversed")
+    fig.update_layout(height=60 + 45 * len(etiquetas), margin=dict(l=0, r=0, t=10, b=0))
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption("🟩 Muchos horarios libres · 🟥 Día lleno · En blanco: cerrado")
+
 def main():
     st.title("📋 Agendar Cita")
     st.markdown("---")
@@ -64,6 +112,7 @@ def main():
     if st.session_state.cita_agendada:
         st.success("🎉 ¡Cita agendada exitosamente!")
         datos = st.session_state.get('datos_cita', {})
+        linea_barbero = f"\n        **💈 Barbero:** {datos['barbero']}  " if datos.get('barbero') else ""
         
         st.subheader("📋 Resumen de tu Cita")
         st.info(f"""
@@ -71,7 +120,7 @@ def main():
         **📞 Teléfono:** {datos.get('Teléfono', '')}  
         **📧 Correo:** {datos.get('correo', 'No proporcionado')}  
         **📅 Fecha:** {datos.get('fecha', '')}  
-        **🕒 Hora:** {datos.get('hora', '')}  
+        **🕒 Hora:** {datos.get('hora', '')}  {linea_barbero}
         **💇 Servicio:** {datos.get('servicio', '')}  
         **📝 Notas:** {datos.get('notas', 'Ninguna')}
         """)
@@ -87,15 +136,19 @@ def main():
             st.rerun()
         return
     
-    # Verificar conexión
+    # Solo se corta si la conexión ya falló; mientras se abre, la página se pinta igual
     try:
-        if not gsheets_manager.client:
+        if gsheets_manager.sin_conexion:
             st.error("❌ Error de conexión. Por favor, intenta más tarde.")
             return
     except:
         st.error("❌ Error de conexión. Por favor, intenta más tarde.")
         return
     
+    # Barberos del local (lista vacía si se trabaja con un solo sillón)
+    barberos = gsheets_manager.get_barbers()
+    duraciones = gsheets_manager.get_service_durations()
+    
     # FORMULARIO PRINCIPAL - OPTIMIZADO PARA MÓVIL
     with st.form("formulario_principal"):
         st.subheader("👤 Información Personal")
@@ -129,6 +182,23 @@ def main():
             help="Selecciona la fecha para tu cita"
         )
         
+        # El servicio se elige antes de buscar: de su duración depende qué horarios caben
+        servicio = st.selectbox(
+            "Servicio *",
+            options=list(ICONOS_SERVICIO),
+            format_func=lambda s: f"{ICONOS_SERVICIO[s]} {s} ({duraciones.get(s, 30)} min)",
+            help="Selecciona el servicio que necesitas"
+        )
+        
+        barbero = ""
+        if barberos:
+            eleccion = st.selectbox(
+                "Barbero",
+                options=["Cualquiera"] + barberos,
+                help="Elige tu barbero o te asignamos uno libre"
+            )
+            barbero = "" if eleccion == "Cualquiera" else eleccion
+        
         # Botón para buscar horarios - CON INDICADOR VISUAL
         buscar_horarios = st.form_submit_button(
             "🔍 Buscar Horarios Disponibles", 
@@ -143,19 +213,39 @@ def main():
         else:
             with st.spinner("Buscando horarios disponibles..."):
                 try:
-                    horarios_disponibles = gsheets_manager.get_available_slots(fecha)
+                    horarios_disponibles = gsheets_manager.get_available_slots(fecha, barbero or None, servicio)
                     st.session_state.mostrar_horarios = True
                     st.session_state.busqueda_realizada = True
                     st.session_state.datos_basicos = {
                         'nombre': nombre,
                         'Teléfono': telefono,
                         'correo': correo,
-                        'fecha': fecha.strftime("%Y-%m-%d")
+                        'fecha': fecha.strftime("%Y-%m-%d"),
+                        'barbero': barbero,
+                        'servicio': servicio
                     }
                     st.rerun()
                 except Exception as e:
                     st.error(f"❌ Error al buscar horarios: {str(e)}")
     
+    # Disponibilidad de los próximos días, con el servicio y barbero de la última búsqueda
+    datos_busqueda = st.session_state.get('datos_basicos') or {}
+    hoy = datetime.now().date()
+    try:
+        disponibilidad = gsheets_manager.get_available_slots_range(
+            hoy,
+            hoy + timedelta(days=60),
+            datos_busqueda.get('barbero') or None,
+            datos_busqueda.get('servicio', servicio)
+        )
+    except Exception as e:
+        disponibilidad = pd.DataFrame()
+        st.warning(f"⚠️ No se pudo cargar el calendario de disponibilidad: {str(e)}")
+    
+    if not disponibilidad.empty:
+        with st.expander("📆 Disponibilidad de los próximos días", expanded=not st.session_state.busqueda_realizada):
+            mostrar_calendario_disponibilidad(disponibilidad)
+    
     # Mostrar indicador de búsqueda realizada
     if st.session_state.busqueda_realizada:
         st.info("🔍 **Búsqueda realizada** - Selecciona un horario disponible")
@@ -166,11 +256,29 @@ def main():
         st.markdown("---")
         st.subheader("🕒 Horarios Disponibles")
         
+        # Aviso si el horario elegido lo tomó otra persona mientras se confirmaba
+        if st.session_state.get('hora_en_conflicto'):
+            st.error(f"❌ El horario de las {st.session_state.hora_en_conflicto} acaba de ser reservado por otra persona. Por favor, elige otro horario.")
+            st.session_state.hora_en_conflicto = None
+        
         try:
             horarios_disponibles = gsheets_manager.get_available_slots(
-                datetime.strptime(st.session_state.datos_basicos['fecha'], "%Y-%m-%d").date()
+                datetime.strptime(st.session_state.datos_basicos['fecha'], "%Y-%m-%d").date(),
+                st.session_state.datos_basicos.get('barbero') or None,
+                st.session_state.datos_basicos.get('servicio')
             )
             hora_seleccionada = mostrar_horarios_disponibles(horarios_disponibles)
+            
+            # Día lleno: sugerir las próximas fechas con horarios libres
+            if not horarios_disponibles and not disponibilidad.empty:
+                fecha_buscada = datetime.strptime(st.session_state.datos_basicos['fecha'], "%Y-%m-%d").date()
+                proximas = disponibilidad[(disponibilidad['Fecha'] > fecha_buscada) & (disponibilidad['Libres'] > 0)].head(3)
+                if not proximas.empty:
+                    sugerencias = ", ".join(
+                        f"{fecha.strftime('%d/%m')} ({libres} libres)"
+                        for fecha, libres in zip(proximas['Fecha'], proximas['Libres'])
+                    )
+                    st.info(f"💡 **Próximas fechas con horarios libres:** {sugerencias}")
         except Exception as e:
             st.error(f"❌ Error al cargar horarios: {str(e)}")
     
@@ -180,18 +288,8 @@ def main():
         st.subheader("💇 Información del Servicio")
         
         with st.form("formulario_servicio"):
-            servicio = st.selectbox(
-                "Servicio *",
-                options=[
-                    "💇 Corte de cabello",
-                    "🧔 Afeitado", 
-                    "✂️ Corte y barba",
-                    "🎨 Tinte",
-                    "💇‍♂️ Peinado",
-                    "🔧 Otro"
-                ],
-                help="Selecciona el servicio que necesitas"
-            )
+            servicio = st.session_state.datos_basicos.get('servicio', "Otro")
+            st.write(f"**Servicio:** {ICONOS_SERVICIO.get(servicio, '')} {servicio} ({duraciones.get(servicio, 30)} min)")
             
             # CUADRO DE TEXTO PARA NOTAS - OPCIONAL
             notas = st.text_area(
@@ -239,14 +337,16 @@ def main():
                         "Teléfono": st.session_state.datos_basicos['Teléfono'],
                         "fecha_cita": st.session_state.datos_basicos['fecha'],
                         "hora_cita": st.session_state.hora_seleccionada,
-                        "servicio": servicio.replace("🔧 ", "").replace("💇 ", "").replace("🧔 ", "").replace("✂️ ", "").replace("🎨 ", "").replace("💇‍♂️ ", ""),
+                        "barbero": st.session_state.datos_basicos.get('barbero', ""),
+                        "servicio": servicio,
                         "notas": notas if notas else ""
                     }
                     
                     # Crear la cita
                     with st.spinner("Agendando tu cita..."):
                         try:
-                            if gsheets_manager.create_appointment(appointment_data):
+                            resultado = gsheets_manager.create_appointment(appointment_data)
+                            if resultado:
                                 st.session_state.cita_agendada = True
                                 st.session_state.datos_cita = {
                                     'nombre': st.session_state.datos_basicos['nombre'],
@@ -254,15 +354,21 @@ def main():
                                     'correo': st.session_state.datos_basicos['correo'],
                                     'fecha': st.session_state.datos_basicos['fecha'],
                                     'hora': st.session_state.hora_seleccionada,
-                                    'servicio': servicio,
+                                    'barbero': resultado.barbero,
+                                    'servicio': f"{ICONOS_SERVICIO.get(servicio, '')} {servicio}",
                                     'notas': notas if notas else "Ninguna"
                                 }
                                 st.rerun()
+                            elif resultado.conflicto:
+                                # Volver a la lista de horarios, ya actualizada
+                                st.session_state.hora_en_conflicto = st.session_state.hora_seleccionada
+                                st.session_state.hora_seleccionada = None
+                                st.rerun()
                             else:
                                 st.error("❌ Error al agendar la cita. Por favor, intenta nuevamente.")
                         except Exception as e:
                             st.error(f"❌ Error al agendar la cita: {str(e)}")
-
+    
     # Información adicional optimizada para móvil
     st.markdown("---")
     st.subheader("ℹ️ Información Importante")
@@ -291,4 +397,6 @@ def main():
         """)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Tiempo de cada ejecución de la página, visible en el panel de diagnóstico
+    with medir_pagina("agendar_cita"):
+        main()
\ No newline at end of file
@@ -1,10 +1,14 @@
 import streamlit as st
 from utils.gsheets import gsheets_manager
+from utils.esquema import DURACION_SERVICIOS, ESTADOS, para_mostrar, tipar_citas
+from utils.exportar import FORMATOS, filtrar_citas
+from utils.horarios import clave_config, clave_duracion, parsear_barberos
+from utils.metricas import medir_pagina, metricas
 from datetime import datetime, date, time, timedelta
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from io import BytesIO
+import functools
 
 st.set_page_config(
     page_title="Panel Administrador - Mi Peluquería", 
@@ -12,6 +16,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Conexión y datos se cargan en un hilo mientras se pinta la página
+gsheets_manager.precalentar()
+
 def authenticate():
     """Sistema de autenticación simple"""
     if "authenticated" not in st.session_state:
@@ -40,12 +47,581 @@ def authenticate():
     
     return True
 
+def medida(pagina):
+    """Decorador: cada ejecución de una sección se mide como página, también las de un fragmento"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir_pagina(pagina):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+def contenido_exportacion(formato, filtros):
+    """Función para st.download_button: genera la exportación (o la toma de la cache) al hacer clic
+    
+    El archivo se genera en disco por bloques, pero Streamlit no transmite
+    descargas: el archivo terminado se lee completo y queda en memoria
+    mientras se sirve.
+    """
+    filtros = dict(filtros)
+    
+    def contenido():
+        try:
+            with open(gsheets_manager.export_appointments(formato, filtros), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Lo borraron entre la consulta y la lectura: la cache lo vuelve a generar
+            with open(gsheets_manager.export_appointments(formato, filtros), "rb") as f:
+                return f.read()
+    
+    return contenido
+
+def tabla_latencias(histogramas, columna):
+    """Convierte los histogramas de una familia en una tabla ordenada por tiempo total"""
+    filas = []
+    for etiquetas, datos in histogramas.items():
+        nombre = dict(par.split("=", 1) for par in etiquetas.split(",") if "=" in par)
+        filas.append({
+            columna: nombre.get(columna.lower(), etiquetas),
+            "Llamadas": datos["llamadas"],
+            "Errores": datos["errores"],
+            "Media (ms)": datos["media_ms"],
+            "p50 (ms)": datos["p50_ms"],
+            "p95 (ms)": datos["p95_ms"],
+            "Máx (ms)": datos["max_ms"],
+            "Total (s)": datos["total_s"],
+        })
+    if not filas:
+        return pd.DataFrame()
+    return pd.DataFrame(filas).sort_values("Total (s)", ascending=False)
+
+def mostrar_diagnostico():
+    """Latencias de páginas, del manager y de la API, filas transferidas, caches, cola y cuota"""
+    st.subheader("🩺 Diagnóstico")
+    
+    datos = gsheets_manager.get_metrics()
+    histogramas = datos["histogramas"]
+    st.caption(f"Métricas del proceso desde {datos['desde']} · generado {datos['generado']}")
+    
+    st.markdown("**⏱️ Tiempo por ejecución de página**")
+    tabla = tabla_latencias(histogramas.get("pagina_render_segundos", {}), "Pagina")
+    if tabla.empty:
+        st.info("Sin datos todavía")
+    else:
+        st.dataframe(tabla, use_container_width=True, hide_index=True)
+    
+    st.markdown("**🧩 Métodos de GoogleSheetsManager**")
+    tabla = tabla_latencias(histogramas.get("gsheets_manager_segundos", {}), "Metodo")
+    if tabla.empty:
+        st.info("Sin datos todavía")
+    else:
+        st.dataframe(tabla, use_container_width=True, hide_index=True)
+    
+    st.markdown("**🌐 Peticiones a Google Sheets**")
+    tabla = tabla_latencias(histogramas.get("gsheets_api_segundos", {}), "Metodo")
+    if tabla.empty:
+        st.info("Sin peticiones a la API (backend local o datos en cache)")
+    else:
+        # Filas transferidas y reintentos por método
+        filas = {"leidas": {}, "escritas": {}}
+        for etiquetas, cantidad in datos["contadores"].get("gsheets_api_filas_total", {}).items():
+            nombre = dict(par.split("=", 1) for par in etiquetas.split(","))
+            filas[nombre["sentido"]][nombre["metodo"]] = cantidad
+        por_metodo = datos["api"]["por_metodo"]
+        tabla["Filas leídas"] = tabla["Metodo"].map(lambda m: filas["leidas"].get(m, 0))
+        tabla["Filas escritas"] = tabla["Metodo"].map(lambda m: filas["escritas"].get(m, 0))
+        tabla["Reintentos"] = tabla["Metodo"].map(
+            lambda m: por_metodo.get(m, {}).get("reintentos", 0) + por_metodo.get(m, {}).get("limitadas", 0)
+        )
+        st.dataframe(tabla, use_container_width=True, hide_index=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**🗄️ Caches**")
+        caches = pd.DataFrame(datos["caches"]).T
+        if caches.empty:
+            st.info("Sin caches")
+        else:
+            st.dataframe(caches, use_container_width=True)
+    with col2:
+        st.markdown("**📤 Cola de escritura y cuota**")
+        cola = datos["cola_escritura"]
+        st.write(f"Pendientes: **{cola['pendientes']}** · Lotes: {cola['lotes']} · Errores: {cola['errores']}")
+        st.write(f"Latencia media de lote: {cola['latencia_media_ms'] or '-'} ms")
+        fichas = datos["api"]["fichas"]
+        st.write(f"Fichas de cuota: lectura {fichas.get('lectura')} · escritura {fichas.get('escritura')}")
+        if datos["api"]["pausa_restante_s"]:
+            st.warning(f"⚠️ API en pausa por límite de cuota: {datos['api']['pausa_restante_s']}s")
+    
+    st.markdown("---")
+    col1, col2, col3 = st.columns(3)
+    fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
+    with col1:
+        st.download_button(
+            "⬇️ Métricas JSON",
+            gsheets_manager.export_metrics_json(),
+            f"metricas_{fecha}.json",
+            "application/json",
+            use_container_width=True
+        )
+    with col2:
+        st.download_button(
+            "⬇️ Métricas Prometheus",
+            gsheets_manager.export_metrics_prometheus(),
+            f"metricas_{fecha}.prom",
+            "text/plain",
+            use_container_width=True
+        )
+    with col3:
+        if st.button("🔄 Reiniciar métricas", use_container_width=True):
+            metricas.reiniciar()
+            st.rerun(scope="fragment")
+
+@medida("panel_administrador/citas_hoy")
+def mostrar_citas_hoy():
+    """Tablero de las citas de hoy: un cambio de estado por fila, guardados en un solo lote"""
+    st.subheader("📅 Citas del Día de Hoy")
+    
+    try:
+        citas_hoy = gsheets_manager.get_today_appointments()
+        
+        if citas_hoy.empty:
+            st.info("✅ No hay citas para hoy")
+        else:
+            # Métricas rápidas en fila para tablet
+            cols = st.columns(4)
+            metrics = [
+                ("Total", len(citas_hoy), ""),
+                ("Pendientes", len(citas_hoy[citas_hoy["Estado"] == "Agendada"]), "⏳"),
+                ("En Progreso", len(citas_hoy[citas_hoy["Estado"] == "En Progreso"]), "🔴"),
+                ("Completadas", len(citas_hoy[citas_hoy["Estado"] == "Completada"]), "✅")
+            ]
+            
+            for (label, value, icon), col in zip(metrics, cols):
+                with col:
+                    st.metric(f"{icon} {label}", value)
+            
+            st.markdown("---")
+            
+            # Tablero de una sola tabla: se cambian varios estados y se guardan juntos
+            columnas = [col for col in ['ID', 'Hora_Cita', 'Cliente', 'Teléfono', 'Servicio', 'Barbero', 'Estado', 'Notas']
+                        if col in citas_hoy.columns]
+            tablero = para_mostrar(citas_hoy)[columnas].sort_values('Hora_Cita')
+            tablero['Estado'] = tablero['Estado'].astype(str)
+            
+            # Dentro de un formulario, editar una celda no vuelve a ejecutar la página
+            with st.form("tablero_citas_hoy"):
+                editado = st.data_editor(
+                    tablero,
+                    column_config={
+                        "Hora_Cita": st.column_config.TextColumn("🕒 Hora"),
+                        "Cliente": st.column_config.TextColumn("👤 Cliente"),
+                        "Teléfono": st.column_config.TextColumn("📞 Teléfono"),
+                        "Servicio": st.column_config.TextColumn("💇 Servicio"),
+                        "Barbero": st.column_config.TextColumn("💈 Barbero"),
+                        "Estado": st.column_config.SelectboxColumn("Estado", options=ESTADOS, required=True),
+                        "Notas": st.column_config.TextColumn("📝 Notas")
+                    },
+                    disabled=[col for col in columnas if col != 'Estado'],
+                    hide_index=True,
+                    use_container_width=True
+                )
+                guardar = st.form_submit_button("💾 Guardar cambios de estado", type="primary", use_container_width=True)
+            
+            if guardar:
+                cambiados = editado['Estado'] != tablero['Estado']
+                estados = dict(zip(editado.loc[cambiados, 'ID'], editado.loc[cambiados, 'Estado']))
+                if not estados:
+                    st.info("No hay cambios de estado para guardar")
+                else:
+                    try:
+                        # Un solo lote: la hoja recibe todos los cambios en una escritura
+                        if gsheets_manager.update_appointment_statuses(estados):
+                            st.success(f"✅ {len(estados)} citas actualizadas")
+                            st.rerun()
+                        else:
+                            st.error("❌ No se pudieron guardar los cambios")
+                    except Exception as e:
+                        st.error(f"❌ Error: {str(e)}")
+                    
+    except Exception as e:
+        st.error(f"❌ Error al cargar citas de hoy: {str(e)}")
+
+@st.fragment
+@medida("panel_administrador/todas_las_citas")
+def mostrar_todas_las_citas():
+    """Todas las citas con filtros y exportación"""
+    st.subheader("📊 Todas las Citas")
+    
+    try:
+        df = gsheets_manager.get_all_appointments()
+        
+        if df.empty:
+            st.info("📝 No hay citas registradas")
+        else:
+            # Filtros optimizados para tablet
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                fecha_filtro = st.date_input("Filtrar por fecha", value=None)
+            with col2:
+                try:
+                    estados = ["Todos"] + list(df["Estado"].unique()) if "Estado" in df.columns else ["Todos"]
+                    estado_filtro = st.selectbox("Filtrar por estado", estados)
+                except:
+                    estado_filtro = "Todos"
+            with col3:
+                cliente_filtro = st.text_input("Filtrar por cliente", placeholder="Nombre del cliente")
+            
+            # Los mismos filtros se aplican a la tabla y a las exportaciones
+            filtros = {"fecha": fecha_filtro, "estado": estado_filtro, "cliente": cliente_filtro}
+            df_filtrado = filtrar_citas(df, filtros)
+            
+            col_metrica, col_limpiar = st.columns([2, 1])
+            with col_metrica:
+                st.metric("Citas filtradas", len(df_filtrado))
+            with col_limpiar:
+                if st.button("🔄 Limpiar Filtros", use_container_width=True):
+                    st.rerun(scope="fragment")
+            
+            # Cada archivo se genera al hacer clic en su botón y se reutiliza
+            # mientras no cambien los datos ni los filtros
+            with st.expander("📦 Exportar citas"):
+                col_rango, col_historial = st.columns([2, 1])
+                with col_rango:
+                    rango = st.date_input(
+                        "Rango de fechas (opcional)",
+                        value=(),
+                        help="Solo las citas entre estas dos fechas, incluidas"
+                    )
+                with col_historial:
+                    filtros["historial"] = st.checkbox(
+                        "📚 Incluir historial archivado",
+                        help="Los meses archivados del rango se leen de a uno"
+                    )
+                sufijo = ""
+                if len(rango) == 2:
+                    filtros["desde"], filtros["hasta"] = rango
+                    sufijo = f"_{rango[0]:%Y%m%d}_{rango[1]:%Y%m%d}"
+                
+                st.caption("Cada descarga se carga completa en memoria; con el historial conviene acotar el rango de fechas.")
+                cols = st.columns(3)
+                for col, (formato, etiqueta) in zip(cols, [("csv", "⬇️ CSV"), ("xlsx", "⬇️ Excel"), ("parquet", "⬇️ Parquet")]):
+                    mime, extension = FORMATOS[formato]
+                    with col:
+                        st.download_button(
+                            etiqueta,
+                            contenido_exportacion(formato, filtros),
+                            f"citas_peluqueria{sufijo}.{extension}",
+                            mime,
+                            key=f"exportar_{formato}",
+                            use_container_width=True
+                        )
+            
+            # Fecha y hora como texto para la tabla
+            df_filtrado = para_mostrar(df_filtrado)
+            
+            # Mostrar dataframe con columnas importantes para tablet
+            columnas_mostrar = ['ID', 'Cliente', 'Teléfono', 'Fecha_Cita', 'Hora_Cita', 'Barbero', 'Estado', 'Servicio']
+            columnas_disponibles = [col for col in columnas_mostrar if col in df_filtrado.columns]
+            
+            st.dataframe(
+                df_filtrado[columnas_disponibles],
+                use_container_width=True,
+                height=400
+            )
+            
+    except Exception as e:
+        st.error(f"❌ Error al cargar todas las citas: {str(e)}")
+
+@st.fragment
+@medida("panel_administrador/estadisticas")
+def mostrar_estadisticas():
+    """Gráficos de citas por día, estado, servicio y mes"""
+    st.subheader("📈 Estadísticas y Gráficos")
+    
+    try:
+        df = gsheets_manager.get_all_appointments()
+        
+        # El historial archivado solo se lee si se pide, y solo los meses elegidos
+        incluir_historial = st.checkbox("📚 Incluir historial archivado", value=False)
+        if incluir_historial:
+            meses = gsheets_manager.get_archive_months()
+            if meses:
+                meses_elegidos = st.multiselect("Meses archivados", meses, default=meses[-3:])
+                historial = gsheets_manager.get_archived_appointments(meses_elegidos)
+                if not historial.empty:
+                    df = tipar_citas(pd.concat([df, historial], ignore_index=True))
+            else:
+                st.info("Todavía no hay citas archivadas")
+        
+        if df.empty:
+            st.info("📊 No hay datos suficientes para generar estadísticas")
+        else:
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                # Gráfico de citas por día
+                st.subheader("📅 Citas por Día")
+                if 'Fecha_Cita' in df.columns:
+                    citas_por_dia = df.groupby('Fecha_Cita').size().reset_index(name='Cantidad')
+                    citas_por_dia = citas_por_dia.sort_values('Fecha_Cita').tail(10)  # Últimos 10 días
+                    
+                    fig_dias = px.bar(
+                        citas_por_dia, 
+                        x='Fecha_Cita', 
+                        y='Cantidad',
+                        title="Citas por Día (Últimos 10 días)",
+                        color='Cantidad',
+                        color_continuous_scale='blues'
+                    )
+                    st.plotly_chart(fig_dias, use_container_width=True)
+                else:
+                    st.info("No hay datos de fechas para generar el gráfico")
+            
+            with col2:
+                # Gráfico de citas por estado
+                st.subheader("📊 Citas por Estado")
+                if 'Estado' in df.columns:
+                    # Las categorías sin citas no se grafican
+                    citas_por_estado = df['Estado'].value_counts().loc[lambda conteo: conteo > 0].reset_index()
+                    citas_por_estado.columns = ['Estado', 'Cantidad']
+                    
+                    fig_estados = px.pie(
+                        citas_por_estado,
+                        values='Cantidad',
+                        names='Estado',
+                        title="Distribución por Estado",
+                        color='Estado',
+                        color_discrete_map={
+                            'Agendada': '#FFA726',
+                            'En Progreso': '#EF5350',
+                            'Completada': '#66BB6A',
+                            'Cancelada': '#BDBDBD'
+                        }
+                    )
+                    st.plotly_chart(fig_estados, use_container_width=True)
+                else:
+                    st.info("No hay datos de estados para generar el gráfico")
+            
+            # Gráfico de servicios más populares
+            st.subheader("💇 Servicios Más Populares")
+            if 'Servicio' in df.columns:
+                servicios_populares = df['Servicio'].value_counts().loc[lambda conteo: conteo > 0].head(8).reset_index()
+                servicios_populares.columns = ['Servicio', 'Cantidad']
+                
+                fig_servicios = px.bar(
+                    servicios_populares,
+                    x='Servicio',
+                    y='Cantidad',
+                    title="Servicios Más Solicitados",
+                    color='Cantidad',
+                    color_continuous_scale='viridis'
+                )
+                st.plotly_chart(fig_servicios, use_container_width=True)
+            else:
+                st.info("No hay datos de servicios para generar el gráfico")
+            
+            # Con historial, la evolución mes a mes
+            if incluir_historial and 'Fecha_Cita' in df.columns:
+                st.subheader("📆 Citas por Mes")
+                citas_por_mes = df.groupby(df['Fecha_Cita'].dt.strftime("%Y-%m")).size().reset_index(name='Cantidad')
+                fig_meses = px.line(citas_por_mes, x='Fecha_Cita', y='Cantidad', markers=True, title="Citas por Mes")
+                st.plotly_chart(fig_meses, use_container_width=True)
+                
+    except Exception as e:
+        st.error(f"❌ Error al generar estadísticas: {str(e)}")
+
+@medida("panel_administrador/configuracion")
+def mostrar_configuracion():
+    """Horarios, duraciones, barberos y archivado de citas"""
+    st.subheader("⚙️ Configuración")
+    
+    try:
+        config = gsheets_manager.get_configuracion()
+        
+        with st.form("config_form"):
+            st.subheader("🕒 Horarios de Trabajo por Día")
+            
+            # Configuración por día - INCLUYENDO DOMINGO
+            dias_semana = [
+                ("Lunes", "LUNES"),
+                ("Martes", "MARTES"),
+                ("Miércoles", "MIERCOLES"),
+                ("Jueves", "JUEVES"),
+                ("Viernes", "VIERNES"),
+                ("Sábado", "SABADO"),
+                ("Domingo", "DOMINGO")  # ✅ AGREGADO DOMINGO
+            ]
+            
+            # Primera fila de días
+            cols = st.columns(4)
+            for i, (dia_nombre, dia_key) in enumerate(dias_semana[:4]):
+                with cols[i]:
+                    horario_key = f"HORARIO_{dia_key}"
+                    valor_actual = config.get(horario_key, "09:00-18:00")
+                    nuevo_valor = st.text_input(
+                        dia_nombre,
+                        value=valor_actual,
+                        placeholder="09:00-18:00",
+                        help=f"Horario para {dia_nombre}"
+                    )
+                    config[horario_key] = nuevo_valor
+            
+            # Segunda fila de días
+            cols = st.columns(4)
+            for i, (dia_nombre, dia_key) in enumerate(dias_semana[4:]):
+                with cols[i]:
+                    horario_key = f"HORARIO_{dia_key}"
+                    valor_actual = config.get(horario_key, "09:00-14:00")
+                    nuevo_valor = st.text_input(
+                        dia_nombre,
+                        value=valor_actual,
+                        placeholder="09:00-14:00",
+                        help=f"Horario para {dia_nombre}"
+                    )
+                    config[horario_key] = nuevo_valor
+            
+            st.subheader("⏱️ Configuración de Citas")
+            duracion = st.number_input(
+                "Intervalo entre horarios (minutos)", 
+                value=int(config.get("DURACION_CITA", "30")), 
+                min_value=15, 
+                max_value=120, 
+                step=5,
+                help="Cada cuánto se ofrece un horario; también es la duración de los servicios sin duración propia"
+            )
+            config["DURACION_CITA"] = str(duracion)
+            
+            # Cuánto ocupa al barbero cada servicio
+            cols = st.columns(3)
+            for i, (servicio, minutos) in enumerate(DURACION_SERVICIOS.items()):
+                with cols[i % 3]:
+                    duracion_key = clave_duracion(servicio)
+                    config[duracion_key] = str(st.number_input(
+                        f"{servicio} (minutos)",
+                        value=int(config.get(duracion_key, minutos)),
+                        min_value=5,
+                        max_value=480,
+                        step=5,
+                        key=f"duracion_{duracion_key}"
+                    ))
+            
+            st.subheader("📅 Días No Laborables")
+            dias_no_laborables = st.text_area(
+                "Fechas no laborables (separar por comas)",
+                value=config.get("DIAS_NO_LABORABLES", ""),
+                placeholder="2024-12-25, 2024-01-01, 2024-04-02",
+                help="Formato: AAAA-MM-DD, separados por comas"
+            )
+            config["DIAS_NO_LABORABLES"] = dias_no_laborables
+            
+            st.subheader("☕ Descansos y Horarios Especiales")
+            config["DESCANSOS"] = st.text_input(
+                "Descansos de todos los días (separar por comas)",
+                value=config.get("DESCANSOS", ""),
+                placeholder="13:00-14:00, SABADO 12:00-12:30",
+                help="Un rango sin día se repite todos los días; con día, solo ese día de la semana"
+            )
+            config["HORARIOS_ESPECIALES"] = st.text_area(
+                "Horarios de fechas puntuales (separar por comas)",
+                value=config.get("HORARIOS_ESPECIALES", ""),
+                placeholder="2024-12-24 09:00-13:00, 2024-12-31 CERRADO",
+                help="Reemplazan el horario de todos los barberos en esa fecha"
+            )
+            
+            st.subheader("💈 Barberos")
+            config["BARBEROS"] = st.text_input(
+                "Barberos (separar por comas)",
+                value=config.get("BARBEROS", ""),
+                placeholder="Carlos, Miguel, Ana",
+                help="Vacío: un solo sillón. Tras guardar, cada barbero puede tener su propio horario"
+            )
+            
+            # Horario propio de cada barbero; vacío = horario del local, "CERRADO" = no trabaja ese día
+            for barbero in parsear_barberos(config.get("BARBEROS", "")):
+                with st.expander(f"🕒 Horario de {barbero}"):
+                    for fila_dias in (dias_semana[:4], dias_semana[4:]):
+                        cols = st.columns(4)
+                        for i, (dia_nombre, dia_key) in enumerate(fila_dias):
+                            with cols[i]:
+                                horario_key = f"HORARIO_{dia_key}_{clave_config(barbero)}"
+                                config[horario_key] = st.text_input(
+                                    dia_nombre,
+                                    value=config.get(horario_key, ""),
+                                    placeholder="Horario del local",
+                                    key=f"horario_{horario_key}",
+                                    help="Ej.: 10:00-14:00 o CERRADO"
+                                )
+                    descansos_key = f"DESCANSOS_{clave_config(barbero)}"
+                    config[descansos_key] = st.text_input(
+                        "Descansos propios",
+                        value=config.get(descansos_key, ""),
+                        placeholder="Ej.: 14:00-15:00, VIERNES 16:00-17:00",
+                        key=f"descansos_{descansos_key}",
+                        help="Se suman a los descansos de todos"
+                    )
+            
+            submitted = st.form_submit_button("💾 Guardar Configuración", type="primary", use_container_width=True)
+            
+            if submitted:
+                try:
+                    if gsheets_manager.update_configuracion(config):
+                        st.success("✅ Configuración guardada correctamente")
+                        st.rerun()
+                    else:
+                        st.error("❌ Error al guardar la configuración")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
+                    
+    except Exception as e:
+        st.error(f"❌ Error al cargar configuración: {str(e)}")
+    
+    st.markdown("---")
+    st.subheader("🗄️ Archivo Histórico")
+    st.caption("Las citas completadas o canceladas más antiguas pasan a un archivo por mes; la hoja Citas queda más liviana y carga más rápido.")
+    dias_archivo = st.number_input(
+        "Archivar citas de hace más de (días)",
+        value=gsheets_manager.dias_archivo,
+        min_value=7,
+        max_value=3650,
+        step=30
+    )
+    if st.button("🗄️ Archivar citas antiguas", use_container_width=True):
+        with st.spinner("Archivando citas..."):
+            try:
+                archivadas = gsheets_manager.archive_appointments(dias_archivo)
+                if archivadas:
+                    st.success(f"✅ {archivadas} citas archivadas")
+                else:
+                    st.info("No hay citas para archivar")
+            except Exception as e:
+                st.error(f"❌ Error al archivar: {str(e)}")
+
+@st.fragment
+@medida("panel_administrador/diagnostico")
+def mostrar_seccion_diagnostico():
+    """Panel de diagnóstico; sus botones solo vuelven a ejecutar esta sección"""
+    try:
+        mostrar_diagnostico()
+    except Exception as e:
+        st.error(f"❌ Error al cargar el diagnóstico: {str(e)}")
+
+# Secciones del panel, en el orden de la barra de navegación
+SECCIONES = {
+    "📅 Citas de Hoy": mostrar_citas_hoy,
+    "📊 Todas las Citas": mostrar_todas_las_citas,
+    "📈 Estadísticas": mostrar_estadisticas,
+    "⚙️ Configuración": mostrar_configuracion,
+    "🩺 Diagnóstico": mostrar_seccion_diagnostico
+}
+
 def main():
     if not authenticate():
         return
     
     try:
-        if not gsheets_manager.client:
+        if gsheets_manager.sin_conexion:
             st.error("❌ Error de conexión con Google Sheets")
             return
     except AttributeError:
@@ -77,6 +653,13 @@ def main():
         except:
             st.metric("📅 Citas Hoy", 0)
         
+        # Cambios de estado que todavía se están guardando en la hoja
+        cola = gsheets_manager.get_write_queue_stats()
+        if cola["pendientes"]:
+            st.caption(f"⏳ {cola['pendientes']} cambios pendientes de guardar")
+        if cola["errores"] and cola["pendientes"]:
+            st.warning(f"⚠️ Reintentando guardar: {cola['ultimo_error']}")
+        
         st.markdown("---")
         st.info("📱 **Modo Tablet Activado** - Interfaz optimizada")
         
@@ -85,346 +668,19 @@ def main():
             st.session_state.authenticated = False
             st.rerun()
     
-    # Pestañas principales optimizadas para tablet
-    tab1, tab2, tab3, tab4 = st.tabs(["📅 Citas de Hoy", "📊 Todas las Citas", "📈 Estadísticas", "⚙️ Configuración"])
-    
-    with tab1:
-        st.subheader("📅 Citas del Día de Hoy")
-        
-        try:
-            citas_hoy = gsheets_manager.get_today_appointments()
-            
-            if citas_hoy.empty:
-                st.info("✅ No hay citas para hoy")
-            else:
-                # Métricas rápidas en fila para tablet
-                cols = st.columns(4)
-                metrics = [
-                    ("Total", len(citas_hoy), ""),
-                    ("Pendientes", len(citas_hoy[citas_hoy["Estado"] == "Agendada"]), "⏳"),
-                    ("En Progreso", len(citas_hoy[citas_hoy["Estado"] == "En Progreso"]), "🔴"),
-                    ("Completadas", len(citas_hoy[citas_hoy["Estado"] == "Completada"]), "✅")
-                ]
-                
-                for (label, value, icon), col in zip(metrics, cols):
-                    with col:
-                        st.metric(f"{icon} {label}", value)
-                
-                st.markdown("---")
-                
-                # Lista de citas optimizada para tablet - MÁS INFORMACIÓN
-                for _, cita in citas_hoy.iterrows():
-                    with st.container():
-                        # Usar columnas adaptativas para tablet
-                        col1, col2, col3 = st.columns([3, 2, 2])
-                        
-                        with col1:
-                            # INFORMACIÓN COMPLETA PARA TABLET
-                            st.write(f"**👤 {cita.get('Cliente', 'N/A')}**")
-                            st.caption(f"📞 {cita.get('Teléfono', 'N/A')}")
-                            st.write(f"**🕒 Hora:** {cita.get('Hora_Cita', 'N/A')}")
-                            st.write(f"**💇 Servicio:** {cita.get('Servicio', 'Consulta')}")
-                            
-                            # Mostrar notas si existen
-                            notas = cita.get('Notas', '')
-                            if notas and str(notas).strip() and str(notas).strip() != 'nan':
-                                with st.expander("📝 Ver notas"):
-                                    st.write(notas)
-                        
-                        with col2:
-                            estado = cita.get("Estado", "Agendada")
-                            color_estado = {
-                                "Agendada": "🟡",
-                                "En Progreso": "🔴", 
-                                "Completada": "🟢",
-                                "Cancelada": "⚫"
-                            }.get(estado, "⚪")
-                            st.write(f"**Estado:** {color_estado} {estado}")
-                            
-                            # Información adicional
-                            if 'Fecha_Creacion' in cita:
-                                fecha_creacion = cita['Fecha_Creacion']
-                                if isinstance(fecha_creacion, str) and ' ' in fecha_creacion:
-                                    hora_creacion = fecha_creacion.split(' ')[1][:5]
-                                    st.caption(f"📋 Creada: {hora_creacion}")
-                        
-                        with col3:
-                            cita_id = cita.get('ID')
-                            if cita_id:
-                                estado = cita.get("Estado", "Agendada")
-                                
-                                if estado == "Agendada":
-                                    col_btn1, col_btn2 = st.columns(2)
-                                    with col_btn1:
-                                        if st.button("▶️ Iniciar", key=f"start_{cita_id}", use_container_width=True):
-                                            try:
-                                                gsheets_manager.update_appointment_status(cita_id, "En Progreso", datetime.now())
-                                                st.success("✅ Cita iniciada")
-                                                st.rerun()
-                                            except Exception as e:
-                                                st.error(f"❌ Error: {str(e)}")
-                                    with col_btn2:
-                                        if st.button("❌ Cancelar", key=f"cancel_{cita_id}", use_container_width=True):
-                                            try:
-                                                gsheets_manager.update_appointment_status(cita_id, "Cancelada")
-                                                st.success("✅ Cita cancelada")
-                                                st.rerun()
-                                            except Exception as e:
-                                                st.error(f"❌ Error: {str(e)}")
-                                
-                                elif estado == "En Progreso":
-                                    if st.button("⏹️ Finalizar", key=f"end_{cita_id}", use_container_width=True):
-                                        try:
-                                            gsheets_manager.update_appointment_status(cita_id, "Completada", None, datetime.now())
-                                            st.success("✅ Cita finalizada")
-                                            st.rerun()
-                                        except Exception as e:
-                                            st.error(f"❌ Error: {str(e)}")
-                                
-                                elif estado in ["Completada", "Cancelada"]:
-                                    st.info("✅ Acción completada")
-                        
-                        st.markdown("---")
-                        
-        except Exception as e:
-            st.error(f"❌ Error al cargar citas de hoy: {str(e)}")
-    
-    with tab2:
-        st.subheader("📊 Todas las Citas")
-        
-        try:
-            df = gsheets_manager.get_all_appointments()
-            
-            if df.empty:
-                st.info("📝 No hay citas registradas")
-            else:
-                # Filtros optimizados para tablet
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    fecha_filtro = st.date_input("Filtrar por fecha", value=None)
-                with col2:
-                    try:
-                        estados = ["Todos"] + list(df["Estado"].unique()) if "Estado" in df.columns else ["Todos"]
-                        estado_filtro = st.selectbox("Filtrar por estado", estados)
-                    except:
-                        estado_filtro = "Todos"
-                with col3:
-                    cliente_filtro = st.text_input("Filtrar por cliente", placeholder="Nombre del cliente")
-                
-                # Aplicar filtros
-                df_filtrado = df.copy()
-                
-                if fecha_filtro and "Fecha_Cita" in df_filtrado.columns:
-                    try:
-                        df_filtrado = df_filtrado[df_filtrado["Fecha_Cita"] == fecha_filtro.strftime("%Y-%m-%d")]
-                    except:
-                        pass
-                
-                if estado_filtro != "Todos" and "Estado" in df_filtrado.columns:
-                    df_filtrado = df_filtrado[df_filtrado["Estado"] == estado_filtro]
-                
-                if cliente_filtro and "Cliente" in df_filtrado.columns:
-                    df_filtrado = df_filtrado[df_filtrado["Cliente"].str.contains(cliente_filtro, case=False, na=False)]
-                
-                st.metric("Citas filtradas", len(df_filtrado))
-                
-                # Botones de exportación
-                col_exp1, col_exp2, col_exp3 = st.columns(3)
-                with col_exp1:
-                    if st.button("📊 Exportar a CSV", use_container_width=True):
-                        csv = df_filtrado.to_csv(index=False)
-                        st.download_button(
-                            "⬇️ Descargar CSV",
-                            csv,
-                            "citas_peluqueria.csv",
-                            "text/csv",
-                            use_container_width=True
-                        )
-                with col_exp2:
-                    if st.button("📈 Exportar a Excel", use_container_width=True):
-                        output = BytesIO()
-                        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                            df_filtrado.to_excel(writer, index=False, sheet_name='Citas')
-                        st.download_button(
-                            "⬇️ Descargar Excel",
-                            output.getvalue(),
-                            "citas_peluqueria.xlsx",
-                            "application/vnd.ms-excel",
-                            use_container_width=True
-                        )
-                with col_exp3:
-                    if st.button("🔄 Limpiar Filtros", use_container_width=True):
-                        st.rerun()
-                
-                # Mostrar dataframe con columnas importantes para tablet
-                columnas_mostrar = ['ID', 'Cliente', 'Teléfono', 'Fecha_Cita', 'Hora_Cita', 'Estado', 'Servicio']
-                columnas_disponibles = [col for col in columnas_mostrar if col in df_filtrado.columns]
-                
-                st.dataframe(
-                    df_filtrado[columnas_disponibles],
-                    use_container_width=True,
-                    height=400
-                )
-                
-        except Exception as e:
-            st.error(f"❌ Error al cargar todas las citas: {str(e)}")
-    
-    with tab3:
-        st.subheader("📈 Estadísticas y Gráficos")
-        
-        try:
-            df = gsheets_manager.get_all_appointments()
-            
-            if df.empty:
-                st.info("📊 No hay datos suficientes para generar estadísticas")
-            else:
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Gráfico de citas por día
-                    st.subheader("📅 Citas por Día")
-                    if 'Fecha_Cita' in df.columns:
-                        citas_por_dia = df.groupby('Fecha_Cita').size().reset_index(name='Cantidad')
-                        citas_por_dia = citas_por_dia.sort_values('Fecha_Cita').tail(10)  # Últimos 10 días
-                        
-                        fig_dias = px.bar(
-                            citas_por_dia, 
-                            x='Fecha_Cita', 
-                            y='Cantidad',
-                            title="Citas por Día (Últimos 10 días)",
-                            color='Cantidad',
-                            color_continuous_scale='blues'
-                        )
-                        st.plotly_chart(fig_dias, use_container_width=True)
-                    else:
-                        st.info("No hay datos de fechas para generar el gráfico")
-                
-                with col2:
-                    # Gráfico de citas por estado
-                    st.subheader("📊 Citas por Estado")
-                    if 'Estado' in df.columns:
-                        citas_por_estado = df['Estado'].value_counts().reset_index()
-                        citas_por_estado.columns = ['Estado', 'Cantidad']
-                        
-                        fig_estados = px.pie(
-                            citas_por_estado,
-                            values='Cantidad',
-                            names='Estado',
-                            title="Distribución por Estado",
-                            color='Estado',
-                            color_discrete_map={
-                                'Agendada': '#FFA726',
-                                'En Progreso': '#EF5350',
-                                'Completada': '#66BB6A',
-                                'Cancelada': '#BDBDBD'
-                            }
-                        )
-                        st.plotly_chart(fig_estados, use_container_width=True)
-                    else:
-                        st.info("No hay datos de estados para generar el gráfico")
-                
-                # Gráfico de servicios más populares
-                st.subheader("💇 Servicios Más Populares")
-                if 'Servicio' in df.columns:
-                    servicios_populares = df['Servicio'].value_counts().head(8).reset_index()
-                    servicios_populares.columns = ['Servicio', 'Cantidad']
-                    
-                    fig_servicios = px.bar(
-                        servicios_populares,
-                        x='Servicio',
-                        y='Cantidad',
-                        title="Servicios Más Solicitados",
-                        color='Cantidad',
-                        color_continuous_scale='viridis'
-                    )
-                    st.plotly_chart(fig_servicios, use_container_width=True)
-                else:
-                    st.info("No hay datos de servicios para generar el gráfico")
-                    
-        except Exception as e:
-            st.error(f"❌ Error al generar estadísticas: {str(e)}")
-    
-    with tab4:
-        st.subheader("⚙️ Configuración")
-        
-        try:
-            config = gsheets_manager.get_configuracion()
-            
-            with st.form("config_form"):
-                st.subheader("🕒 Horarios de Trabajo por Día")
-                
-                # Configuración por día - INCLUYENDO DOMINGO
-                dias_semana = [
-                    ("Lunes", "LUNES"),
-                    ("Martes", "MARTES"),
-                    ("Miércoles", "MIERCOLES"),
-                    ("Jueves", "JUEVES"),
-                    ("Viernes", "VIERNES"),
-                    ("Sábado", "SABADO"),
-                    ("Domingo", "DOMINGO")  # ✅ AGREGADO DOMINGO
-                ]
-                
-                # Primera fila de días
-                cols = st.columns(4)
-                for i, (dia_nombre, dia_key) in enumerate(dias_semana[:4]):
-                    with cols[i]:
-                        horario_key = f"HORARIO_{dia_key}"
-                        valor_actual = config.get(horario_key, "09:00-18:00")
-                        nuevo_valor = st.text_input(
-                            dia_nombre,
-                            value=valor_actual,
-                            placeholder="09:00-18:00",
-                            help=f"Horario para {dia_nombre}"
-                        )
-                        config[horario_key] = nuevo_valor
-                
-                # Segunda fila de días
-                cols = st.columns(4)
-                for i, (dia_nombre, dia_key) in enumerate(dias_semana[4:]):
-                    with cols[i]:
-                        horario_key = f"HORARIO_{dia_key}"
-                        valor_actual = config.get(horario_key, "09:00-14:00")
-                        nuevo_valor = st.text_input(
-                            dia_nombre,
-                            value=valor_actual,
-                            placeholder="09:00-14:00",
-                            help=f"Horario para {dia_nombre}"
-                        )
-                        config[horario_key] = nuevo_valor
-                
-                st.subheader("⏱️ Configuración de Citas")
-                duracion = st.number_input(
-                    "Duración de cada cita (minutos)", 
-                    value=int(config.get("DURACION_CITA", "30")), 
-                    min_value=15, 
-                    max_value=120, 
-                    step=5
-                )
-                config["DURACION_CITA"] = str(duracion)
-                
-                st.subheader("📅 Días No Laborables")
-                dias_no_laborables = st.text_area(
-                    "Fechas no laborables (separar por comas)",
-                    value=config.get("DIAS_NO_LABORABLES", ""),
-                    placeholder="2024-12-25, 2024-01-01, 2024-04-02",
-                    help="Formato: AAAA-MM-DD, separados por comas"
-                )
-                config["DIAS_NO_LABORABLES"] = dias_no_laborables
-                
-                submitted = st.form_submit_button("💾 Guardar Configuración", type="primary", use_container_width=True)
-                
-                if submitted:
-                    try:
-                        if gsheets_manager.update_configuracion(config):
-                            st.success("✅ Configuración guardada correctamente")
-                            st.rerun()
-                        else:
-                            st.error("❌ Error al guardar la configuración")
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
-                        
-        except Exception as e:
-            st.error(f"❌ Error al cargar configuración: {str(e)}")
+    # Solo se ejecuta la sección visible; las más pesadas son fragmentos que
+    # se vuelven a ejecutar solos cuando se usan sus filtros y botones
+    seccion = st.segmented_control(
+        "Sección",
+        list(SECCIONES),
+        default=next(iter(SECCIONES)),
+        key="seccion_admin",
+        label_visibility="collapsed"
+    )
+    st.markdown("---")
+    SECCIONES[seccion or next(iter(SECCIONES))]()
 
 if __name__ == "__main__":
-    main()
+    # Tiempo de cada ejecución de la página, visible en el panel de diagnóstico
+    with medir_pagina("panel_administrador"):
+        main()
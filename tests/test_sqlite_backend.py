@@ -0,0 +1,45 @@
+"""SQLiteBackend con IDs repetidos o que no son números, como los que puede tener la hoja"""
+import sqlite3
+
+from utils.storage import COLUMNAS_CITAS, SQLiteBackend
+
+
+def cita(cita_id, cliente, fecha="2026-03-02", hora="10:00"):
+    valores = {"ID": cita_id, "Cliente": cliente, "Fecha_Cita": fecha, "Hora_Cita": hora, "Estado": "Agendada"}
+    return {columna: valores.get(columna, "") for columna in COLUMNAS_CITAS}
+
+
+def test_reemplazar_conserva_ids_repetidos_y_no_numericos(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "citas.db"))
+    backend.reemplazar_citas([
+        cita(7, "Ana", hora="10:00"),
+        cita(7, "Beto", hora="11:00"),
+        cita("A-12", "Carla"),
+        cita("", "Sin ID"),
+    ])
+    
+    citas = backend.leer_citas()
+    assert [(c["ID"], c["Cliente"]) for c in citas] == [("7", "Ana"), ("7", "Beto"), ("A-12", "Carla")]
+    assert sorted(backend.horas_ocupadas("2026-03-02")) == ["10:00", "10:00", "11:00"]
+
+
+def test_eliminar_con_id_repetido_borra_solo_la_fila_que_coincide(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "citas.db"))
+    backend.reemplazar_citas([cita(7, "Ana", fecha="2025-01-10"), cita(7, "Beto", fecha="2026-03-02")])
+    
+    assert backend.eliminar_citas([cita("7", "Ana", fecha="2025-01-10")]) == 1
+    assert [c["Cliente"] for c in backend.leer_citas()] == ["Beto"]
+
+
+def test_migra_bases_con_id_entero_como_clave(tmp_path):
+    ruta = str(tmp_path / "citas.db")
+    conn = sqlite3.connect(ruta)
+    columnas = ", ".join(f'"{c}" TEXT' for c in COLUMNAS_CITAS[1:])
+    conn.execute(f'CREATE TABLE citas ("ID" INTEGER PRIMARY KEY, {columnas})')
+    conn.execute('INSERT INTO citas ("ID", "Cliente") VALUES (3, \'Ana\')')
+    conn.commit()
+    conn.close()
+    
+    backend = SQLiteBackend(ruta)
+    backend.agregar_citas([[cita(3, "Beto")[columna] for columna in COLUMNAS_CITAS]])
+    assert [(str(c["ID"]), c["Cliente"]) for c in backend.leer_citas()] == [("3", "Ana"), ("3", "Beto")]
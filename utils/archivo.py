@@ -0,0 +1,159 @@
+"""Archivo histórico de citas, particionado por mes
+
+Las citas completadas o canceladas más viejas que un horizonte se mueven de
+la hoja Citas a un archivo por mes (una hoja "Archivo_AAAA-MM" en el mismo
+Spreadsheet, o un Parquet local "citas_AAAA-MM.parquet"). Así la hoja Citas
+solo tiene citas recientes y futuras, y cada refresco descarga menos filas.
+El historial se lee mes a mes y solo cuando alguien lo pide.
+"""
+import os
+import re
+from abc import ABC, abstractmethod
+
+import gspread
+import pandas as pd
+
+from utils.storage import COLUMNAS_CITAS, _clave
+
+# Solo se archivan citas que ya no van a cambiar
+ESTADOS_ARCHIVABLES = ("Completada", "Cancelada")
+
+_MES = re.compile(r"^\d{4}-\d{2}$")
+
+
+def mes_de(fecha_str):
+    """Mes "AAAA-MM" de una fecha "AAAA-MM-DD" """
+    return str(fecha_str)[:7]
+
+
+class ArchivoCitas(ABC):
+    """Interfaz común de los archivos por mes"""
+    
+    @abstractmethod
+    def meses(self):
+        """Meses archivados ("AAAA-MM"), de más antiguo a más reciente"""
+    
+    @abstractmethod
+    def leer_mes(self, mes):
+        """Citas archivadas de un mes como DataFrame (vacío si no hay)"""
+    
+    @abstractmethod
+    def guardar_mes(self, mes, citas):
+        """Agrega al mes las citas cuyo ID no esté ya archivado; devuelve cuántas agregó"""
+    
+    def guardar(self, citas):
+        """Reparte las citas (diccionarios) por mes de Fecha_Cita y las guarda"""
+        por_mes = {}
+        for cita in citas:
+            por_mes.setdefault(mes_de(cita.get("Fecha_Cita", "")), []).append(cita)
+        return sum(self.guardar_mes(mes, grupo) for mes, grupo in sorted(por_mes.items()))
+
+
+class ArchivoHojas(ArchivoCitas):
+    """Una hoja "Archivo_AAAA-MM" por mes en el mismo Spreadsheet que Citas"""
+    
+    PREFIJO = "Archivo_"
+    
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        # Hojas existentes mientras dura un guardar(), para no buscarlas una a una
+        self._hojas = None
+    
+    def guardar(self, citas):
+        self._hojas = {hoja.title: hoja for hoja in self.spreadsheet.worksheets()}
+        try:
+            return super().guardar(citas)
+        finally:
+            self._hojas = None
+    
+    def _hoja(self, mes):
+        titulo = self.PREFIJO + mes
+        if self._hojas is not None:
+            return self._hojas.get(titulo)
+        try:
+            return self.spreadsheet.worksheet(titulo)
+        except gspread.WorksheetNotFound:
+            return None
+    
+    def meses(self):
+        titulos = [hoja.title for hoja in self.spreadsheet.worksheets()]
+        return sorted(t[len(self.PREFIJO):] for t in titulos
+                      if t.startswith(self.PREFIJO) and _MES.match(t[len(self.PREFIJO):]))
+    
+    def leer_mes(self, mes):
+        hoja = self._hoja(mes)
+        return pd.DataFrame(hoja.get_all_records()) if hoja is not None else pd.DataFrame()
+    
+    def guardar_mes(self, mes, citas):
+        filas = [[cita.get(columna, "") for columna in COLUMNAS_CITAS] for cita in citas]
+        hoja = self._hoja(mes)
+        if hoja is None:
+            # Hoja nueva: encabezados y filas en una sola escritura
+            hoja = self.spreadsheet.add_worksheet(
+                title=self.PREFIJO + mes, rows=str(len(filas) + 1), cols=str(len(COLUMNAS_CITAS))
+            )
+            hoja.update(range_name="A1", values=[COLUMNAS_CITAS] + filas)
+            return len(filas)
+        
+        # Si un archivado anterior se cortó a medias, sus citas ya pueden estar aquí
+        archivados = {_clave(valor) for valor in hoja.col_values(COLUMNAS_CITAS.index("ID") + 1)[1:]}
+        nuevas = [fila for fila in filas if _clave(fila[0]) not in archivados]
+        if nuevas:
+            hoja.append_rows(nuevas)
+        return len(nuevas)
+
+
+class ArchivoParquet(ArchivoCitas):
+    """Un archivo Parquet por mes en un directorio local"""
+    
+    def __init__(self, directorio="archivo"):
+        self.directorio = directorio
+    
+    def _ruta(self, mes):
+        return os.path.join(self.directorio, f"citas_{mes}.parquet")
+    
+    def meses(self):
+        if not os.path.isdir(self.directorio):
+            return []
+        nombres = [n[len("citas_"):-len(".parquet")] for n in os.listdir(self.directorio)
+                   if n.startswith("citas_") and n.endswith(".parquet")]
+        return sorted(mes for mes in nombres if _MES.match(mes))
+    
+    def leer_mes(self, mes):
+        ruta = self._ruta(mes)
+        if not os.path.exists(ruta):
+            return pd.DataFrame()
+        return pd.read_parquet(ruta)
+    
+    def guardar_mes(self, mes, citas):
+        # Como en la hoja, todo se guarda como texto; los tipos se aplican al leer
+        nuevas = pd.DataFrame(
+            [[str(cita.get(columna, "")) for columna in COLUMNAS_CITAS] for cita in citas],
+            columns=COLUMNAS_CITAS
+        )
+        previas = self.leer_mes(mes)
+        if not previas.empty:
+            nuevas = nuevas[~nuevas["ID"].map(_clave).isin(set(previas["ID"].map(_clave)))]
+            if nuevas.empty:
+                return 0
+            mes_completo = pd.concat([previas, nuevas], ignore_index=True)
+        else:
+            mes_completo = nuevas
+        
+        # Escritura atómica: un corte a mitad no deja el mes corrupto
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = f"{self._ruta(mes)}.tmp"
+        mes_completo.to_parquet(temporal, index=False)
+        os.replace(temporal, self._ruta(mes))
+        return len(nuevas)
+
+
+def crear_archivo(ajustes, spreadsheet=None):
+    """Archivo según [almacenamiento] de secrets.toml: archivo = "hojas" o "parquet"
+    
+    Por defecto se usan hojas si hay un Spreadsheet y Parquet si el backend es local.
+    """
+    tipo = ajustes.get("archivo", "hojas" if spreadsheet is not None else "parquet")
+    if tipo == "hojas" and spreadsheet is not None:
+        return ArchivoHojas(spreadsheet)
+    return ArchivoParquet(ajustes.get("ruta_archivo", "archivo"))
@@ -0,0 +1,156 @@
+"""Cache de un valor con refresco en segundo plano (stale-while-revalidate)
+
+Las instancias viven en el proceso de Streamlit y las comparten todas las
+sesiones: las cargas concurrentes de un mismo valor se unen a la que ya está
+en curso (single-flight) en lugar de lanzar otra petición.
+"""
+import threading
+import time as time_mod
+import weakref
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+# Todas las caches del proceso, para reportar sus estadísticas
+_REGISTRO = weakref.WeakSet()
+
+
+def estadisticas_caches():
+    """Estadísticas de todas las caches vivas del proceso, por nombre"""
+    return {cache.nombre: cache.resumen() for cache in list(_REGISTRO)}
+
+
+class CacheSWR:
+    """Guarda el resultado de `cargar` y lo refresca sin bloquear a quien lo lee
+    
+    - Edad menor que `ttl`: se devuelve el valor en cache.
+    - Edad menor que `max_obsolescencia`: se devuelve el valor viejo y se
+      lanza un refresco en un hilo de fondo.
+    - Sin valor o más viejo que `max_obsolescencia`: se espera la carga como
+      máximo `timeout` segundos; si no termina a tiempo se devuelve el valor
+      viejo, o se lanza TimeoutError si no hay ninguno.
+    
+    Nunca hay más de una carga en curso: quien necesita esperar se une a la
+    carga pendiente. `resumen()` cuenta aciertos, lecturas obsoletas, fallos,
+    lecturas unidas a una carga en curso, cargas y errores.
+    """
+    
+    def __init__(self, cargar, ttl=300, max_obsolescencia=1800, timeout=15, nombre="cache"):
+        self.cargar = cargar
+        self.ttl = ttl
+        self.max_obsolescencia = max(max_obsolescencia, ttl)
+        self.timeout = timeout
+        self.nombre = nombre
+        self._lock = threading.Lock()
+        self._valor = None
+        self._momento = None
+        self._refresco = None
+        # Se incrementa al invalidar, para descartar cargas iniciadas antes
+        self._generacion = 0
+        self._contadores = Counter()
+        _REGISTRO.add(self)
+    
+    @property
+    def valor(self):
+        """Valor actual sin disparar cargas (None si nunca se cargó)"""
+        return self._valor
+    
+    def edad(self):
+        """Segundos desde la última carga (infinito si no hay valor o si se expiró)"""
+        if self._valor is None or self._momento is None:
+            return float("inf")
+        return time_mod.monotonic() - self._momento
+    
+    def obtener(self):
+        """Devuelve el valor según la política descrita en la clase"""
+        with self._lock:
+            edad = self.edad()
+            if edad < self.ttl:
+                self._contadores["aciertos"] += 1
+                return self._valor
+            if self._valor is not None and edad < self.max_obsolescencia:
+                self._contadores["obsoletos"] += 1
+                self._lanzar_refresco()
+                return self._valor
+            self._contadores["fallos"] += 1
+            futuro = self._lanzar_refresco()
+        
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if self._valor is not None:
+                print(f"⚠️ {self.nombre}: la recarga tardó más de {self.timeout}s, se usan datos anteriores")
+                return self._valor
+            raise TimeoutError(f"{self.nombre}: la carga tardó más de {self.timeout}s")
+    
+    def _lanzar_refresco(self):
+        """Devuelve la carga en curso o inicia una nueva (llamar con el lock tomado)"""
+        if self._refresco is None or self._refresco.done():
+            self._refresco = self._lanzar_carga()
+        else:
+            self._contadores["compartidas"] += 1
+        return self._refresco
+    
+    def _lanzar_carga(self):
+        """Ejecuta `cargar` en un hilo y devuelve un Future con su resultado"""
+        futuro = Future()
+        generacion = self._generacion
+        self._contadores["cargas"] += 1
+        
+        def trabajo():
+            try:
+                valor = self.cargar()
+            except Exception as e:
+                print(f"❌ {self.nombre}: error al recargar: {e}")
+                with self._lock:
+                    self._contadores["errores"] += 1
+                futuro.set_exception(e)
+                return
+            with self._lock:
+                if generacion == self._generacion:
+                    self._valor = valor
+                    self._momento = time_mod.monotonic()
+            futuro.set_result(valor)
+        
+        threading.Thread(target=trabajo, name=f"carga-{self.nombre}", daemon=True).start()
+        return futuro
+    
+    def poner(self, valor):
+        """Guarda un valor recién obtenido (por ejemplo, tras una escritura propia)"""
+        with self._lock:
+            self._valor = valor
+            self._momento = time_mod.monotonic()
+    
+    def expirar(self):
+        """Marca el valor como vencido; se conserva para servirlo mientras se refresca"""
+        with self._lock:
+            if self._momento is not None:
+                self._momento = min(self._momento, time_mod.monotonic() - self.ttl)
+    
+    def invalidar(self):
+        """Descarta el valor; la próxima lectura espera una carga completa"""
+        with self._lock:
+            self._valor = None
+            self._momento = None
+            self._refresco = None
+            self._generacion += 1
+    
+    def resumen(self):
+        """Contadores de uso y edad del valor actual"""
+        with self._lock:
+            datos = {clave: self._contadores[clave]
+                     for clave in ("aciertos", "obsoletos", "fallos", "compartidas", "cargas", "errores")}
+            edad = self.edad()
+            datos["edad_segundos"] = None if edad == float("inf") else round(edad, 1)
+            datos["carga_en_curso"] = self._refresco is not None and not self._refresco.done()
+            return datos
+    
+    def esperar_refresco(self, timeout=None):
+        """Espera a que termine el refresco de fondo en curso, si lo hay"""
+        refresco = self._refresco
+        if refresco is not None:
+            try:
+                refresco.result(timeout=timeout)
+            except Exception:
+                pass
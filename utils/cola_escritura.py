@@ -0,0 +1,231 @@
+"""Cola de escritura diferida (write-behind) para cambios de estado de citas
+
+Los cambios se anotan primero en un diario en disco (JSON por línea) y se
+devuelven de inmediato; un hilo los envía al almacenamiento en lotes,
+fusionando los cambios de una misma cita, y reintenta con espera creciente si
+falla. Si la app se reinicia con cambios pendientes, se recuperan del diario
+al crear la cola y se envían con reanudar() o con el primer cambio nuevo.
+"""
+import json
+import os
+import threading
+import time as time_mod
+
+
+class ColaEscritura:
+    """Cambios (cita_id, cambios, fila) pendientes de guardar, con un hilo que los vacía
+    
+    `escribir_lote` recibe una lista de (cita_id, cambios, fila) y devuelve los
+    IDs que se guardaron; si lanza una excepción el lote se reintenta. Los IDs
+    que no devuelve (p. ej. citas que ya no existen) se descartan.
+    """
+    
+    def __init__(self, escribir_lote, ruta_diario=None, espera_lote=0.3,
+                 reintento_inicial=1.0, reintento_maximo=60.0, nombre="cola"):
+        self.escribir_lote = escribir_lote
+        self.ruta_diario = ruta_diario
+        self.espera_lote = espera_lote
+        self.reintento_inicial = reintento_inicial
+        self.reintento_maximo = reintento_maximo
+        self.nombre = nombre
+        
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Event()
+        self._vacia = threading.Condition(self._lock)
+        # cita_id -> [cambios, fila, secuencia, momento en que se encoló]
+        self._pendientes = {}
+        self._secuencia = 0
+        self._hilo = None
+        
+        self._lotes = 0
+        self._escritas = 0
+        self._descartadas = 0
+        self._errores = 0
+        self._ultima_latencia = None
+        self._latencia_total = 0.0
+        self._ultimo_error = None
+        
+        self._recuperar_diario()
+    
+    # -- API pública --
+    
+    def encolar(self, cita_id, cambios, fila=None):
+        """Anota el cambio en el diario y lo deja pendiente de envío"""
+        self.encolar_lote([(cita_id, cambios, fila)])
+    
+    def encolar_lote(self, cambios):
+        """Como encolar, para varios (cita_id, cambios, fila) a la vez
+        
+        Se anotan en el diario con una sola escritura y quedan pendientes
+        juntos, así el hilo los envía en el mismo lote.
+        """
+        cambios = [(str(cita_id), datos, fila) for cita_id, datos, fila in cambios]
+        with self._lock:
+            self._anotar([{"id": cita_id, "cambios": datos} for cita_id, datos, _ in cambios])
+            for cita_id, datos, fila in cambios:
+                self._fusionar(cita_id, datos, fila)
+        self._asegurar_hilo()
+        self._hay_trabajo.set()
+    
+    def reanudar(self):
+        """Empieza a enviar los cambios recuperados del diario, si hay"""
+        with self._lock:
+            hay_pendientes = bool(self._pendientes)
+        if hay_pendientes:
+            self._asegurar_hilo()
+            self._hay_trabajo.set()
+    
+    def pendientes(self):
+        """Copia de los cambios aún no guardados: lista de (cita_id, cambios)"""
+        with self._lock:
+            return [(cita_id, dict(datos[0])) for cita_id, datos in self._pendientes.items()]
+    
+    def vaciar(self, timeout=None):
+        """Espera a que no quede nada pendiente; devuelve False si vence el timeout"""
+        self.reanudar()
+        limite = None if timeout is None else time_mod.monotonic() + timeout
+        with self._lock:
+            while self._pendientes:
+                restante = None if limite is None else limite - time_mod.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._vacia.wait(restante)
+            return True
+    
+    def estadisticas(self):
+        """Profundidad de la cola, lotes enviados y latencia de los envíos"""
+        with self._lock:
+            ahora = time_mod.monotonic()
+            mas_antiguo = min((datos[3] for datos in self._pendientes.values()), default=None)
+            return {
+                "pendientes": len(self._pendientes),
+                "espera_mas_antigua_s": None if mas_antiguo is None else round(ahora - mas_antiguo, 2),
+                "lotes": self._lotes,
+                "escritas": self._escritas,
+                "descartadas": self._descartadas,
+                "errores": self._errores,
+                "ultima_latencia_ms": None if self._ultima_latencia is None else round(self._ultima_latencia * 1000, 1),
+                "latencia_media_ms": round(self._latencia_total / self._lotes * 1000, 1) if self._lotes else None,
+                "ultimo_error": self._ultimo_error,
+            }
+    
+    # -- internos --
+    
+    def _fusionar(self, cita_id, cambios, fila):
+        """Suma el cambio al pendiente de la misma cita (llamar con el lock tomado)"""
+        self._secuencia += 1
+        if cita_id in self._pendientes:
+            datos = self._pendientes[cita_id]
+            datos[0] = {**datos[0], **cambios}
+            datos[1] = fila if fila is not None else datos[1]
+            datos[2] = self._secuencia
+        else:
+            self._pendientes[cita_id] = [dict(cambios), fila, self._secuencia, time_mod.monotonic()]
+    
+    def _asegurar_hilo(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._trabajar, name=f"escritura-{self.nombre}", daemon=True)
+                self._hilo.start()
+    
+    def _trabajar(self):
+        espera = self.reintento_inicial
+        while True:
+            self._hay_trabajo.wait()
+            # Pequeña espera para juntar en un lote los cambios que llegan seguidos
+            time_mod.sleep(self.espera_lote)
+            self._hay_trabajo.clear()
+            
+            with self._lock:
+                lote = {cita_id: list(datos) for cita_id, datos in self._pendientes.items()}
+            if not lote:
+                continue
+            
+            inicio = time_mod.monotonic()
+            try:
+                guardadas = set(map(str, self.escribir_lote(
+                    [(cita_id, datos[0], datos[1]) for cita_id, datos in lote.items()]
+                )))
+            except Exception as e:
+                print(f"❌ {self.nombre}: error al guardar {len(lote)} cambios, se reintenta en {espera:g}s: {e}")
+                with self._lock:
+                    self._errores += 1
+                    self._ultimo_error = str(e)
+                time_mod.sleep(espera)
+                espera = min(espera * 2, self.reintento_maximo)
+                self._hay_trabajo.set()
+                continue
+            
+            espera = self.reintento_inicial
+            latencia = time_mod.monotonic() - inicio
+            with self._lock:
+                self._lotes += 1
+                self._ultima_latencia = latencia
+                self._latencia_total += latencia
+                for cita_id, datos in lote.items():
+                    if cita_id not in guardadas:
+                        print(f"⚠️ {self.nombre}: se descarta el cambio de la cita {cita_id} (no encontrada)")
+                        self._descartadas += 1
+                    else:
+                        self._escritas += 1
+                    # Si llegó otro cambio mientras se guardaba, sigue pendiente
+                    if self._pendientes.get(cita_id, [None, None, None])[2] == datos[2]:
+                        del self._pendientes[cita_id]
+                self._compactar_diario()
+                if self._pendientes:
+                    self._hay_trabajo.set()
+                else:
+                    self._vacia.notify_all()
+    
+    # -- diario en disco --
+    
+    def _anotar(self, entradas):
+        """Agrega una línea por entrada al diario, con un solo fsync (llamar con el lock tomado)"""
+        if not self.ruta_diario:
+            return
+        try:
+            with open(self.ruta_diario, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entrada, ensure_ascii=False, default=str) + "\n" for entrada in entradas))
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print(f"⚠️ {self.nombre}: no se pudo escribir el diario {self.ruta_diario}: {e}")
+    
+    def _compactar_diario(self):
+        """Reescribe el diario solo con lo pendiente (llamar con el lock tomado)"""
+        if not self.ruta_diario:
+            return
+        try:
+            if not self._pendientes:
+                if os.path.exists(self.ruta_diario):
+                    os.remove(self.ruta_diario)
+                return
+            temporal = f"{self.ruta_diario}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                for cita_id, datos in self._pendientes.items():
+                    f.write(json.dumps({"id": cita_id, "cambios": datos[0]}, ensure_ascii=False, default=str) + "\n")
+            os.replace(temporal, self.ruta_diario)
+        except OSError as e:
+            print(f"⚠️ {self.nombre}: no se pudo compactar el diario {self.ruta_diario}: {e}")
+    
+    def _recuperar_diario(self):
+        """Carga los cambios que quedaron sin guardar en una ejecución anterior"""
+        if not self.ruta_diario or not os.path.exists(self.ruta_diario):
+            return
+        try:
+            with open(self.ruta_diario, encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except ValueError:
+                        # Última línea a medias si la app se cortó mientras escribía
+                        continue
+                    # La fila no se guarda: tras reiniciar puede haber cambiado y se busca por ID
+                    self._fusionar(str(entrada["id"]), entrada.get("cambios", {}), None)
+        except OSError as e:
+            print(f"⚠️ {self.nombre}: no se pudo leer el diario {self.ruta_diario}: {e}")
+            return
+        if self._pendientes:
+            # El hilo no arranca aquí: la cola se crea al importar la app y enviar
+            # abriría la conexión; ver reanudar()
+            print(f"✅ {self.nombre}: {len(self._pendientes)} cambios pendientes recuperados del diario")
@@ -0,0 +1,260 @@
+"""Acceso a Google Sheets respetando la cuota de la API
+
+Google limita las peticiones por minuto (por defecto 60 lecturas y 60
+escrituras por usuario). ClienteCuota reparte ese presupuesto con dos cubetas
+de fichas (token bucket), da prioridad a las escrituras y reintenta los
+errores 429 y 5xx con espera exponencial y jitter. HojaConCuota envuelve un
+Spreadsheet o Worksheet de gspread para que todas sus llamadas pasen por él.
+"""
+import random
+import threading
+import time as time_mod
+from collections import Counter
+
+import requests
+from gspread.exceptions import APIError
+
+from utils.metricas import API, FILAS_API, metricas
+
+LECTURA = "lectura"
+ESCRITURA = "escritura"
+
+# Métodos de gspread que hacen una petición, según el tipo de cuota que consumen
+METODOS_LECTURA = {
+    "get_all_records", "get_all_values", "get", "batch_get", "col_values",
+    "row_values", "find", "findall", "acell", "cell", "worksheet", "worksheets",
+}
+METODOS_ESCRITURA = {
+    "update", "batch_update", "append_row", "append_rows", "update_cell",
+    "update_cells", "clear", "batch_clear", "delete_rows", "insert_row",
+    "insert_rows", "resize", "add_worksheet", "del_worksheet",
+}
+
+# Códigos que indican saturación o un fallo pasajero del servidor
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Si fallan con un 5xx o se corta la conexión pudieron haberse aplicado igual:
+# repetirlas duplicaría filas, así que solo se reintentan ante un 429
+METODOS_NO_IDEMPOTENTES = {"append_row", "append_rows", "insert_row", "insert_rows", "add_worksheet"}
+
+
+class CuotaAgotada(Exception):
+    """No se pudo hacer la petición dentro del tiempo de espera por falta de cuota"""
+
+
+def codigo_http(error):
+    """Código HTTP de un error de gspread/requests (None si no lo tiene)"""
+    respuesta = getattr(error, "response", None)
+    codigo = getattr(respuesta, "status_code", None)
+    if codigo is None:
+        codigo = getattr(error, "code", None)
+    return codigo if isinstance(codigo, int) else None
+
+
+def filas_transferidas(metodo, args, kwargs, resultado):
+    """Filas que leyó o escribió una petición de gspread (0 si no aplica)"""
+    try:
+        if metodo in ("append_row", "insert_row", "update_cell", "row_values", "acell", "cell", "find"):
+            return 0 if resultado is None else 1
+        if metodo in ("append_rows", "insert_rows"):
+            return len(kwargs.get("values", args[0] if args else []))
+        if metodo == "update":
+            valores = kwargs.get("values", args[0] if args else [])
+            if isinstance(valores, str):
+                # Orden antiguo update(range_name, values)
+                valores = args[1] if len(args) > 1 else []
+            return len(valores) if isinstance(valores, list) else 1
+        if metodo == "batch_update":
+            return sum(len(bloque.get("values", [])) for bloque in (args[0] if args else kwargs.get("data", [])))
+        if metodo == "batch_get":
+            return sum(len(bloque) for bloque in resultado)
+        if metodo in ("get_all_records", "get_all_values", "get", "col_values", "findall"):
+            return len(resultado)
+    except (TypeError, AttributeError, IndexError):
+        pass
+    return 0
+
+
+class CubetaFichas:
+    """Token bucket: `capacidad` fichas que se reponen a razón de `por_segundo`"""
+    
+    def __init__(self, capacidad, por_segundo):
+        self.capacidad = float(capacidad)
+        self.por_segundo = float(por_segundo)
+        self.fichas = float(capacidad)
+        self._momento = time_mod.monotonic()
+    
+    def reponer(self, ahora):
+        self.fichas = min(self.capacidad, self.fichas + (ahora - self._momento) * self.por_segundo)
+        self._momento = ahora
+    
+    def espera_para_una(self):
+        """Segundos hasta que haya al menos una ficha"""
+        return 0.0 if self.fichas >= 1 else (1 - self.fichas) / self.por_segundo
+
+
+class ClienteCuota:
+    """Ejecuta llamadas a la API dentro de la cuota, con reintentos y contadores por método
+    
+    - Cada llamada toma una ficha de la cubeta de lecturas o de escrituras.
+    - Mientras haya una escritura esperando ficha, las lecturas esperan: una
+      reserva o un cambio de estado no queda detrás de un refresco de cache.
+    - Un 429 pausa a todas las llamadas durante la espera de reintento.
+    - Si en `espera_maxima` segundos no hay ficha se lanza CuotaAgotada.
+    """
+    
+    def __init__(self, lecturas_por_minuto=60, escrituras_por_minuto=60, espera_maxima=20,
+                 max_reintentos=5, espera_base=1.0, espera_tope=32.0):
+        self.espera_maxima = espera_maxima
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.espera_tope = espera_tope
+        self._cubetas = {
+            LECTURA: CubetaFichas(lecturas_por_minuto, lecturas_por_minuto / 60),
+            ESCRITURA: CubetaFichas(escrituras_por_minuto, escrituras_por_minuto / 60),
+        }
+        self._condicion = threading.Condition()
+        self._escrituras_esperando = 0
+        self._pausa_hasta = 0.0
+        self._contadores = {}
+    
+    @classmethod
+    def desde_ajustes(cls, ajustes):
+        """Crea el cliente con la sección [almacenamiento] de secrets.toml"""
+        return cls(
+            lecturas_por_minuto=int(ajustes.get("cuota_lecturas_por_minuto", 60)),
+            escrituras_por_minuto=int(ajustes.get("cuota_escrituras_por_minuto", 60)),
+            espera_maxima=float(ajustes.get("espera_maxima_cuota", 20)),
+            max_reintentos=int(ajustes.get("max_reintentos", 5)),
+        )
+    
+    # -- fichas --
+    
+    def _tomar(self, tipo):
+        """Espera una ficha del tipo dado; lanza CuotaAgotada si no llega a tiempo"""
+        limite = time_mod.monotonic() + self.espera_maxima
+        with self._condicion:
+            if tipo == ESCRITURA:
+                self._escrituras_esperando += 1
+            try:
+                while True:
+                    ahora = time_mod.monotonic()
+                    cubeta = self._cubetas[tipo]
+                    cubeta.reponer(ahora)
+                    cediendo = tipo == LECTURA and self._escrituras_esperando > 0
+                    espera = max(self._pausa_hasta - ahora, cubeta.espera_para_una())
+                    if espera <= 0 and not cediendo:
+                        cubeta.fichas -= 1
+                        return ahora
+                    if ahora >= limite:
+                        raise CuotaAgotada(
+                            "Google Sheets está recibiendo demasiadas peticiones; intenta de nuevo en unos segundos"
+                        )
+                    self._condicion.wait(min(max(espera, 0.01), limite - ahora))
+            finally:
+                if tipo == ESCRITURA:
+                    self._escrituras_esperando -= 1
+                    self._condicion.notify_all()
+    
+    def _pausar(self, segundos):
+        """Detiene todas las llamadas `segundos` (tras un 429)"""
+        with self._condicion:
+            self._pausa_hasta = max(self._pausa_hasta, time_mod.monotonic() + segundos)
+    
+    def _espera_reintento(self, intento):
+        """Espera exponencial con jitter completo: entre 0 y base * 2^intento (con tope)"""
+        return random.uniform(0, min(self.espera_tope, self.espera_base * 2 ** intento))
+    
+    # -- llamadas --
+    
+    def llamar(self, metodo, funcion, *args, **kwargs):
+        """Ejecuta `funcion` (el método `metodo` de gspread) respetando la cuota
+        
+        La duración total (espera de cuota y reintentos incluidos) y las filas
+        transferidas se anotan en el registro de métricas.
+        """
+        with metricas.medir(API, metodo=metodo):
+            resultado = self._llamar(metodo, funcion, *args, **kwargs)
+        filas = filas_transferidas(metodo, args, kwargs, resultado)
+        if filas:
+            sentido = "escritas" if metodo in METODOS_ESCRITURA else "leidas"
+            metricas.contar(FILAS_API, filas, metodo=metodo, sentido=sentido)
+        return resultado
+    
+    def _llamar(self, metodo, funcion, *args, **kwargs):
+        tipo = ESCRITURA if metodo in METODOS_ESCRITURA else LECTURA
+        for intento in range(self.max_reintentos + 1):
+            inicio = time_mod.monotonic()
+            try:
+                self._tomar(tipo)
+            except CuotaAgotada:
+                self._contar(metodo, "sin_cuota")
+                raise
+            self._contar(metodo, "espera_ms", int((time_mod.monotonic() - inicio) * 1000))
+            
+            try:
+                resultado = funcion(*args, **kwargs)
+            except (APIError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                codigo = codigo_http(e)
+                if metodo in METODOS_NO_IDEMPOTENTES:
+                    reintentable = codigo == 429
+                else:
+                    reintentable = codigo in CODIGOS_REINTENTABLES or not isinstance(e, APIError)
+                if not reintentable or intento == self.max_reintentos:
+                    self._contar(metodo, "errores")
+                    raise
+                espera = self._espera_reintento(intento)
+                self._contar(metodo, "limitadas" if codigo == 429 else "reintentos")
+                print(f"⚠️ {metodo}: error {codigo or type(e).__name__}, reintento {intento + 1} en {espera:.1f}s")
+                if codigo == 429:
+                    self._pausar(espera)
+                time_mod.sleep(espera)
+                continue
+            except Exception:
+                self._contar(metodo, "errores")
+                raise
+            self._contar(metodo, "llamadas")
+            return resultado
+    
+    def _contar(self, metodo, clave, cantidad=1):
+        with self._condicion:
+            self._contadores.setdefault(metodo, Counter())[clave] += cantidad
+    
+    def estadisticas(self):
+        """Contadores por método de gspread y fichas disponibles en cada cubeta"""
+        with self._condicion:
+            ahora = time_mod.monotonic()
+            for cubeta in self._cubetas.values():
+                cubeta.reponer(ahora)
+            return {
+                "por_metodo": {metodo: dict(contador) for metodo, contador in self._contadores.items()},
+                "fichas": {tipo: round(cubeta.fichas, 1) for tipo, cubeta in self._cubetas.items()},
+                "pausa_restante_s": round(max(0.0, self._pausa_hasta - ahora), 1),
+            }
+
+
+class HojaConCuota:
+    """Envuelve un Spreadsheet o Worksheet de gspread: sus peticiones pasan por ClienteCuota
+    
+    Las hojas que devuelven worksheet() y add_worksheet() también se envuelven;
+    el resto de atributos (title, id, ...) se leen tal cual.
+    """
+    
+    def __init__(self, objeto, cliente):
+        self._objeto = objeto
+        self._cliente = cliente
+    
+    def __getattr__(self, nombre):
+        atributo = getattr(self._objeto, nombre)
+        if nombre not in METODOS_LECTURA and nombre not in METODOS_ESCRITURA:
+            return atributo
+        
+        def llamada(*args, **kwargs):
+            resultado = self._cliente.llamar(nombre, atributo, *args, **kwargs)
+            if nombre in ("worksheet", "add_worksheet"):
+                return HojaConCuota(resultado, self._cliente)
+            if nombre == "worksheets":
+                return [HojaConCuota(hoja, self._cliente) for hoja in resultado]
+            return resultado
+        
+        return llamada
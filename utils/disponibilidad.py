@@ -0,0 +1,214 @@
+"""Disponibilidad por barbero como mapa de ocupación minuto a minuto
+
+Cada fecha se representa con una matriz booleana de numpy con una fila por
+barbero y una columna por minuto del día: `bloqueado[b, m]` es True si el
+barbero b no puede atender en el minuto m (fuera de su horario, en un
+descanso, en un día no laborable o con una cita, que ocupa toda la duración
+de su servicio). Con la suma acumulada de esa matriz, saber si la ventana
+[inicio, inicio + duración) de un barbero está libre es una resta, y se
+evalúan a la vez todos los inicios del día y todos los barberos: "¿hay algún
+barbero libre a las 10:00 para un tinte?" es una columna del resultado y
+"¿qué horas tiene libres Carlos?" es una fila.
+
+Las citas sin barbero (anteriores a la columna Barbero, o de un barbero que
+ya no está en BARBEROS) ocupan un sillón cualquiera: se descuentan de los
+sillones libres durante su ventana.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.horarios import MINUTOS_DIA, etiquetas_de_minutos, hora_a_minutos
+from utils.storage import _clave
+
+
+class MatrizOcupacion:
+    """Ocupación de una fecha: `recursos` (barberos) × minutos del día
+    
+    `inicios` son los horarios que se ofrecen (cada DURACION_CITA minutos
+    desde la primera apertura), `duracion` la duración por defecto y
+    `etiquetas` la tabla minuto -> "HH:MM" del horario.
+    """
+    
+    def __init__(self, recursos, inicios, bloqueado, sin_asignar, citas, duracion, etiquetas=None):
+        self.recursos = tuple(recursos)
+        self.etiquetas = etiquetas if etiquetas is not None else etiquetas_de_minutos()
+        self.inicios = inicios
+        self.bloqueado = bloqueado
+        self.sin_asignar = sin_asignar
+        self.citas = citas
+        self.duracion = duracion
+        # acumulado[b, m] = minutos bloqueados del barbero b antes del minuto m
+        self._acumulado = np.zeros((len(self.recursos), MINUTOS_DIA + 1), dtype=np.int32)
+        np.cumsum(bloqueado, axis=1, out=self._acumulado[:, 1:])
+        self._fila = {recurso: i for i, recurso in enumerate(self.recursos)}
+    
+    def _libres_en(self, inicios, duracion):
+        """(barberos libres, hay sillón) para ventanas de `duracion` minutos desde cada inicio
+        
+        La primera es una matriz (barberos, inicios); la segunda una máscara
+        por inicio que ya descuenta las citas sin barbero.
+        """
+        inicios = np.asarray(inicios, dtype=np.int32)
+        fines = inicios + duracion
+        dentro = (inicios >= 0) & (fines <= MINUTOS_DIA)
+        inicios_c = np.clip(inicios, 0, MINUTOS_DIA)
+        fines_c = np.clip(fines, 0, MINUTOS_DIA)
+        libres = ((self._acumulado[:, fines_c] - self._acumulado[:, inicios_c]) == 0) & dentro
+        
+        if self.sin_asignar.any():
+            # Máximo de citas sin barbero superpuestas dentro de cada ventana
+            relleno = np.concatenate([self.sin_asignar, np.zeros(duracion, dtype=self.sin_asignar.dtype)])
+            sin_barbero = sliding_window_view(relleno, duracion)[inicios_c].max(axis=1)
+        else:
+            sin_barbero = 0
+        return libres, libres.sum(axis=0) > sin_barbero
+    
+    def disponibles(self, barbero=None, duracion=None):
+        """Máscara de `inicios` en que algún barbero (o `barbero`) tiene libre toda la ventana"""
+        libres, hay_sillon = self._libres_en(self.inicios, duracion or self.duracion)
+        if not barbero:
+            return hay_sillon
+        fila = self._fila.get(barbero)
+        if fila is None:
+            return np.zeros(len(self.inicios), dtype=bool)
+        return libres[fila] & hay_sillon
+    
+    def horas_libres(self, barbero=None, duracion=None):
+        """Inicios disponibles como textos "HH:MM" """
+        return self.etiquetas[self.inicios[self.disponibles(barbero, duracion)]].tolist()
+    
+    def esta_libre(self, minutos, barbero=None, duracion=None):
+        """True si una cita que empieza en `minutos` cabe entera (con `barbero`, o con alguno)"""
+        libres, hay_sillon = self._libres_en([minutos], duracion or self.duracion)
+        if not hay_sillon[0]:
+            return False
+        if not barbero:
+            return True
+        fila = self._fila.get(barbero)
+        return fila is not None and bool(libres[fila, 0])
+    
+    def elegir_barbero(self, minutos, duracion=None):
+        """Barbero con la ventana libre y menos citas en el día (None si no hay ninguno)"""
+        libres, hay_sillon = self._libres_en([minutos], duracion or self.duracion)
+        if not hay_sillon[0]:
+            return None
+        carga = np.where(libres[:, 0], self.citas, np.iinfo(np.int32).max)
+        return self.recursos[int(np.argmin(carga))]
+
+
+def matriz_de(horario, fecha, reservas):
+    """Construye la MatrizOcupacion de `fecha`
+    
+    `horario` es un HorarioCompilado y `reservas` las tripletas (barbero,
+    minutos, servicio) de las citas de esa fecha.
+    """
+    barberos, comienzos, servicios = zip(*reservas) if reservas else ((), (), ())
+    ocupacion = _ocupacion(horario, [fecha], ([0] * len(comienzos), barberos, comienzos, servicios))
+    bloqueado, sin_asignar, citas, ofrecidos = ocupacion
+    return MatrizOcupacion(horario.recursos, np.flatnonzero(ofrecidos[0]).astype(np.int32),
+                           bloqueado[0], sin_asignar[0], citas[0], horario.duracion, horario.etiquetas)
+
+
+def libres_por_fecha(horario, fechas, reservas, barbero=None, duracion=None, primer_inicio=None):
+    """Horarios libres y ofrecidos de cada fecha de `fechas`, calculados en una sola pasada
+    
+    `reservas` son cuatro secuencias paralelas (posición de la fecha en
+    `fechas`, barbero, minutos, servicio). Devuelve dos arreglos con una
+    posición por fecha: cuántos inicios están libres para una cita de
+    `duracion` minutos (con `barbero`, o con alguno) y cuántos se ofrecen.
+    `primer_inicio` (un minuto por fecha) descarta como libres los inicios
+    anteriores, p. ej. los que ya pasaron hoy.
+    """
+    duracion = duracion or horario.duracion
+    bloqueado, sin_asignar, _, ofrecidos = _ocupacion(horario, fechas, reservas)
+    
+    # acumulado[d, b, m] = minutos bloqueados antes del minuto m; una resta por ventana
+    acumulado = np.zeros(bloqueado.shape[:2] + (MINUTOS_DIA + 1,), dtype=np.int32)
+    np.cumsum(bloqueado, axis=2, out=acumulado[:, :, 1:])
+    inicios = np.arange(MINUTOS_DIA)
+    fines = np.minimum(inicios + duracion, MINUTOS_DIA)
+    libres = ((acumulado[:, :, fines] - acumulado[:, :, inicios]) == 0) & (inicios + duracion <= MINUTOS_DIA)
+    
+    if sin_asignar.any():
+        relleno = np.concatenate([sin_asignar, np.zeros((len(fechas), duracion), dtype=sin_asignar.dtype)], axis=1)
+        sin_barbero = sliding_window_view(relleno, duracion, axis=1)[:, :MINUTOS_DIA].max(axis=2)
+    else:
+        sin_barbero = 0
+    disponibles = (libres.sum(axis=1) > sin_barbero) & ofrecidos
+    if primer_inicio is not None:
+        disponibles &= inicios >= np.asarray(primer_inicio)[:, None]
+    if barbero:
+        if barbero not in horario.recursos:
+            return np.zeros(len(fechas), dtype=np.int64), ofrecidos.sum(axis=1)
+        disponibles &= libres[:, horario.recursos.index(barbero)]
+    return disponibles.sum(axis=1), ofrecidos.sum(axis=1)
+
+
+def _ocupacion(horario, fechas, reservas):
+    """Minutos bloqueados de cada barbero en cada fecha
+    
+    Devuelve (bloqueado, sin_asignar, citas, ofrecidos):
+    - bloqueado (fechas, barberos, minutos): fuera de horario, en descanso o con una cita
+    - sin_asignar (fechas, minutos): citas sin barbero en curso en cada minuto
+    - citas (fechas, barberos): citas de cada barbero en el día
+    - ofrecidos (fechas, minutos): minutos en que empieza un horario que se
+      ofrece (cada DURACION_CITA desde la primera apertura del día)
+    """
+    recursos = horario.recursos
+    # Horario, descansos y excepciones ya compilados: una búsqueda por fecha
+    bloqueado, ofrecidos = horario.mascaras(fechas)
+    
+    sin_asignar = np.zeros((len(fechas), MINUTOS_DIA), dtype=np.int32)
+    citas = np.zeros((len(fechas), len(recursos)), dtype=np.int32)
+    posiciones, barberos, comienzos, servicios = reservas
+    if len(comienzos):
+        posiciones = np.asarray(posiciones, dtype=np.int32)
+        comienzos = np.asarray(comienzos, dtype=np.int32)
+        # Barberos y servicios se traducen una vez por valor distinto, no por cita
+        nombres, cual = np.unique(np.asarray(servicios, dtype=str), return_inverse=True)
+        duraciones = np.array([horario.duracion_de(nombre) for nombre in nombres], dtype=np.int32)[cual]
+        if horario.barberos:
+            nombres, cual = np.unique(np.char.strip(np.asarray(barberos, dtype=str)), return_inverse=True)
+            indice = {recurso: i for i, recurso in enumerate(recursos)}
+            filas = np.array([indice.get(nombre, -1) for nombre in nombres], dtype=np.int32)[cual]
+        else:
+            # Un solo sillón: todas las citas lo ocupan, tengan o no barbero
+            filas = np.zeros(len(comienzos), dtype=np.int32)
+        validas = (comienzos >= 0) & (comienzos < MINUTOS_DIA) & (posiciones >= 0) & (posiciones < len(fechas))
+        finales = np.minimum(comienzos + duraciones, MINUTOS_DIA)
+        
+        # Diferencias +1 al empezar y -1 al terminar cada cita; la suma acumulada
+        # da cuántas citas hay en cada minuto
+        asignadas = validas & (filas >= 0)
+        diferencias = np.zeros((len(fechas), len(recursos), MINUTOS_DIA + 1), dtype=np.int32)
+        np.add.at(diferencias, (posiciones[asignadas], filas[asignadas], comienzos[asignadas]), 1)
+        np.add.at(diferencias, (posiciones[asignadas], filas[asignadas], finales[asignadas]), -1)
+        bloqueado |= np.cumsum(diferencias, axis=2)[:, :, :MINUTOS_DIA] > 0
+        np.add.at(citas, (posiciones[asignadas], filas[asignadas]), 1)
+        
+        sueltas = validas & (filas < 0)
+        diferencias = np.zeros((len(fechas), MINUTOS_DIA + 1), dtype=np.int32)
+        np.add.at(diferencias, (posiciones[sueltas], comienzos[sueltas]), 1)
+        np.add.at(diferencias, (posiciones[sueltas], finales[sueltas]), -1)
+        sin_asignar = np.cumsum(diferencias, axis=1)[:, :MINUTOS_DIA]
+    
+    return bloqueado, sin_asignar, citas, ofrecidos
+
+
+def se_solapan(horario, cita, otra):
+    """True si dos citas (diccionarios con Fecha_Cita, Hora_Cita, Servicio y Barbero) chocan
+    
+    Chocan si son del mismo día y barbero (o si hay un solo sillón) y sus
+    ventanas [hora, hora + duración del servicio) se superponen.
+    """
+    if _clave(cita.get("Fecha_Cita", "")) != _clave(otra.get("Fecha_Cita", "")):
+        return False
+    if horario.barberos and str(cita.get("Barbero", "")).strip() != str(otra.get("Barbero", "")).strip():
+        return False
+    try:
+        inicio, otro_inicio = hora_a_minutos(str(cita.get("Hora_Cita", ""))), hora_a_minutos(str(otra.get("Hora_Cita", "")))
+    except ValueError:
+        return _clave(cita.get("Hora_Cita", "")) == _clave(otra.get("Hora_Cita", ""))
+    fin = inicio + horario.duracion_de(str(cita.get("Servicio", "")))
+    otro_fin = otro_inicio + horario.duracion_de(str(otra.get("Servicio", "")))
+    return inicio < otro_fin and otro_inicio < fin
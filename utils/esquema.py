@@ -0,0 +1,128 @@
+"""Tipos del DataFrame de citas
+
+La hoja guarda todo como texto. Al cargarla, las columnas que se filtran y
+agrupan se convierten a tipos compactos para que las comparaciones sean
+numéricas y vectorizadas:
+
+- ID: entero (Int32; <NA> si en la hoja no es un número)
+- Fecha_Cita: datetime64 (NaT si no es una fecha AAAA-MM-DD)
+- Hora_Cita: minutos desde medianoche en int16 (SIN_HORA si no es HH:MM)
+- Estado, Servicio y Barbero: categóricas
+
+Las páginas usan `para_mostrar` antes de pintar o exportar citas.
+"""
+import pandas as pd
+
+from utils.horarios import hora_a_minutos
+
+ESTADOS = ["Agendada", "En Progreso", "Completada", "Cancelada"]
+SERVICIOS = ["Corte de cabello", "Afeitado", "Corte y barba", "Tinte", "Peinado", "Otro"]
+
+# Minutos que ocupa cada servicio si Horarios_Config no dice otra cosa
+DURACION_SERVICIOS = {
+    "Corte de cabello": 30, "Afeitado": 30, "Corte y barba": 45,
+    "Tinte": 90, "Peinado": 30, "Otro": 30,
+}
+
+# Categorías conocidas de cada columna; los valores nuevos se agregan al final
+CATEGORIAS = {"Estado": ESTADOS, "Servicio": SERVICIOS, "Barbero": []}
+
+# Valor de Hora_Cita cuando la hoja tiene una hora vacía o inválida
+SIN_HORA = -1
+
+
+def tipar_citas(df):
+    """Convierte las columnas de citas a sus tipos compactos (no modifica `df`)
+    
+    Es idempotente: las columnas que ya tienen su tipo se dejan igual, así
+    puede aplicarse de nuevo tras un concat que mezcló categorías.
+    """
+    if df.empty:
+        return df
+    # Basta una copia superficial: se reemplazan columnas enteras, no se escriben valores
+    df = df.copy(deep=False)
+    if "ID" in df.columns and df["ID"].dtype != "Int32":
+        df["ID"] = _enteros(df["ID"])
+    if "Fecha_Cita" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["Fecha_Cita"]):
+        df["Fecha_Cita"] = pd.to_datetime(_textos(df["Fecha_Cita"]), format="%Y-%m-%d", errors="coerce")
+    if "Hora_Cita" in df.columns and df["Hora_Cita"].dtype != "int16":
+        df["Hora_Cita"] = minutos_de(df["Hora_Cita"])
+    for columna, base in CATEGORIAS.items():
+        if columna in df.columns:
+            df[columna] = _categorica(df[columna], base)
+    return df
+
+
+def para_mostrar(df):
+    """Copia de `df` con fecha y hora como texto AAAA-MM-DD / HH:MM, para tablas y exportaciones"""
+    if df.empty:
+        return df
+    df = df.copy()
+    if "Fecha_Cita" in df.columns and pd.api.types.is_datetime64_any_dtype(df["Fecha_Cita"]):
+        df["Fecha_Cita"] = df["Fecha_Cita"].dt.strftime("%Y-%m-%d").fillna("")
+    if "Hora_Cita" in df.columns and df["Hora_Cita"].dtype == "int16":
+        df["Hora_Cita"] = horas_de(df["Hora_Cita"])
+    return df
+
+
+def minutos_de(serie):
+    """Serie de textos "HH:MM" -> minutos desde medianoche (int16, SIN_HORA si no es válida)"""
+    partes = _textos(serie).str.extract(r"^(\d{1,2}):(\d{2})")
+    horas = pd.to_numeric(partes[0], errors="coerce")
+    minutos = pd.to_numeric(partes[1], errors="coerce")
+    validos = (horas <= 24) & (minutos < 60)
+    return (horas * 60 + minutos).where(validos, SIN_HORA).astype("int16")
+
+
+def horas_de(serie):
+    """Serie de minutos (int16) -> textos "HH:MM" ("" para SIN_HORA)"""
+    texto = (serie // 60).astype(str).str.zfill(2) + ":" + (serie % 60).astype(str).str.zfill(2)
+    return texto.where(serie != SIN_HORA, "")
+
+
+def mascara_id(df, cita_id):
+    """Filas de `df` cuyo ID es `cita_id` (acepta el ID como número o texto)"""
+    try:
+        numero = int(str(cita_id).strip())
+    except ValueError:
+        return pd.Series(False, index=df.index)
+    if df["ID"].dtype == "Int32":
+        return (df["ID"] == numero).fillna(False).astype(bool)
+    return df["ID"].astype(str).str.strip() == str(numero)
+
+
+def valor_tipado(columna, valor):
+    """Convierte un valor de la hoja al tipo de su columna (para asignarlo en el DataFrame)"""
+    if columna == "Fecha_Cita":
+        return pd.to_datetime(str(valor).strip(), format="%Y-%m-%d", errors="coerce")
+    if columna == "Hora_Cita":
+        try:
+            return hora_a_minutos(str(valor))
+        except ValueError:
+            return SIN_HORA
+    return valor
+
+
+def asignar(df, mascara, columna, valor):
+    """df.loc[mascara, columna] = valor respetando el tipo de la columna (modifica `df`)"""
+    valor = valor_tipado(columna, valor)
+    if isinstance(df[columna].dtype, pd.CategoricalDtype) and valor not in df[columna].cat.categories:
+        df[columna] = df[columna].cat.add_categories([valor])
+    df.loc[mascara, columna] = valor
+
+
+def _textos(serie):
+    return serie.astype(str).str.strip()
+
+
+def _enteros(serie):
+    numeros = pd.to_numeric(_textos(serie), errors="coerce")
+    return numeros.where(numeros == numeros.round()).astype("Int32")
+
+
+def _categorica(serie, base):
+    if isinstance(serie.dtype, pd.CategoricalDtype) and list(serie.cat.categories[:len(base)]) == base:
+        return serie
+    valores = serie.astype(object).where(serie.notna(), "").astype(str)
+    extras = sorted(set(valores.unique()) - set(base))
+    return pd.Series(pd.Categorical(valores, categories=base + extras), index=serie.index)
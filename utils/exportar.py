@@ -0,0 +1,195 @@
+"""Exportación de citas a CSV, Excel y Parquet
+
+Los archivos se escriben en disco por bloques de filas: ni el CSV ni el Excel
+se arman completos en memoria, y el historial archivado entra mes a mes. Cada
+archivo generado queda guardado con una clave (versión de los datos, filtros,
+formato); mientras los datos no cambien, pedir de nuevo la misma exportación
+devuelve el archivo ya hecho.
+
+Solo la generación es por bloques: st.download_button no transmite archivos,
+así que al descargar Streamlit carga el archivo terminado completo en memoria.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from utils.esquema import para_mostrar
+from utils.storage import COLUMNAS_CITAS
+
+# formato -> (tipo MIME, extensión)
+FORMATOS = {
+    "csv": ("text/csv", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+FILAS_POR_BLOQUE = 5000
+
+
+def normalizar_filtros(filtros):
+    """Filtros sin los valores que no filtran nada ("Todos", vacíos, None, False)"""
+    return {clave: valor for clave, valor in (filtros or {}).items()
+            if valor is not None and valor is not False and valor not in ("", "Todos")}
+
+
+def filtrar_citas(df, filtros):
+    """Citas de `df` (tipado) que cumplen `filtros`
+    
+    Claves reconocidas: fecha (un día), desde y hasta (rango de fechas,
+    incluidas), estado y cliente (parte del nombre, sin distinguir mayúsculas).
+    """
+    filtros = normalizar_filtros(filtros)
+    if df.empty:
+        return df
+    mascara = pd.Series(True, index=df.index)
+    if "Fecha_Cita" in df.columns:
+        if "fecha" in filtros:
+            mascara &= df["Fecha_Cita"] == pd.Timestamp(filtros["fecha"])
+        if "desde" in filtros:
+            mascara &= df["Fecha_Cita"] >= pd.Timestamp(filtros["desde"])
+        if "hasta" in filtros:
+            mascara &= df["Fecha_Cita"] <= pd.Timestamp(filtros["hasta"])
+    if "estado" in filtros and "Estado" in df.columns:
+        mascara &= df["Estado"] == filtros["estado"]
+    if "cliente" in filtros and "Cliente" in df.columns:
+        mascara &= df["Cliente"].astype(str).str.contains(filtros["cliente"], case=False, regex=False, na=False)
+    return df[mascara.fillna(False)]
+
+
+def mes_en_rango(mes, filtros):
+    """True si el mes "AAAA-MM" puede tener citas dentro del rango de fechas de `filtros`"""
+    filtros = normalizar_filtros(filtros)
+    desde = filtros.get("desde", filtros.get("fecha"))
+    hasta = filtros.get("hasta", filtros.get("fecha"))
+    return ((desde is None or mes >= f"{desde:%Y-%m}") and
+            (hasta is None or mes <= f"{hasta:%Y-%m}"))
+
+
+def _como_texto(df):
+    """Bloque con las columnas de la hoja Citas, todo como texto (igual que en la hoja)"""
+    df = para_mostrar(df).reindex(columns=COLUMNAS_CITAS)
+    return df.astype(object).where(df.notna(), "").astype(str)
+
+
+def _bloques_de_texto(partes):
+    """Divide cada DataFrame de `partes` en bloques de FILAS_POR_BLOQUE filas de texto"""
+    for parte in partes:
+        for inicio in range(0, len(parte), FILAS_POR_BLOQUE):
+            yield _como_texto(parte.iloc[inicio:inicio + FILAS_POR_BLOQUE])
+
+
+def escribir(formato, partes, ruta):
+    """Escribe en `ruta` las citas de `partes` (DataFrames tipados), bloque a bloque; devuelve las filas escritas"""
+    filas = 0
+    if formato == "csv":
+        with open(ruta, "w", encoding="utf-8", newline="") as f:
+            f.write(",".join(COLUMNAS_CITAS) + "\n")
+            for bloque in _bloques_de_texto(partes):
+                bloque.to_csv(f, header=False, index=False)
+                filas += len(bloque)
+    elif formato == "xlsx":
+        # constant_memory: cada fila se vuelca a disco en cuanto se escribe
+        libro = xlsxwriter.Workbook(ruta, {"constant_memory": True})
+        hoja = libro.add_worksheet("Citas")
+        hoja.write_row(0, 0, COLUMNAS_CITAS)
+        for bloque in _bloques_de_texto(partes):
+            for valores in bloque.itertuples(index=False):
+                filas += 1
+                hoja.write_row(filas, 0, valores)
+        libro.close()
+    elif formato == "parquet":
+        # Como en el archivo histórico, todo se guarda como texto
+        esquema = pa.schema([(columna, pa.string()) for columna in COLUMNAS_CITAS])
+        with pq.ParquetWriter(ruta, esquema) as escritor:
+            for bloque in _bloques_de_texto(partes):
+                escritor.write_table(pa.Table.from_pandas(bloque, schema=esquema, preserve_index=False))
+                filas += len(bloque)
+            if not filas:
+                escritor.write_table(esquema.empty_table())
+    else:
+        raise ValueError(f"Formato de exportación desconocido: {formato}")
+    return filas
+
+
+class CacheExportaciones:
+    """Archivos exportados en un directorio temporal, los `maximo` más recientes por clave
+    
+    Una misma clave se genera una sola vez aunque la pidan varias sesiones a la
+    vez; al pasar de `maximo` se borra el archivo usado hace más tiempo, pero
+    nunca uno usado en los últimos `retencion` segundos: otra sesión puede estar
+    por abrirlo para su descarga.
+    """
+    
+    def __init__(self, directorio=None, maximo=8, retencion=300):
+        self.directorio = directorio
+        self.maximo = maximo
+        self.retencion = retencion
+        self._archivos = OrderedDict()
+        self._usos = {}
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._generados = 0
+        self._aciertos = 0
+    
+    def obtener(self, clave, formato, partes):
+        """Ruta del archivo de `clave`; si no existe, lo escribe con las citas de `partes()`"""
+        with self._lock:
+            if clave in self._archivos and os.path.exists(self._archivos[clave]):
+                self._archivos.move_to_end(clave)
+                self._usos[clave] = time.monotonic()
+                self._aciertos += 1
+                return self._archivos[clave]
+            lock = self._locks.setdefault(clave, threading.Lock())
+        
+        with lock:
+            with self._lock:
+                ruta = self._archivos.get(clave)
+            if ruta is None or not os.path.exists(ruta):
+                ruta = self._ruta(clave, formato)
+                # Escritura atómica: nadie descarga un archivo a medio generar
+                temporal = f"{ruta}.tmp"
+                escribir(formato, partes(), temporal)
+                os.replace(temporal, ruta)
+                with self._lock:
+                    self._generados += 1
+            with self._lock:
+                self._archivos[clave] = ruta
+                self._archivos.move_to_end(clave)
+                self._usos[clave] = time.monotonic()
+                self._locks.pop(clave, None)
+                self._descartar_viejos()
+            return ruta
+    
+    def estadisticas(self):
+        with self._lock:
+            return {"archivos": len(self._archivos), "generados": self._generados, "aciertos": self._aciertos}
+    
+    def _ruta(self, clave, formato):
+        if self.directorio is None:
+            self.directorio = tempfile.mkdtemp(prefix="exportaciones_")
+        os.makedirs(self.directorio, exist_ok=True)
+        nombre = hashlib.sha1(repr(clave).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directorio, f"citas_{nombre}.{FORMATOS[formato][1]}")
+    
+    def _descartar_viejos(self):
+        """Borra los archivos que sobran y llevan `retencion` segundos sin usarse (llamar con el lock tomado)"""
+        limite = time.monotonic() - self.retencion
+        while len(self._archivos) > self.maximo:
+            # El más viejo va primero: si todavía está en uso, los demás también
+            clave, ruta = next(iter(self._archivos.items()))
+            if self._usos.get(clave, 0) > limite:
+                break
+            del self._archivos[clave]
+            self._usos.pop(clave, None)
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
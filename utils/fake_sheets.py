@@ -0,0 +1,383 @@
+"""Sustituto en memoria de gspread.Spreadsheet / gspread.Worksheet
+
+Permite medir y probar GoogleSheetsManager sin tocar la hoja real. Cada
+llamada que en gspread sería una petición HTTP queda registrada en
+EstadisticasAPI (llamadas por método, celdas y bytes transferidos) y puede
+sumar una latencia artificial o fallar con errores HTTP inyectados (p. ej.
+429 por cuota agotada).
+"""
+import functools
+import json
+import threading
+import time as time_mod
+from collections import Counter
+
+import gspread
+import requests
+from gspread.cell import Cell
+from gspread.utils import a1_range_to_grid_range, numericise_all, rowcol_to_a1
+
+
+class EstadisticasAPI:
+    """Contadores de uso de la API compartidos por todas las hojas de un spreadsheet"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+    
+    def reiniciar(self):
+        """Pone todos los contadores a cero"""
+        with self._lock:
+            self.llamadas = Counter()
+            self.errores = Counter()
+            self.celdas_leidas = 0
+            self.celdas_escritas = 0
+            self.bytes_leidos = 0
+            self.bytes_escritos = 0
+    
+    def registrar(self, metodo, leidas=None, escritas=None):
+        """Registra una petición y los valores leídos/escritos en ella"""
+        with self._lock:
+            self.llamadas[metodo] += 1
+            if leidas is not None:
+                self.celdas_leidas += sum(len(fila) for fila in leidas)
+                self.bytes_leidos += len(json.dumps(leidas, default=str))
+            if escritas is not None:
+                self.celdas_escritas += sum(len(fila) for fila in escritas)
+                self.bytes_escritos += len(json.dumps(escritas, default=str))
+    
+    def registrar_error(self, metodo, codigo):
+        """Registra una petición rechazada con el código HTTP dado"""
+        with self._lock:
+            self.errores[f"{metodo}:{codigo}"] += 1
+    
+    @property
+    def total_llamadas(self):
+        return sum(self.llamadas.values())
+    
+    def resumen(self):
+        """Foto de los contadores como diccionario"""
+        with self._lock:
+            return {
+                "llamadas": self.total_llamadas,
+                "por_metodo": dict(self.llamadas),
+                "errores": dict(self.errores),
+                "celdas_leidas": self.celdas_leidas,
+                "celdas_escritas": self.celdas_escritas,
+                "bytes": self.bytes_leidos + self.bytes_escritos,
+            }
+
+
+def _peticion(metodo):
+    """Marca un método como petición HTTP: pasa antes por _antes_de_llamada"""
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        self.spreadsheet._antes_de_llamada(metodo.__name__)
+        return metodo(self, *args, **kwargs)
+    return envoltura
+
+
+def _error_api(codigo):
+    """APIError de gspread con una respuesta HTTP simulada"""
+    respuesta = requests.Response()
+    respuesta.status_code = codigo
+    respuesta._content = json.dumps({"error": {
+        "code": codigo,
+        "message": "Quota exceeded" if codigo == 429 else "Backend Error",
+        "status": "RESOURCE_EXHAUSTED" if codigo == 429 else "UNAVAILABLE",
+    }}).encode()
+    return gspread.exceptions.APIError(respuesta)
+
+
+def _texto(valor):
+    """Sheets guarda y devuelve los valores como texto formateado"""
+    return "" if valor is None else str(valor)
+
+
+class FakeWorksheet:
+    """Hoja en memoria con la parte de la API de gspread.Worksheet que usa la app"""
+    
+    def __init__(self, spreadsheet, title, rows=1000, cols=26):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = spreadsheet._nuevo_id()
+        self.row_count = int(rows)
+        self.col_count = int(cols)
+        self._celdas = []
+    
+    # -- utilidades internas (no cuentan como llamadas a la API) --
+    
+    def _registrar(self, metodo, leidas=None, escritas=None):
+        self.spreadsheet.estadisticas.registrar(metodo, leidas, escritas)
+    
+    def _ultima_fila(self):
+        for i in range(len(self._celdas), 0, -1):
+            if any(v != "" for v in self._celdas[i - 1]):
+                return i
+        return 0
+    
+    def _asegurar_tamano(self, filas, cols):
+        while len(self._celdas) < filas:
+            self._celdas.append([])
+        self.row_count = max(self.row_count, filas)
+        self.col_count = max(self.col_count, cols)
+    
+    def _escribir(self, fila, col, valores):
+        """Escribe una matriz de valores con esquina superior izquierda en (fila, col)"""
+        valores = [[_texto(v) for v in f] for f in valores]
+        self._asegurar_tamano(fila + len(valores) - 1, col + max((len(f) for f in valores), default=0) - 1)
+        for i, valores_fila in enumerate(valores):
+            destino = self._celdas[fila - 1 + i]
+            fin = col - 1 + len(valores_fila)
+            if len(destino) < fin:
+                destino.extend([""] * (fin - len(destino)))
+            destino[col - 1:fin] = valores_fila
+        return valores
+    
+    def _rango(self, nombre):
+        """Convierte un rango A1 ("Citas!A2:M", "G5") en índices (fila0, fila1, col0, col1)"""
+        if "!" in nombre:
+            nombre = nombre.split("!", 1)[1]
+        grid = a1_range_to_grid_range(nombre)
+        return (
+            grid.get("startRowIndex", 0),
+            grid.get("endRowIndex", max(len(self._celdas), 1)),
+            grid.get("startColumnIndex", 0),
+            grid.get("endColumnIndex", self.col_count),
+        )
+    
+    def _leer(self, nombre):
+        f0, f1, c0, c1 = self._rango(nombre)
+        valores = [list(fila[c0:c1]) for fila in self._celdas[f0:f1]]
+        # Igual que la API: se recortan filas y columnas vacías del final
+        for fila in valores:
+            while fila and fila[-1] == "":
+                fila.pop()
+        while valores and not valores[-1]:
+            valores.pop()
+        return valores
+    
+    def _nombre_rango(self, fila, col, valores):
+        ancho = max((len(f) for f in valores), default=1)
+        inicio = rowcol_to_a1(fila, col)
+        fin = rowcol_to_a1(fila + len(valores) - 1, col + ancho - 1)
+        return f"{self.title}!{inicio}:{fin}"
+    
+    # -- API de gspread --
+    
+    @_peticion
+    def get_all_values(self, **kwargs):
+        valores = self._leer(f"A1:{rowcol_to_a1(max(len(self._celdas), 1), self.col_count)}")
+        self._registrar("get_all_values", leidas=valores)
+        return valores
+    
+    @_peticion
+    def get_all_records(self, head=1, **kwargs):
+        valores = self._leer(f"A1:{rowcol_to_a1(max(len(self._celdas), 1), self.col_count)}")
+        self._registrar("get_all_records", leidas=valores)
+        if len(valores) < head:
+            return []
+        encabezados = valores[head - 1]
+        registros = []
+        for fila in valores[head:]:
+            fila = numericise_all(fila + [""] * (len(encabezados) - len(fila)))
+            registros.append(dict(zip(encabezados, fila)))
+        return registros
+    
+    @_peticion
+    def get(self, range_name=None, **kwargs):
+        valores = self._leer(range_name) if range_name else self._leer("A1:ZZ")
+        self._registrar("get", leidas=valores)
+        return valores
+    
+    @_peticion
+    def batch_get(self, ranges, **kwargs):
+        resultado = [self._leer(r) for r in ranges]
+        self._registrar("batch_get", leidas=[fila for valores in resultado for fila in valores])
+        return resultado
+    
+    @_peticion
+    def col_values(self, col, **kwargs):
+        valores = [fila[col - 1] if len(fila) >= col else "" for fila in self._celdas]
+        while valores and valores[-1] == "":
+            valores.pop()
+        self._registrar("col_values", leidas=[valores])
+        return valores
+    
+    @_peticion
+    def row_values(self, row, **kwargs):
+        valores = list(self._celdas[row - 1]) if row <= len(self._celdas) else []
+        while valores and valores[-1] == "":
+            valores.pop()
+        self._registrar("row_values", leidas=[valores])
+        return valores
+    
+    @_peticion
+    def find(self, query, in_row=None, in_column=None, **kwargs):
+        self._registrar("find", leidas=self._celdas)
+        for i, fila in enumerate(self._celdas, start=1):
+            if in_row is not None and i != in_row:
+                continue
+            for j, valor in enumerate(fila, start=1):
+                if in_column is not None and j != in_column:
+                    continue
+                if valor == str(query):
+                    return Cell(i, j, valor)
+        return None
+    
+    @_peticion
+    def append_rows(self, values, **kwargs):
+        fila = self._ultima_fila() + 1
+        escritas = self._escribir(fila, 1, values)
+        self._registrar("append_rows", escritas=escritas)
+        return {"updates": {"updatedRange": self._nombre_rango(fila, 1, escritas),
+                            "updatedRows": len(escritas)}}
+    
+    @_peticion
+    def append_row(self, values, **kwargs):
+        fila = self._ultima_fila() + 1
+        escritas = self._escribir(fila, 1, [values])
+        self._registrar("append_row", escritas=escritas)
+        return {"updates": {"updatedRange": self._nombre_rango(fila, 1, escritas),
+                            "updatedRows": 1}}
+    
+    @_peticion
+    def update(self, values=None, range_name=None, **kwargs):
+        # gspread 6 acepta update(values, range_name); también se admite el orden antiguo
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        f0, _, c0, _ = self._rango(range_name or "A1")
+        escritas = self._escribir(f0 + 1, c0 + 1, values)
+        self._registrar("update", escritas=escritas)
+        return {"updatedRange": self._nombre_rango(f0 + 1, c0 + 1, escritas)}
+    
+    @_peticion
+    def batch_update(self, data, **kwargs):
+        escritas = []
+        for bloque in data:
+            f0, _, c0, _ = self._rango(bloque["range"])
+            escritas.extend(self._escribir(f0 + 1, c0 + 1, bloque["values"]))
+        self._registrar("batch_update", escritas=escritas)
+        return {"totalUpdatedCells": sum(len(f) for f in escritas)}
+    
+    @_peticion
+    def update_cell(self, row, col, value):
+        escritas = self._escribir(row, col, [[value]])
+        self._registrar("update_cell", escritas=escritas)
+        return {"updatedRange": self._nombre_rango(row, col, escritas)}
+    
+    @_peticion
+    def clear(self):
+        self._registrar("clear")
+        self._celdas = []
+        return {}
+    
+    @_peticion
+    def batch_clear(self, ranges):
+        for nombre in ranges:
+            f0, f1, c0, c1 = self._rango(nombre)
+            for fila in self._celdas[f0:f1]:
+                for c in range(c0, min(c1, len(fila))):
+                    fila[c] = ""
+        self._registrar("batch_clear")
+        return {}
+    
+    @_peticion
+    def delete_rows(self, start_index, end_index=None):
+        end_index = start_index if end_index is None else end_index
+        del self._celdas[start_index - 1:end_index]
+        self.row_count -= end_index - start_index + 1
+        self._registrar("delete_rows")
+        return {}
+    
+    @_peticion
+    def resize(self, rows=None, cols=None):
+        if rows is not None:
+            self.row_count = int(rows)
+            del self._celdas[self.row_count:]
+        if cols is not None:
+            self.col_count = int(cols)
+        self._registrar("resize")
+        return {}
+
+
+class FakeSpreadsheet:
+    """Spreadsheet en memoria con contadores de llamadas y latencia inyectable
+    
+    `latencia` son los segundos que se duerme en cada llamada, para simular
+    el viaje de ida y vuelta a Google. `inyectar_errores` hace que las
+    próximas llamadas fallen con un código HTTP antes de tocar los datos.
+    """
+    
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.estadisticas = EstadisticasAPI()
+        self._hojas = {}
+        self._ultimo_id = 0
+        self._lock_errores = threading.Lock()
+        self._errores_pendientes = []
+    
+    def inyectar_errores(self, cantidad=1, codigo=429, metodos=None):
+        """Las próximas `cantidad` llamadas (de `metodos`, o de cualquiera) fallan con `codigo`"""
+        with self._lock_errores:
+            self._errores_pendientes.extend([(codigo, set(metodos) if metodos else None)] * cantidad)
+    
+    def _antes_de_llamada(self, metodo):
+        """Punto común por el que pasa cada llamada antes de ejecutarse"""
+        if self.latencia:
+            time_mod.sleep(self.latencia)
+        with self._lock_errores:
+            for i, (codigo, metodos) in enumerate(self._errores_pendientes):
+                if metodos is None or metodo in metodos:
+                    del self._errores_pendientes[i]
+                    break
+            else:
+                return
+        self.estadisticas.registrar_error(metodo, codigo)
+        raise _error_api(codigo)
+    
+    def _registrar(self, metodo):
+        self._antes_de_llamada(metodo)
+        self.estadisticas.registrar(metodo)
+    
+    def _nuevo_id(self):
+        self._ultimo_id += 1
+        return self._ultimo_id
+    
+    def worksheet(self, title):
+        self._registrar("worksheet")
+        if title not in self._hojas:
+            raise gspread.WorksheetNotFound(title)
+        return self._hojas[title]
+    
+    def worksheets(self):
+        self._registrar("worksheets")
+        return list(self._hojas.values())
+    
+    def add_worksheet(self, title, rows, cols, **kwargs):
+        self._registrar("add_worksheet")
+        hoja = FakeWorksheet(self, title, rows, cols)
+        self._hojas[title] = hoja
+        return hoja
+    
+    def batch_update(self, body):
+        """spreadsheets.batchUpdate; solo se implementa deleteDimension de filas"""
+        self._registrar("batch_update")
+        hojas = {hoja.id: hoja for hoja in self._hojas.values()}
+        for peticion in body.get("requests", []):
+            rango = peticion["deleteDimension"]["range"]
+            hoja = hojas[rango["sheetId"]]
+            del hoja._celdas[rango["startIndex"]:rango["endIndex"]]
+            hoja.row_count -= rango["endIndex"] - rango["startIndex"]
+        return {"replies": [{} for _ in body.get("requests", [])]}
+    
+    def del_worksheet(self, worksheet):
+        self._registrar("del_worksheet")
+        self._hojas.pop(worksheet.title, None)
+    
+    def cargar(self, title, valores, cols=None):
+        """Crea (o reemplaza) una hoja con `valores` sin contar llamadas"""
+        hoja = FakeWorksheet(self, title, max(len(valores), 1), cols or max((len(f) for f in valores), default=1))
+        hoja._escribir(1, 1, valores)
+        self._hojas[title] = hoja
+        return hoja
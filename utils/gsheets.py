@@ -3,18 +3,248 @@ import pandas as pd
 from datetime import datetime, date, time, timedelta
 from google.oauth2.service_account import Credentials
 import streamlit as st
+import functools
+import itertools
 import json
+import os
+import threading
+import time as time_mod
+
+from utils.archivo import ESTADOS_ARCHIVABLES, crear_archivo
+from utils.cache import CacheSWR
+from utils.cola_escritura import ColaEscritura
+from utils.cuota import ClienteCuota, HojaConCuota
+from utils.disponibilidad import libres_por_fecha, matriz_de, se_solapan
+from utils.esquema import DURACION_SERVICIOS, SIN_HORA, asignar, mascara_id, para_mostrar, tipar_citas
+from utils.exportar import CacheExportaciones, filtrar_citas, mes_en_rango, normalizar_filtros
+from utils.horarios import DIAS_SEMANA, MINUTOS_DIA, HorarioCompilado, clave_config, clave_duracion, hora_a_minutos
+from utils.ids import GeneradorIds
+from utils.metricas import COLA, FICHAS, instrumentar, metricas
+from utils.storage import COLUMNAS_CITAS, ResultadoReserva, SheetsBackend, SQLiteBackend, WriteThroughBackend
+
+# Cada carga de la hoja es una generación nueva de la cache de citas
+_generaciones = itertools.count(1)
+
+
+class CitasEnCache:
+    """DataFrame de citas en cache junto con los índices derivados de él"""
+    
+    def __init__(self, df, version):
+        self.df = df
+        self.generacion = next(_generaciones)
+        # Último parche local (ver GoogleSheetsManager._parchear_cache) ya incluido en df
+        self.version = version
+        self.reindexar()
+    
+    def reindexar(self):
+        """Reconstruye los índices ID -> fila, fecha -> reservas (barbero, minutos, servicio) y fecha -> número de citas"""
+        df = self.df
+        if 'ID' in df.columns:
+            # El índice del DataFrame conserva la posición original del registro;
+            # la fila 1 de la hoja son los encabezados
+            validos = df['ID'].notna().to_numpy()
+            self.fila_por_id = dict(zip(df['ID'][validos].astype(str), (df.index[validos] + 2).tolist()))
+        else:
+            self.fila_por_id = {}
+        
+        if 'Fecha_Cita' in df.columns and 'Hora_Cita' in df.columns:
+            # Las claves son textos AAAA-MM-DD, como las fechas que se consultan;
+            # solo se formatean las combinaciones (fecha, hora, barbero, servicio) distintas
+            opcionales = [c for c in ('Barbero', 'Servicio') if c in df.columns]
+            reservas = df.loc[df['Hora_Cita'] != SIN_HORA, ['Fecha_Cita', 'Hora_Cita'] + opcionales]
+            reservas = reservas.dropna(subset=['Fecha_Cita']).drop_duplicates()
+            barberos, servicios = (
+                reservas[c].astype(str).str.strip().tolist() if c in reservas.columns else [""] * len(reservas)
+                for c in ('Barbero', 'Servicio')
+            )
+            reservas_por_fecha = {}
+            for fecha, minutos, barbero, servicio in zip(reservas['Fecha_Cita'].dt.strftime("%Y-%m-%d"),
+                                                         reservas['Hora_Cita'].tolist(), barberos, servicios):
+                reservas_por_fecha.setdefault(fecha, []).append((barbero, minutos, servicio))
+            self.reservas_por_fecha = reservas_por_fecha
+            conteo = df['Fecha_Cita'].value_counts(sort=False)
+            self.conteo_por_fecha = dict(zip(conteo.index.strftime("%Y-%m-%d"), conteo.tolist()))
+        else:
+            self.reservas_por_fecha = {}
+            self.conteo_por_fecha = {}
+
+# Directorio de la app (el de app.py): los archivos locales no dependen del directorio de trabajo
+DIRECTORIO_APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 class GoogleSheetsManager:
-    def __init__(self):
+    def __init__(self, backend=None, cuota=None, ajustes=None):
         self.client = None
         self.spreadsheet = None
-        self._cached_appointments = None
-        self._cache_time = None
-        self._initialize_client()
+        self._backend = backend
+        # `ajustes` reemplaza claves de la sección [almacenamiento] de secrets.toml
+        ajustes = {**self._leer_ajustes(), **(ajustes or {})}
+        self._ajustes = ajustes
+        
+        # La conexión se abre en el primer uso (ver la propiedad backend), no al importar
+        self._lock_conexion = threading.Lock()
+        self._ultimo_intento_conexion = None
+        self.reintento_conexion = float(ajustes.get("reintento_conexion", 30))
+        self._precalentamiento = None
+        
+        # Todas las peticiones a Google Sheets pasan por aquí (cuota, reintentos y contadores)
+        self.cuota = cuota or ClienteCuota.desde_ajustes(ajustes)
+        
+        # Citas y configuración se sirven desde cache; al vencer el TTL se devuelve la
+        # copia anterior mientras se refresca en segundo plano (stale-while-revalidate).
+        # Solo se espera a la red sin copia previa o si es más vieja que max_obsolescencia
+        max_obsolescencia = int(ajustes.get("max_obsolescencia", 1800))
+        timeout = float(ajustes.get("timeout_lectura", 15))
+        self._citas = CacheSWR(
+            self._cargar_citas,
+            ttl=int(ajustes.get("ttl_citas", 300)),
+            max_obsolescencia=max_obsolescencia,
+            timeout=timeout,
+            nombre="citas"
+        )
+        self._config = CacheSWR(
+            self._cargar_configuracion,
+            ttl=int(ajustes.get("ttl_configuracion", 300)),
+            max_obsolescencia=max_obsolescencia,
+            timeout=timeout,
+            nombre="configuración"
+        )
+        
+        # Cambios propios ya guardados que se aplican sobre la cache sin releer la hoja
+        self._lock_citas = threading.Lock()
+        self._parches = []
+        self._version_parches = 0
+        
+        # Refrescos incrementales seguidos antes de forzar una lectura completa
+        self.sync_completo_cada = 12
+        self._syncs_incrementales = 0
+        
+        # Un lock por fecha: dos reservas del mismo día en este proceso no se cruzan
+        self._locks_fecha = {}
+        self._lock_locks_fecha = threading.Lock()
+        
+        # Mayor ID entregado, en memoria y en un archivo auxiliar: reservar no recorre el historial
+        self._ids = GeneradorIds(
+            lambda: self._max_id(self._estado_citas().df),
+            ruta=ajustes.get("ruta_contador_ids", os.path.join(DIRECTORIO_APP, "contador_ids.txt"))
+        )
+        
+        # Archivo histórico por mes (ver utils/archivo.py); se crea en el primer uso.
+        # Archivar borra filas de Citas: cada archivado incrementa _epoca_filas y
+        # las filas anotadas en la cola antes de él dejan de usarse
+        self.dias_archivo = int(ajustes.get("dias_archivo", 90))
+        self._archivo = None
+        self._lock_archivado = threading.Lock()
+        self._epoca_filas = 0
+        self._historial = {}
+        self._meses_archivo = None
+        self._lock_historial = threading.Lock()
+        
+        # Exportaciones ya generadas, por versión de los datos y filtros (ver utils/exportar.py)
+        self._exportaciones = CacheExportaciones(
+            ajustes.get("directorio_exportaciones"), int(ajustes.get("max_exportaciones", 8))
+        )
+        
+        # Los cambios de estado del panel se guardan en segundo plano, en lotes
+        self._cola = ColaEscritura(
+            self._escribir_lote,
+            ruta_diario=ajustes.get("ruta_cola_escritura", "cola_escritura.jsonl"),
+            nombre="estados"
+        )
+        
+        # Las páginas llaman a precalentar() al arrancar; importar el módulo no conecta
+        self._precalentar = (self._backend is None and
+                             str(ajustes.get("precalentar", True)).lower() not in ("false", "0", "no"))
+    
+    @property
+    def backend(self):
+        """Backend de almacenamiento; la primera vez que se usa abre la conexión
+        
+        Devuelve None si no se pudo conectar. Tras un fallo se vuelve a intentar
+        como mucho cada `reintento_conexion` segundos.
+        """
+        if self._backend is None:
+            self.conectar()
+        return self._backend
+    
+    @property
+    def conectado(self):
+        """Indica si hay un backend de almacenamiento disponible"""
+        return self.backend is not None
+    
+    @property
+    def listo(self):
+        """True si la conexión ya está abierta (no la abre)"""
+        return self._backend is not None
     
-    def _initialize_client(self):
-        """Inicializa el cliente de Google Sheets"""
+    @property
+    def sin_conexion(self):
+        """True si el último intento de conexión falló y no hay citas en cache para mostrar
+        
+        No abre la conexión ni espera a un intento en curso: las páginas lo
+        consultan antes de pintar y sirven la cache mientras tanto.
+        """
+        return (self._backend is None and self._ultimo_intento_conexion is not None
+                and not self._lock_conexion.locked() and self._citas.valor is None)
+    
+    @instrumentar
+    def conectar(self):
+        """Abre la conexión si aún no está abierta; seguro con varias sesiones a la vez"""
+        with self._lock_conexion:
+            if self._backend is not None:
+                return True
+            ahora = time_mod.monotonic()
+            if self._ultimo_intento_conexion is not None and ahora - self._ultimo_intento_conexion < self.reintento_conexion:
+                return False
+            self._ultimo_intento_conexion = ahora
+            self._initialize_client(self._ajustes)
+            return self._backend is not None
+    
+    def precalentar(self):
+        """Conecta y carga configuración y citas en un hilo de fondo (una sola vez)
+        
+        No hace nada si el backend se pasó ya creado o con precalentar = false
+        en [almacenamiento]; devuelve el hilo o None.
+        """
+        if self._precalentamiento is not None or not self._precalentar:
+            return self._precalentamiento
+        
+        def trabajo():
+            try:
+                if self.conectar():
+                    # Los cambios que quedaron en el diario de una ejecución anterior
+                    self._cola.reanudar()
+                    self.get_horario()
+                    self._estado_citas()
+            except Exception as e:
+                print(f"❌ Error al precalentar la conexión: {e}")
+        
+        self._precalentamiento = threading.Thread(target=trabajo, name="precalentar-gsheets", daemon=True)
+        self._precalentamiento.start()
+        return self._precalentamiento
+    
+    def _leer_ajustes(self):
+        """Lee la sección [almacenamiento] de secrets.toml (vacía si no existe)"""
+        try:
+            if 'almacenamiento' in st.secrets:
+                return dict(st.secrets['almacenamiento'])
+        except Exception:
+            pass
+        return {}
+    
+    def _initialize_client(self, ajustes):
+        """Inicializa el cliente de Google Sheets y el backend de almacenamiento"""
+        # "sheets" (por defecto), "sqlite" o "sqlite+sheets" (SQLite como cache de escritura directa)
+        modo = ajustes.get("backend", "sheets")
+        ruta_sqlite = ajustes.get("ruta_sqlite", "citas.db")
+        
+        if modo == "sqlite":
+            try:
+                self._backend = SQLiteBackend(ruta_sqlite)
+                print(f"✅ Usando base de datos local {ruta_sqlite}")
+            except Exception as e:
+                print(f"❌ Error al abrir la base de datos local: {str(e)}")
+            return
+        
         try:
             scope = [
                 "https://spreadsheets.google.com/feeds",
@@ -34,135 +264,218 @@ class GoogleSheetsManager:
             
             # ABRIR LA HOJA DE CÁLCULO POR ID ESPECÍFICO
             spreadsheet_id = "17ww3br45_saSqSaTceLcoCMKTq4CzMOa1hgoGV2xZMM"
-            self.spreadsheet = self.client.open_by_key(spreadsheet_id)
-                
-            self._initialize_sheet_references()
+            self.spreadsheet = HojaConCuota(self.client.open_by_key(spreadsheet_id), self.cuota)
+            
+            sheets_backend = SheetsBackend(self.spreadsheet)
+            if modo == "sqlite+sheets":
+                self._backend = WriteThroughBackend(
+                    sheets_backend,
+                    SQLiteBackend(ruta_sqlite),
+                    ttl=int(ajustes.get("ttl_sqlite", 300)),
+                    max_obsolescencia=int(ajustes.get("max_obsolescencia", 1800)),
+                    timeout=float(ajustes.get("timeout_lectura", 15))
+                )
+            else:
+                self._backend = sheets_backend
             print("✅ Conectado a Google Sheets correctamente")
             
         except Exception as e:
             print(f"❌ Error al conectar con Google Sheets: {str(e)}")
             self.client = None
-    
-    def _initialize_sheet_references(self):
-        """Inicializa las referencias a las hojas existentes"""
-        try:
-            # Hoja de CITAS (ya existe en tu estructura)
-            self.citas_sheet = self.spreadsheet.worksheet("Citas")
-            
-            # Hoja de CONFIGURACIÓN de horarios (ya existe en tu estructura)
-            self.horarios_config_sheet = self.spreadsheet.worksheet("Horarios_Config")
-            
-        except gspread.WorksheetNotFound as e:
-            print(f"❌ No se encontró una hoja necesaria: {e}")
-            # Intentar crear las hojas si no existen
-            self._create_missing_sheets()
-    
-    def _create_missing_sheets(self):
-        """Crea las hojas necesarias si no existen"""
-        try:
-            # Verificar y crear hoja Citas si no existe
-            try:
-                self.citas_sheet = self.spreadsheet.worksheet("Citas")
-            except gspread.WorksheetNotFound:
-                self.citas_sheet = self.spreadsheet.add_worksheet(
-                    title="Citas", 
-                    rows="1000", 
-                    cols="13"
-                )
-                # Encabezados para citas (según tu estructura)
-                headers = [
-                    "ID", "Cliente", "Correo", "Teléfono", "Fecha_Cita", 
-                    "Hora_Cita", "Estado", "Hora_Inicio", "Hora_Fin", 
-                    "Servicio", "Notas", "Fecha_Creacion", "Ultima_Actualizacion"
-                ]
-                self.citas_sheet.append_row(headers)
-            
-            # Verificar y crear hoja Horarios_Config si no existe
-            try:
-                self.horarios_config_sheet = self.spreadsheet.worksheet("Horarios_Config")
-            except gspread.WorksheetNotFound:
-                self.horarios_config_sheet = self.spreadsheet.add_worksheet(
-                    title="Horarios_Config", 
-                    rows="50", 
-                    cols="3"
-                )
-                # Configuración por defecto INCLUYENDO DOMINGO
-                default_config = [
-                    ["Tipo", "Valor", "Descripcion"],
-                    ["HORARIO_LUNES", "09:00-18:00", "Horario para Lunes"],
-                    ["HORARIO_MARTES", "09:00-18:00", "Horario para Martes"],
-                    ["HORARIO_MIERCOLES", "09:00-18:00", "Horario para Miércoles"],
-                    ["HORARIO_JUEVES", "09:00-18:00", "Horario para Jueves"],
-                    ["HORARIO_VIERNES", "09:00-18:00", "Horario para Viernes"],
-                    ["HORARIO_SABADO", "09:00-18:00", "Horario para Sábado"],
-                    ["HORARIO_DOMINGO", "09:00-14:00", "Horario para Domingo"],  # ✅ DOMINGO INCLUIDO
-                    ["DURACION_CITA", "30", "Duración de cada cita en minutos"],
-                    ["DIAS_NO_LABORABLES", "", "Días festivos separados por comas"]
-                ]
-                for row in default_config:
-                    self.horarios_config_sheet.append_row(row)
-                    
-        except Exception as e:
-            print(f"❌ Error al crear hojas: {e}")
+            self._backend = None
     
     def clear_cache(self):
         """Limpia la cache de citas"""
-        self._cached_appointments = None
-        self._cache_time = None
+        self._citas.invalidar()
+        if self._backend is not None:
+            self._backend.invalidar()
+    
+    @property
+    def archivo(self):
+        """Archivo histórico: hojas por mes si hay Spreadsheet, Parquet local si no"""
+        if self._archivo is None:
+            self._archivo = crear_archivo(self._ajustes, self.backend.spreadsheet)
+        return self._archivo
+    
+    def get_api_stats(self):
+        """Llamadas, reintentos y errores por método de gspread y cuota disponible"""
+        return self.cuota.estadisticas()
+    
+    def get_write_queue_stats(self):
+        """Cambios de estado pendientes de guardar y latencia de los últimos envíos"""
+        return self._cola.estadisticas()
+    
+    @instrumentar
+    def flush_pending_writes(self, timeout=None):
+        """Espera a que se guarden los cambios pendientes; False si vence el timeout"""
+        return self._cola.vaciar(timeout)
+    
+    def get_metrics(self):
+        """Instantánea de métricas: latencias por método y página, filas, caches, cola y cuota"""
+        return {**metricas.instantanea(), "cola_escritura": self.get_write_queue_stats(), "api": self.get_api_stats()}
+    
+    def export_metrics_json(self):
+        """get_metrics() como texto JSON, para descargar"""
+        return json.dumps(self.get_metrics(), indent=2, ensure_ascii=False, default=str)
     
+    def export_metrics_prometheus(self):
+        """Métricas en el formato de texto de Prometheus"""
+        metricas.fijar(COLA, self.get_write_queue_stats()["pendientes"])
+        for tipo, fichas in self.get_api_stats()["fichas"].items():
+            metricas.fijar(FICHAS, fichas, tipo=tipo)
+        return metricas.prometheus()
+    
+    @instrumentar
     def get_all_appointments(self):
         """Obtiene todas las citas con cache"""
         try:
-            # Verificar cache (5 minutos)
-            if (self._cached_appointments is not None and 
-                self._cache_time and 
-                (datetime.now() - self._cache_time).seconds < 300):
-                return self._cached_appointments
-            
-            data = self.citas_sheet.get_all_records()
-            df = pd.DataFrame(data)
-            
-            # CORRECCIÓN: Manejar DataFrame vacío correctamente
-            if df.empty:
-                self._cached_appointments = pd.DataFrame()
-                self._cache_time = datetime.now()
-                return self._cached_appointments
-            
-            # Asegurar que las columnas de fecha sean strings
-            if 'Fecha_Cita' in df.columns:
-                df['Fecha_Cita'] = df['Fecha_Cita'].astype(str)
-            if 'Hora_Cita' in df.columns:
-                df['Hora_Cita'] = df['Hora_Cita'].astype(str)
-            
-            # Filtrar filas vacías (basado en ID o Cliente)
-            if 'ID' in df.columns:
-                df = df[df['ID'].astype(str).str.strip() != '']
-            elif 'Cliente' in df.columns:
-                df = df[df['Cliente'].astype(str).str.strip() != '']
-            
-            self._cached_appointments = df
-            self._cache_time = datetime.now()
-            
-            return df
-            
+            return self._estado_citas().df
         except Exception as e:
             print(f"Error en get_all_appointments: {e}")
             return pd.DataFrame()
     
+    def _estado_citas(self):
+        """Devuelve la cache de citas con todos los parches locales aplicados"""
+        estado = self._citas.obtener()
+        if estado.version < self._version_parches:
+            with self._lock_citas:
+                df = estado.df
+                cambia_indices = False
+                for version, parche, afecta_indices in self._parches:
+                    if version > estado.version:
+                        df = parche(df)
+                        cambia_indices = cambia_indices or afecta_indices
+                estado.df = df
+                estado.version = self._version_parches
+                if cambia_indices:
+                    estado.reindexar()
+        return estado
+    
+    def _parchear_cache(self, parche, afecta_indices=True):
+        """Registra un cambio propio ya guardado en el backend
+        
+        `parche` recibe el DataFrame de citas y devuelve el DataFrame modificado.
+        Se aplica sobre la cache actual y también sobre la que traiga un refresco
+        en curso, así ningún cambio propio se pierde por una recarga concurrente.
+        `afecta_indices` es False si no cambia ID, fecha ni hora de ninguna cita.
+        """
+        with self._lock_citas:
+            self._version_parches += 1
+            self._parches.append((self._version_parches, parche, afecta_indices))
+            del self._parches[:-100]
+    
+    @instrumentar
+    def _cargar_citas(self):
+        """Descarga las citas: solo los cambios si ya hay una copia, o la hoja completa"""
+        anterior = self._citas.valor
+        
+        # Sincronización incremental: solo se descargan filas nuevas o modificadas.
+        # Cada sync_completo_cada refrescos se hace una lectura completa por si hubo
+        # ediciones manuales que no tocaron Ultima_Actualizacion o que cambiaron
+        # citas viejas, que los refrescos incrementales no revisan
+        if anterior is not None and self._syncs_incrementales < self.sync_completo_cada:
+            # _estado_citas modifica df y version juntos bajo el lock: se toman juntos
+            # para que la copia nueva vuelva a aplicar justo los parches que le faltan
+            with self._lock_citas:
+                df_anterior, version_anterior = anterior.df, anterior.version
+            cambios = self.backend.leer_cambios()
+            if cambios is not None:
+                self._syncs_incrementales += 1
+                # IDs creados por otra instancia de la app o a mano en la hoja
+                for _, cita in cambios:
+                    self._ids.observar(cita.get('ID'))
+                return CitasEnCache(self._fusionar_cambios(df_anterior, cambios), version_anterior)
+        
+        # Los parches registrados hasta aquí ya están en la hoja que se va a leer,
+        # salvo los cambios que siguen en la cola de escritura: se vuelven a aplicar
+        version = self._version_parches
+        pendientes = self._cola.pendientes()
+        data = self.backend.leer_citas()
+        self._syncs_incrementales = 0
+        df = self._normalizar_citas(pd.DataFrame(data))
+        df = self._aplicar_lote(df, pendientes)
+        self._ids.observar(self._max_id(df))
+        return CitasEnCache(df, version)
+    
+    def _normalizar_citas(self, df):
+        """Descarta filas vacías y aplica los tipos compactos (ver utils/esquema.py)"""
+        # CORRECCIÓN: Manejar DataFrame vacío correctamente
+        if df.empty:
+            return pd.DataFrame()
+        
+        # Filtrar filas vacías (basado en ID o Cliente).
+        # El índice conserva la posición de cada cita en la hoja
+        if 'ID' in df.columns:
+            df = df[df['ID'].astype(str).str.strip() != '']
+        elif 'Cliente' in df.columns:
+            df = df[df['Cliente'].astype(str).str.strip() != '']
+        
+        return tipar_citas(df)
+    
+    def _fusionar_cambios(self, df, cambios):
+        """Fusiona en `df` las citas (posición, cita) nuevas o modificadas"""
+        if not cambios:
+            return df
+        
+        posiciones = [pos for pos, _ in cambios]
+        delta = self._normalizar_citas(pd.DataFrame([cita for _, cita in cambios], index=posiciones))
+        if df.empty:
+            return delta
+        
+        # Las filas modificadas que quedaron vacías desaparecen del resultado
+        base = df.drop(index=posiciones, errors='ignore')
+        if delta.empty:
+            return base
+        # El concat pierde las categóricas si delta trae valores nuevos: se vuelven a tipar
+        return tipar_citas(pd.concat([base, delta]).sort_index())
+    
+    @instrumentar
+    def get_appointment_count(self, fecha):
+        """Número de citas registradas en una fecha"""
+        fecha_str = fecha.strftime("%Y-%m-%d")
+        if self.backend.consultas_indexadas:
+            return len(self.backend.horas_ocupadas(fecha_str))
+        return self._estado_citas().conteo_por_fecha.get(fecha_str, 0)
+    
+    def _aplicar_cambios(self, df, cita_id, cambios):
+        """Devuelve una copia de `df` con los cambios aplicados a la cita indicada"""
+        return self._aplicar_lote(df, [(cita_id, cambios)])
+    
+    def _aplicar_lote(self, df, lote):
+        """Como _aplicar_cambios para varios (cita_id, cambios), con una sola copia de `df`"""
+        if df.empty or 'ID' not in df.columns or not lote:
+            return df
+        df = df.copy()
+        for cita_id, cambios in lote:
+            mascara = mascara_id(df, cita_id)
+            for columna, valor in cambios.items():
+                if columna in df.columns:
+                    asignar(df, mascara, columna, valor)
+        return df
+    
+    @instrumentar
     def get_today_appointments(self):
         """Obtiene las citas para el día de hoy"""
         try:
+            today = datetime.now().strftime("%Y-%m-%d")
+            
+            # Con un backend indexado basta una consulta por fecha
+            if self.backend.consultas_indexadas:
+                citas_hoy = tipar_citas(pd.DataFrame(self.backend.citas_por_fecha(today)))
+                # Cambios de estado que la cola de escritura aún no guardó
+                for cita_id, cambios in self._cola.pendientes():
+                    citas_hoy = self._aplicar_cambios(citas_hoy, cita_id, cambios)
+                return citas_hoy
+            
             df = self.get_all_appointments()
             
             # CORRECCIÓN: Verificar correctamente el DataFrame
             if df is None or df.empty:
                 return pd.DataFrame()
             
-            today = datetime.now().strftime("%Y-%m-%d")
-            
             if 'Fecha_Cita' in df.columns:
-                # Filtrar citas de hoy
-                citas_hoy = df[df['Fecha_Cita'] == today]
+                # Filtrar citas de hoy (comparación de datetime64, sin textos)
+                citas_hoy = df[df['Fecha_Cita'] == pd.Timestamp(today)]
                 return citas_hoy
             
             return pd.DataFrame()
@@ -171,220 +484,418 @@ class GoogleSheetsManager:
             print(f"Error en get_today_appointments: {e}")
             return pd.DataFrame()
     
-    def get_available_slots(self, fecha):
-        """Obtiene horarios disponibles para una fecha específica"""
+    @instrumentar
+    def get_available_slots(self, fecha, barbero=None, servicio=None):
+        """Obtiene horarios disponibles para una fecha específica
+        
+        Sin `barbero` devuelve las horas en que atiende al menos un barbero
+        libre; con `barbero`, solo las horas libres de ese barbero. Con
+        `servicio`, una hora solo se ofrece si cabe la duración completa del
+        servicio (ver HorarioCompilado.duracion_de).
+        Si no se pueden leer las reservas (p. ej. cuota de la API agotada) lanza
+        la excepción en lugar de ofrecer horarios que podrían estar ocupados.
+        """
         try:
-            citas_existentes = self.get_all_appointments()
-            fecha_str = fecha.strftime("%Y-%m-%d")
-            
-            # CORRECCIÓN: Verificar correctamente el DataFrame
-            if citas_existentes is None or citas_existentes.empty:
-                citas_fecha = []
-            else:
-                if 'Fecha_Cita' in citas_existentes.columns and 'Hora_Cita' in citas_existentes.columns:
-                    # Filtrar por fecha y obtener horarios
-                    citas_filtradas = citas_existentes[citas_existentes['Fecha_Cita'] == fecha_str]
-                    citas_fecha = citas_filtradas['Hora_Cita'].tolist()
-                else:
-                    citas_fecha = []
-            
-            # Obtener configuración de horarios
-            config = self.get_configuracion()
-            
-            # Determinar día de la semana
-            dia_semana = fecha.strftime("%A").lower()
-            
-            # Mapear días en español
-            dias_map = {
-                'monday': 'LUNES',
-                'tuesday': 'MARTES', 
-                'wednesday': 'MIERCOLES',
-                'thursday': 'JUEVES',
-                'friday': 'VIERNES',
-                'saturday': 'SABADO',
-                'sunday': 'DOMINGO'  # ✅ DOMINGO INCLUIDO
-            }
-            
-            dia_config = dias_map.get(dia_semana, 'LUNES')
-            horario_key = f"HORARIO_{dia_config}"
-            
-            # Obtener horario específico del día
-            horario_config = config.get(horario_key, "09:00-18:00")
-            
-            # Generar horarios basados en la configuración
-            horarios_disponibles = self._generate_time_slots(horario_config, config)
-            
-            # Filtrar horarios ocupados
-            horarios_disponibles = [h for h in horarios_disponibles if h not in citas_fecha]
-            
-            return horarios_disponibles
+            return self._ocupacion(fecha).horas_libres(barbero, self.get_horario().duracion_de(servicio))
             
         except Exception as e:
+            # Sin datos de reservas no se inventan horarios: la página muestra el error
             print(f"Error en get_available_slots: {e}")
-            # Slots por defecto en caso de error
-            return [
-                "09:00", "09:30", "10:00", "10:30", "11:00", "11:30",
-                "14:00", "14:30", "15:00", "15:30", "16:00", "16:30", "17:00"
-            ]
+            raise
+    
+    @instrumentar
+    def get_available_slots_range(self, start, end, barbero=None, servicio=None):
+        """Horarios libres de cada fecha entre `start` y `end` (incluidas), en una sola pasada
+        
+        Mismos criterios que get_available_slots, pero para todas las fechas a
+        la vez sobre la cache de citas. De hoy solo cuentan como libres los
+        horarios que todavía no empezaron, y de los días pasados ninguno.
+        Devuelve un DataFrame con Fecha (date), Libres y Ofrecidos (0 ofrecidos
+        = día cerrado), p. ej. para pintar un calendario de disponibilidad.
+        """
+        fechas = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        if not fechas:
+            return pd.DataFrame(columns=["Fecha", "Libres", "Ofrecidos"])
+        horario = self.get_horario()
+        ahora = datetime.now()
+        siguiente_minuto = ahora.hour * 60 + ahora.minute + 1
+        primer_inicio = [
+            0 if fecha > ahora.date() else siguiente_minuto if fecha == ahora.date() else MINUTOS_DIA
+            for fecha in fechas
+        ]
+        libres, ofrecidos = libres_por_fecha(
+            horario, fechas, self._reservas_entre(fechas), barbero, horario.duracion_de(servicio), primer_inicio
+        )
+        return pd.DataFrame({"Fecha": fechas, "Libres": libres, "Ofrecidos": ofrecidos})
+    
+    def get_barbers(self):
+        """Barberos configurados en BARBEROS (vacío si el local trabaja con un solo sillón)"""
+        return list(self.get_horario().barberos)
+    
+    def get_service_durations(self):
+        """Minutos que ocupa cada servicio, según Horarios_Config"""
+        horario = self.get_horario()
+        return {servicio: horario.duracion_de(servicio) for servicio in DURACION_SERVICIOS}
+    
+    def _reservas_entre(self, fechas):
+        """Citas de fechas consecutivas como secuencias (posición de la fecha, barbero, minutos, servicio)"""
+        if self.backend.consultas_indexadas:
+            # Una sola consulta por rango para todas las fechas
+            posiciones, barberos, minutos, servicios = [], [], [], []
+            for fecha_str, barbero, hora, servicio in self.backend.reservas_entre(
+                    f"{fechas[0]:%Y-%m-%d}", f"{fechas[-1]:%Y-%m-%d}"):
+                try:
+                    posicion = (date.fromisoformat(fecha_str) - fechas[0]).days
+                    comienzo = hora_a_minutos(str(hora))
+                except ValueError:
+                    continue
+                posiciones.append(posicion)
+                barberos.append(barbero)
+                minutos.append(comienzo)
+                servicios.append(servicio)
+            return posiciones, barberos, minutos, servicios
+        
+        df = self._estado_citas().df
+        if df.empty or not {'Fecha_Cita', 'Hora_Cita'} <= set(df.columns):
+            return [], [], [], []
+        # Posición de cada cita dentro de la ventana, como resta de datetime64
+        posicion = (df['Fecha_Cita'] - pd.Timestamp(fechas[0])).dt.days
+        mascara = ((posicion >= 0) & (posicion < len(fechas)) & (df['Hora_Cita'] != SIN_HORA)).fillna(False)
+        # Igual que reservas_por_fecha: las citas repetidas cuentan una vez
+        columnas = ['Fecha_Cita', 'Hora_Cita'] + [c for c in ('Barbero', 'Servicio') if c in df.columns]
+        citas = df.loc[mascara, columnas].drop_duplicates()
+        barberos, servicios = (
+            citas[c].astype(str).str.strip().tolist() if c in citas.columns else [""] * len(citas)
+            for c in ('Barbero', 'Servicio')
+        )
+        return posicion[citas.index].astype(int).tolist(), barberos, citas['Hora_Cita'].tolist(), servicios
+    
+    def _ocupacion(self, fecha):
+        """Matriz de ocupación barberos × slots de una fecha (ver utils/disponibilidad.py)"""
+        # Horario ya compilado: ni se relee la hoja ni se vuelven a parsear los textos
+        return matriz_de(self.get_horario(), fecha, self._reservas(fecha.strftime("%Y-%m-%d")))
     
-    def _generate_time_slots(self, horario_config, config):
-        """Genera slots de tiempo basados en la configuración"""
+    def _reservas(self, fecha_str):
+        """Tripletas (barbero, minutos, servicio) de las citas de una fecha"""
+        # Con un backend indexado basta una consulta por fecha
+        if self.backend.consultas_indexadas:
+            reservas = []
+            for barbero, hora, servicio in self.backend.reservas_de(fecha_str):
+                try:
+                    reservas.append((barbero, hora_a_minutos(str(hora)), servicio))
+                except ValueError:
+                    continue
+            return reservas
+        return self._estado_citas().reservas_por_fecha.get(fecha_str, [])
+    
+    def _lock_fecha(self, fecha_str):
+        """Lock compartido por todas las reservas de una misma fecha"""
+        with self._lock_locks_fecha:
+            return self._locks_fecha.setdefault(fecha_str, threading.Lock())
+    
+    @instrumentar
+    def create_appointment(self, appointment_data):
+        """Crea una nueva cita comprobando antes que el horario siga libre
+        
+        Devuelve un ResultadoReserva: verdadero si la cita quedó guardada y con
+        `conflicto=True` si otra persona reservó ese horario primero.
+        """
+        fecha_str = str(appointment_data.get("fecha_cita", ""))
+        hora = str(appointment_data.get("hora_cita", ""))
+        barbero = str(appointment_data.get("barbero", "") or "").strip()
         try:
-            # Parsear horario (formato: "09:00-18:00")
-            if "-" in horario_config:
-                inicio_str, fin_str = horario_config.split("-")
-                inicio = datetime.strptime(inicio_str.strip(), "%H:%M")
-                fin = datetime.strptime(fin_str.strip(), "%H:%M")
-            else:
-                # Horario por defecto
-                inicio = datetime.strptime("09:00", "%H:%M")
-                fin = datetime.strptime("18:00", "%H:%M")
-            
-            # Duración de cita (minutos)
-            duracion = int(config.get("DURACION_CITA", "30"))
+            fecha = datetime.strptime(fecha_str, "%Y-%m-%d").date()
+            minutos = hora_a_minutos(hora)
+            horario = self.get_horario()
+            duracion = horario.duracion_de(appointment_data.get("servicio", ""))
+            # Feriado, descanso o fuera de horario: no es un conflicto con otra reserva
+            if not matriz_de(horario, fecha, []).esta_libre(minutos, barbero, duracion):
+                return ResultadoReserva(False, mensaje=f"{fecha_str} {hora} está fuera del horario de atención")
             
-            # Generar slots
-            slots = []
-            current_time = inicio
-            
-            while current_time + timedelta(minutes=duracion) <= fin:
-                slot_str = current_time.strftime("%H:%M")
-                slots.append(slot_str)
-                current_time += timedelta(minutes=duracion)
+            with self._lock_fecha(fecha_str):
+                # Si la cache ya lo da por ocupado no hace falta preguntar a la hoja
+                ocupacion = self._ocupacion(fecha)
+                if not ocupacion.esta_libre(minutos, barbero, duracion):
+                    resultado = ResultadoReserva.ocupado()
+                else:
+                    # Sin preferencia, la cita va al barbero libre con menos citas ese día
+                    barbero = barbero or ocupacion.elegir_barbero(minutos, duracion) or ""
+                    resultado = self._reservar({**appointment_data, "barbero": barbero})
             
-            return slots
+            if resultado.conflicto:
+                # La cache no conocía la otra reserva: se refresca antes de volver a mostrar horarios
+                print(f"⚠️ Conflicto de reserva: {fecha_str} {hora} ya estaba tomado")
+                self._citas.expirar()
+                self._citas.obtener()
+                self._citas.esperar_refresco(self._citas.timeout)
+            return resultado
             
         except Exception as e:
-            print(f"Error en _generate_time_slots: {e}")
-            # Slots por defecto
-            return [
-                "09:00", "09:30", "10:00", "10:30", "11:00", "11:30",
-                "14:00", "14:30", "15:00", "15:30", "16:00", "16:30", "17:00"
+            print(f"❌ Error en create_appointment: {e}")
+            return ResultadoReserva(False, mensaje=str(e))
+    
+    def _reservar(self, appointment_data):
+        """Escribe la cita en el backend (llamar con el lock de la fecha tomado)"""
+        # Obtener el próximo ID
+        next_id = self._get_next_appointment_id()
+        
+        # Preparar datos para la fila en el ORDEN CORRECTO de tu hoja
+        nueva_cita = [
+            next_id,  # ID
+            appointment_data.get("cliente", ""),  # Cliente
+            appointment_data.get("correo", ""),  # Correo
+            appointment_data.get("Teléfono", ""),  # Teléfono
+            appointment_data.get("fecha_cita", ""),  # Fecha_Cita
+            appointment_data.get("hora_cita", ""),  # Hora_Cita
+            "Agendada",  # Estado
+            "",  # Hora_Inicio (vacío)
+            "",  # Hora_Fin (vacío)
+            appointment_data.get("servicio", ""),  # Servicio
+            appointment_data.get("notas", ""),  # Notas
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Fecha_Creacion
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Ultima_Actualizacion
+            appointment_data.get("barbero", "")  # Barbero
+        ]
+        
+        # Agregar a la hoja solo si no se solapa con otra cita del mismo barbero
+        resultado = self.backend.reservar_cita(nueva_cita, functools.partial(se_solapan, self.get_horario()))
+        resultado.barbero = appointment_data.get("barbero", "")
+        if not resultado:
+            return resultado
+        
+        fila = resultado.fila
+        if fila is not None:
+            # Agregar la cita a la cache en su posición de la hoja, sin releerla
+            cita = dict(zip(COLUMNAS_CITAS, nueva_cita))
+            self._parchear_cache(lambda df: self._fusionar_cambios(df, [(fila - 2, cita)]))
+        else:
+            # Sin fila conocida, la próxima lectura refresca la cache
+            self._citas.expirar()
+        
+        print(f"✅ Cita creada exitosamente - ID: {next_id}")
+        return resultado
+    
+    @instrumentar
+    def _escribir_lote(self, lote):
+        """Guarda en el backend un lote de la cola de escritura (lo llama su hilo)"""
+        # No se escribe mientras se archiva; las filas (época, fila) de antes de un
+        # archivado se descartan y la cita se busca por ID
+        with self._lock_archivado:
+            lote = [
+                (cita_id, cambios, fila[1] if fila is not None and fila[0] == self._epoca_filas else None)
+                for cita_id, cambios, fila in lote
             ]
+            return self.backend.actualizar_citas(lote)
     
-    def create_appointment(self, appointment_data):
-        """Crea una nueva cita - CORREGIDO para tu estructura"""
+    def _get_next_appointment_id(self):
+        """Obtiene el próximo ID disponible (único aunque dos sesiones reserven a la vez)"""
+        # Sin fallback: si no se puede sembrar el contador es preferible no reservar
+        # a entregar un ID repetido
+        return self._ids.siguiente()
+    
+    def _max_id(self, df):
+        """Mayor ID numérico del DataFrame de citas (0 si no hay ninguno)"""
+        if df.empty or 'ID' not in df.columns:
+            return 0
+        max_id = pd.to_numeric(df['ID'], errors='coerce').max()
+        return 0 if pd.isna(max_id) else int(max_id)
+    
+    @instrumentar
+    def update_appointment_status(self, cita_id, nuevo_estado, hora_inicio=None, hora_fin=None):
+        """Actualiza el estado de una cita
+        
+        El cambio se ve de inmediato en la cache y se guarda en la hoja en segundo
+        plano (ver ColaEscritura); devuelve True en cuanto queda anotado en el diario.
+        """
         try:
-            # Obtener el próximo ID
-            next_id = self._get_next_appointment_id()
-            
-            # Preparar datos para la fila en el ORDEN CORRECTO de tu hoja
-            nueva_cita = [
-                next_id,  # ID
-                appointment_data.get("cliente", ""),  # Cliente
-                appointment_data.get("correo", ""),  # Correo
-                appointment_data.get("Teléfono", ""),  # Teléfono
-                appointment_data.get("fecha_cita", ""),  # Fecha_Cita
-                appointment_data.get("hora_cita", ""),  # Hora_Cita
-                "Agendada",  # Estado
-                "",  # Hora_Inicio (vacío)
-                "",  # Hora_Fin (vacío)
-                appointment_data.get("servicio", ""),  # Servicio
-                appointment_data.get("notas", ""),  # Notas
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Fecha_Creacion
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")   # Ultima_Actualizacion
-            ]
+            cambios = self._cambios_de_estado(nuevo_estado, hora_inicio, hora_fin)
+            filas = self._ubicar_citas([cita_id])
+            if str(cita_id) not in filas:
+                print(f"Error en update_appointment_status: no existe la cita {cita_id}")
+                return False
             
-            # Agregar a la hoja
-            self.citas_sheet.append_row(nueva_cita)
-            
-            # Limpiar cache
-            self.clear_cache()
-            
-            print(f"✅ Cita creada exitosamente - ID: {next_id}")
+            self._cola.encolar(cita_id, cambios, filas[str(cita_id)])
+            # Actualizar la cache en lugar de limpiarla
+            self._parchear_cache(
+                lambda df: self._aplicar_cambios(df, cita_id, cambios),
+                afecta_indices=False
+            )
             return True
             
         except Exception as e:
-            print(f"❌ Error en create_appointment: {e}")
+            print(f"Error en update_appointment_status: {e}")
             return False
     
-    def _get_next_appointment_id(self):
-        """Obtiene el próximo ID disponible"""
+    @instrumentar
+    def update_appointment_statuses(self, estados):
+        """Actualiza el estado de varias citas de una vez; `estados` es {cita_id: nuevo_estado}
+        
+        Como update_appointment_status con la hora actual como Hora_Inicio (al
+        pasar a En Progreso) u Hora_Fin (al completar), pero todos los cambios
+        van juntos: una escritura en el diario, un solo parche de la cache y un
+        solo lote de la cola hacia la hoja. Devuelve cuántas citas se
+        actualizaron; los IDs que no existen se ignoran.
+        """
         try:
-            df = self.get_all_appointments()
-            if df.empty or 'ID' not in df.columns:
-                return 1
-            
-            # Encontrar el máximo ID actual
-            max_id = 0
-            for id_val in df['ID']:
-                try:
-                    id_num = int(id_val)
-                    if id_num > max_id:
-                        max_id = id_num
-                except (ValueError, TypeError):
+            ahora = datetime.now()
+            filas = self._ubicar_citas(estados)
+            lote = []
+            for cita_id, nuevo_estado in estados.items():
+                cita_id = str(cita_id)
+                if cita_id not in filas:
+                    print(f"Error en update_appointment_statuses: no existe la cita {cita_id}")
                     continue
+                lote.append((cita_id, self._cambios_de_estado(nuevo_estado, ahora, ahora), filas[cita_id]))
+            if not lote:
+                return 0
             
-            return max_id + 1
+            self._cola.encolar_lote(lote)
+            cambios = [(cita_id, datos) for cita_id, datos, _ in lote]
+            self._parchear_cache(lambda df: self._aplicar_lote(df, cambios), afecta_indices=False)
+            return len(lote)
             
         except Exception as e:
-            print(f"Error en _get_next_appointment_id: {e}")
-            # Si hay error, usar timestamp como fallback
-            return int(datetime.now().timestamp())
+            print(f"Error en update_appointment_statuses: {e}")
+            return 0
     
-    def update_appointment_status(self, cita_id, nuevo_estado, hora_inicio=None, hora_fin=None):
-        """Actualiza el estado de una cita"""
-        try:
-            # Encontrar la fila con el ID
-            cell = self.citas_sheet.find(str(cita_id))
+    def _ubicar_citas(self, ids):
+        """{cita_id: fila anotada} de las citas de `ids` que existen
+        
+        Con un backend indexado se pregunta al backend, sin cargar la cache de
+        citas, y no se anota fila: la posición en la cache no es la fila de la
+        hoja. Si no, la fila anotada es (época, fila) según la cache.
+        """
+        ids = [str(cita_id) for cita_id in ids]
+        if self.backend.consultas_indexadas:
+            existentes = self.backend.ids_existentes(ids)
+            return {cita_id: None for cita_id in ids if cita_id in existentes}
+        
+        # La época se lee antes que la cache: si un archivado mueve las filas
+        # después, la fila anotada se descarta al escribir
+        epoca = self._epoca_filas
+        fila_por_id = self._estado_citas().fila_por_id
+        return {cita_id: (epoca, fila_por_id[cita_id]) for cita_id in ids if cita_id in fila_por_id}
+    
+    def _cambios_de_estado(self, nuevo_estado, hora_inicio=None, hora_fin=None):
+        """Columnas de la hoja Citas que cambian al pasar una cita a `nuevo_estado`"""
+        cambios = {"Estado": nuevo_estado}
+        
+        # Actualizar horas si se proporcionan
+        if hora_inicio and nuevo_estado == "En Progreso":
+            cambios["Hora_Inicio"] = hora_inicio.strftime("%H:%M")
+        
+        if hora_fin and nuevo_estado == "Completada":
+            cambios["Hora_Fin"] = hora_fin.strftime("%H:%M")
+        
+        # Actualizar última actualización
+        cambios["Ultima_Actualizacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return cambios
+    
+    @instrumentar
+    def archive_appointments(self, dias=None):
+        """Mueve al archivo las citas completadas o canceladas de hace más de `dias` días
+        
+        Devuelve cuántas citas salieron de la hoja Citas. Después la cache se
+        recarga completa. La cita con el mayor ID nunca se archiva: de ella se
+        siembra el contador de IDs si se pierde contador_ids.txt.
+        """
+        dias = self.dias_archivo if dias is None else int(dias)
+        limite = pd.Timestamp(date.today() - timedelta(days=dias))
+        
+        # Se archiva el estado final: primero se guardan los cambios pendientes
+        if not self.flush_pending_writes(timeout=30):
+            raise TimeoutError("Hay cambios de estado sin guardar; intenta archivar en unos minutos")
+        
+        with self._lock_archivado:
+            # Lectura completa y fresca de la hoja
+            self.clear_cache()
+            df = self._estado_citas().df
+            if df.empty or not {'ID', 'Fecha_Cita', 'Estado'} <= set(df.columns):
+                return 0
             
-            if cell:
-                # Las columnas en tu hoja (basado en tu estructura):
-                # ID=1, Cliente=2, Correo=3, Teléfono=4, Fecha_Cita=5, Hora_Cita=6, 
-                # Estado=7, Hora_Inicio=8, Hora_Fin=9, Servicio=10, Notas=11, 
-                # Fecha_Creacion=12, Ultima_Actualizacion=13
-                
-                # Actualizar estado (columna 7)
-                self.citas_sheet.update_cell(cell.row, 7, nuevo_estado)
-                
-                # Actualizar horas si se proporcionan
-                if hora_inicio and nuevo_estado == "En Progreso":
-                    self.citas_sheet.update_cell(cell.row, 8, hora_inicio.strftime("%H:%M"))
-                
-                if hora_fin and nuevo_estado == "Completada":
-                    self.citas_sheet.update_cell(cell.row, 9, hora_fin.strftime("%H:%M"))
-                
-                # Actualizar última actualización
-                self.citas_sheet.update_cell(cell.row, 13, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                
-                # Limpiar cache
-                self.clear_cache()
-                
-                return True
-            return False
+            mascara = (
+                (df['Fecha_Cita'] < limite)
+                & df['Estado'].isin(ESTADOS_ARCHIVABLES)
+                & df['ID'].notna()
+                & (df['ID'] != df['ID'].max())
+            ).fillna(False)
+            if not mascara.any():
+                return 0
             
-        except Exception as e:
-            print(f"Error en update_appointment_status: {e}")
-            return False
+            archivables = para_mostrar(df[mascara]).reindex(columns=COLUMNAS_CITAS).astype(object).fillna("")
+            # Primero se escribe el archivo y solo después se borra de Citas: si algo
+            # falla a mitad, el próximo intento no duplica las que ya se archivaron
+            registros = archivables.to_dict("records")
+            self.archivo.guardar(registros)
+            eliminadas = self.backend.eliminar_citas(registros)
+            
+            # Primero se descarta la cache y luego cambia la época (ver update_appointment_status)
+            self.clear_cache()
+            self._epoca_filas += 1
+        
+        with self._lock_historial:
+            self._historial.clear()
+            self._meses_archivo = None
+        print(f"✅ {eliminadas} citas archivadas (anteriores a {limite:%Y-%m-%d})")
+        return eliminadas
+    
+    @instrumentar
+    def export_appointments(self, formato="csv", filtros=None):
+        """Ruta de un archivo con las citas que cumplen `filtros` (ver utils/exportar.py)
+        
+        El archivo se genera una sola vez por versión de los datos, filtros y
+        formato. Con filtros["historial"] incluye también los meses archivados
+        dentro del rango de fechas, leídos de a uno y sin guardarlos en memoria.
+        """
+        filtros = normalizar_filtros(filtros)
+        estado = self._estado_citas()
+        df = estado.df
+        clave = (estado.generacion, estado.version, formato, tuple(sorted(filtros.items())))
+        
+        def partes():
+            if filtros.get("historial"):
+                for mes in self.get_archive_months():
+                    if mes_en_rango(mes, filtros):
+                        with self._lock_historial:
+                            archivadas = self._historial.get(mes)
+                        if archivadas is None:
+                            archivadas = self._normalizar_citas(self.archivo.leer_mes(mes))
+                        yield filtrar_citas(archivadas, filtros)
+            yield filtrar_citas(df, filtros)
+        
+        return self._exportaciones.obtener(clave, formato, partes)
     
+    def get_archive_months(self):
+        """Meses con citas archivadas ("AAAA-MM"), de más antiguo a más reciente"""
+        with self._lock_historial:
+            if self._meses_archivo is None:
+                self._meses_archivo = self.archivo.meses()
+            return list(self._meses_archivo)
+    
+    @instrumentar
+    def get_archived_appointments(self, meses):
+        """Citas archivadas de los meses pedidos; cada mes se lee una sola vez y queda en memoria"""
+        partes = []
+        for mes in meses:
+            with self._lock_historial:
+                df = self._historial.get(mes)
+            if df is None:
+                df = self._normalizar_citas(self.archivo.leer_mes(mes))
+                with self._lock_historial:
+                    self._historial[mes] = df
+            if not df.empty:
+                partes.append(df)
+        if not partes:
+            return pd.DataFrame()
+        # Meses con servicios o estados distintos: se vuelven a unificar las categorías
+        return tipar_citas(pd.concat(partes, ignore_index=True))
+    
+    @instrumentar
     def get_configuracion(self):
-        """Obtiene la configuración actual desde Horarios_Config"""
+        """Obtiene la configuración actual desde Horarios_Config (con cache)"""
         try:
-            data = self.horarios_config_sheet.get_all_records()
-            config_dict = {}
-            
-            for row in data:
-                if 'Tipo' in row and 'Valor' in row:
-                    config_dict[row['Tipo']] = row['Valor']
-            
-            # Asegurar valores por defecto INCLUYENDO DOMINGO
-            defaults = {
-                "HORARIO_LUNES": "09:00-18:00",
-                "HORARIO_MARTES": "09:00-18:00",
-                "HORARIO_MIERCOLES": "09:00-18:00", 
-                "HORARIO_JUEVES": "09:00-18:00",
-                "HORARIO_VIERNES": "09:00-18:00",
-                "HORARIO_SABADO": "09:00-18:00",
-                "HORARIO_DOMINGO": "09:00-14:00",  # ✅ DOMINGO INCLUIDO
-                "DURACION_CITA": "30",
-                "DIAS_NO_LABORABLES": ""
-            }
-            
-            for key, default_value in defaults.items():
-                if key not in config_dict:
-                    config_dict[key] = default_value
-            
-            return config_dict
+            # Copia: las páginas modifican el diccionario que reciben
+            return dict(self._config.obtener().config)
             
         except Exception as e:
             print(f"Error en get_configuracion: {e}")
@@ -398,26 +909,69 @@ class GoogleSheetsManager:
                 "HORARIO_SABADO": "09:00-18:00",
                 "HORARIO_DOMINGO": "09:00-14:00",  # ✅ DOMINGO INCLUIDO
                 "DURACION_CITA": "30",
-                "DIAS_NO_LABORABLES": ""
+                "DIAS_NO_LABORABLES": "",
+                "DESCANSOS": "",
+                "HORARIOS_ESPECIALES": "",
+                **{clave_duracion(servicio): str(minutos) for servicio, minutos in DURACION_SERVICIOS.items()}
             }
     
+    @instrumentar
+    def _cargar_configuracion(self):
+        """Lee Horarios_Config y la compila en un HorarioCompilado"""
+        data = self.backend.leer_configuracion()
+        config_dict = {}
+        
+        for row in data:
+            if 'Tipo' in row and 'Valor' in row:
+                config_dict[row['Tipo']] = row['Valor']
+        
+        # Asegurar valores por defecto INCLUYENDO DOMINGO
+        defaults = {
+            "HORARIO_LUNES": "09:00-18:00",
+            "HORARIO_MARTES": "09:00-18:00",
+            "HORARIO_MIERCOLES": "09:00-18:00", 
+            "HORARIO_JUEVES": "09:00-18:00",
+            "HORARIO_VIERNES": "09:00-18:00",
+            "HORARIO_SABADO": "09:00-18:00",
+            "HORARIO_DOMINGO": "09:00-14:00",  # ✅ DOMINGO INCLUIDO
+            "DURACION_CITA": "30",
+            "DIAS_NO_LABORABLES": "",
+            "DESCANSOS": "",
+            "HORARIOS_ESPECIALES": ""
+        }
+        defaults.update({clave_duracion(servicio): str(minutos) for servicio, minutos in DURACION_SERVICIOS.items()})
+        
+        for key, default_value in defaults.items():
+            if key not in config_dict:
+                config_dict[key] = default_value
+        
+        return HorarioCompilado(config_dict)
+    
+    @instrumentar
+    def get_horario(self):
+        """Devuelve la configuración compilada en un HorarioCompilado"""
+        try:
+            return self._config.obtener()
+        except Exception as e:
+            print(f"Error en get_horario: {e}")
+            return HorarioCompilado(self.get_configuracion())
+    
+    @instrumentar
     def update_configuracion(self, nueva_config):
         """Actualiza la configuración en Horarios_Config"""
         try:
             # Obtener configuración actual
             config_actual = self.get_configuracion()
             
+            # No escribir nada si ningún valor cambió
+            if all(str(config_actual.get(key, "")) == str(value) for key, value in nueva_config.items()):
+                return True
+            
             # Actualizar valores
             for key, value in nueva_config.items():
                 config_actual[key] = value
             
-            # Limpiar y reescribir la hoja
-            self.horarios_config_sheet.clear()
-            
-            # Agregar encabezados
-            self.horarios_config_sheet.append_row(["Tipo", "Valor", "Descripcion"])
-            
-            # Agregar configuración INCLUYENDO DOMINGO
+            # Configuración INCLUYENDO DOMINGO
             config_items = [
                 ("HORARIO_LUNES", "Horario para Lunes"),
                 ("HORARIO_MARTES", "Horario para Martes"),
@@ -427,12 +981,31 @@ class GoogleSheetsManager:
                 ("HORARIO_SABADO", "Horario para Sábado"),
                 ("HORARIO_DOMINGO", "Horario para Domingo"),  # ✅ DOMINGO INCLUIDO
                 ("DURACION_CITA", "Duración de cada cita en minutos"),
-                ("DIAS_NO_LABORABLES", "Días festivos separados por comas (YYYY-MM-DD)")
+                ("DIAS_NO_LABORABLES", "Días festivos separados por comas (YYYY-MM-DD)"),
+                ("DESCANSOS", "Descansos de todos: 13:00-14:00 o SABADO 12:00-12:30, separados por comas"),
+                ("HORARIOS_ESPECIALES", "Horario de fechas puntuales: 2024-12-24 09:00-13:00 o CERRADO, separados por comas"),
+                ("BARBEROS", "Barberos separados por comas")
+            ] + [
+                (clave_duracion(servicio), f"Duración de {servicio} en minutos")
+                for servicio in DURACION_SERVICIOS
             ]
             
-            for key, descripcion in config_items:
-                valor = config_actual.get(key, "")
-                self.horarios_config_sheet.append_row([key, valor, descripcion])
+            # Horarios y descansos propios de cada barbero; vacío = los del local
+            barberos = HorarioCompilado(config_actual).barberos
+            for barbero in barberos:
+                for dia in DIAS_SEMANA:
+                    key = f"HORARIO_{dia}_{clave_config(barbero)}"
+                    if str(config_actual.get(key, "")).strip():
+                        config_items.append((key, f"Horario de {barbero} ({dia.capitalize()})"))
+                key = f"DESCANSOS_{clave_config(barbero)}"
+                if str(config_actual.get(key, "")).strip():
+                    config_items.append((key, f"Descansos de {barbero}"))
+            
+            filas = [[key, config_actual.get(key, ""), descripcion] for key, descripcion in config_items]
+            self.backend.escribir_configuracion(filas)
+            
+            # La configuración recién escrita reemplaza a la de la cache
+            self._config.poner(HorarioCompilado(config_actual))
             
             return True
             
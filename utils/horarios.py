@@ -0,0 +1,286 @@
+import re
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+# Días en el orden de date.weekday() (0 = lunes)
+DIAS_SEMANA = ["LUNES", "MARTES", "MIERCOLES", "JUEVES", "VIERNES", "SABADO", "DOMINGO"]
+
+HORARIO_POR_DEFECTO = (9 * 60, 18 * 60)
+DURACION_POR_DEFECTO = 30
+MINUTOS_DIA = 24 * 60
+
+# Rango de un día en que no se trabaja ("CERRADO" o "-" en Horarios_Config)
+CERRADO = (0, 0)
+_TEXTOS_CERRADO = {"CERRADO", "-", "NO"}
+
+
+def hora_a_minutos(texto):
+    """Convierte "HH:MM" en minutos desde medianoche"""
+    horas, minutos = texto.strip().split(":")
+    horas, minutos = int(horas), int(minutos)
+    if not (0 <= horas <= 24 and 0 <= minutos < 60):
+        raise ValueError(f"Hora fuera de rango: {texto}")
+    return horas * 60 + minutos
+
+
+def minutos_a_hora(minutos):
+    """Convierte minutos desde medianoche en texto HH:MM"""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+@lru_cache(maxsize=1)
+def etiquetas_de_minutos():
+    """Tabla minuto del día -> "HH:MM" (arreglo de numpy), calculada una sola vez por proceso
+    
+    Indexarla con un arreglo de minutos da las etiquetas de todos a la vez.
+    """
+    return np.array([minutos_a_hora(m) for m in range(MINUTOS_DIA + 1)], dtype=object)
+
+
+def parsear_rango(texto):
+    """Convierte "09:00-18:00" en (540, 1080); usa el horario por defecto si no es válido
+    
+    "CERRADO" (o "-") da CERRADO: ese día no hay slots.
+    """
+    if str(texto).strip().upper() in _TEXTOS_CERRADO:
+        return CERRADO
+    try:
+        if "-" in str(texto):
+            inicio, fin = str(texto).split("-")
+            return hora_a_minutos(inicio), hora_a_minutos(fin)
+    except ValueError as e:
+        print(f"Error al interpretar el horario '{texto}': {e}")
+    return HORARIO_POR_DEFECTO
+
+
+def parsear_fechas(texto):
+    """Convierte "2024-12-25, 2024-01-01" en un conjunto de fechas, ignorando las inválidas"""
+    fechas = set()
+    for parte in str(texto or "").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        try:
+            fechas.add(datetime.strptime(parte, "%Y-%m-%d").date())
+        except ValueError:
+            print(f"Fecha no laborable inválida ignorada: {parte}")
+    return frozenset(fechas)
+
+
+def _rango_valido(texto):
+    """Como parsear_rango, pero None (en lugar del horario por defecto) si el texto no es un rango"""
+    texto = str(texto).strip()
+    if texto.upper() in _TEXTOS_CERRADO:
+        return CERRADO
+    try:
+        inicio, fin = (hora_a_minutos(parte) for parte in texto.split("-"))
+    except ValueError:
+        return None
+    return (inicio, fin) if inicio < fin else None
+
+
+def parsear_descansos(texto):
+    """Convierte "13:00-14:00, SABADO 12:00-12:30" en ((None, 780, 840), (5, 720, 750))
+    
+    Un descanso sin día se repite todos los días; con día, solo ese día de la
+    semana. Las entradas inválidas se ignoran.
+    """
+    descansos = []
+    for parte in str(texto or "").split(","):
+        if not parte.strip():
+            continue
+        dia, rango = None, parte
+        palabras = parte.split(maxsplit=1)
+        if len(palabras) == 2 and clave_config(palabras[0]) in DIAS_SEMANA:
+            dia, rango = DIAS_SEMANA.index(clave_config(palabras[0])), palabras[1]
+        rango = _rango_valido(rango)
+        if not rango or rango == CERRADO:
+            print(f"Descanso inválido ignorado: {parte.strip()}")
+            continue
+        descansos.append((dia,) + rango)
+    return tuple(descansos)
+
+
+def parsear_especiales(texto):
+    """Convierte "2024-12-24 09:00-13:00, 2024-12-31 CERRADO" en {fecha: (apertura, cierre)}
+    
+    Cada entrada reemplaza el horario de todos los barberos en esa fecha.
+    Las entradas inválidas se ignoran.
+    """
+    especiales = {}
+    for parte in str(texto or "").split(","):
+        palabras = parte.split(maxsplit=1)
+        if not palabras:
+            continue
+        try:
+            fecha = datetime.strptime(palabras[0], "%Y-%m-%d").date()
+        except ValueError:
+            fecha = None
+        rango = _rango_valido(palabras[1]) if fecha and len(palabras) == 2 else None
+        if rango is None:
+            print(f"Horario especial inválido ignorado: {parte.strip()}")
+            continue
+        especiales[fecha] = rango
+    return especiales
+
+
+def parsear_barberos(texto):
+    """Convierte "Carlos, Miguel" en ("Carlos", "Miguel"), sin vacíos ni repetidos"""
+    barberos = []
+    for parte in str(texto or "").split(","):
+        parte = parte.strip()
+        if parte and parte not in barberos:
+            barberos.append(parte)
+    return tuple(barberos)
+
+
+def clave_config(nombre):
+    """Nombre (de barbero o servicio) como sufijo de clave de configuración: "José Luis" -> "JOSE_LUIS" """
+    sin_tildes = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Z0-9]+", "_", sin_tildes.upper()).strip("_")
+
+
+def clave_duracion(servicio):
+    """Clave de Horarios_Config con la duración de un servicio: "Corte y barba" -> "DURACION_CORTE_Y_BARBA" """
+    return f"DURACION_{clave_config(servicio)}"
+
+
+def _minutos_positivos(valor):
+    """Entero > 0 de un valor de configuración, o None si no lo es"""
+    try:
+        minutos = int(str(valor).strip())
+    except ValueError:
+        return None
+    return minutos if minutos > 0 else None
+
+
+class HorarioCompilado:
+    """Configuración de Horarios_Config interpretada una sola vez
+    
+    Guarda por día de la semana la apertura y el cierre en minutos, la
+    duración de cada cita como entero y los días no laborables como fechas.
+    
+    Los barberos se listan en BARBEROS ("Carlos, Miguel"). Cada uno trabaja
+    el horario del local salvo que tenga su propio HORARIO_<DIA>_<BARBERO>
+    (p. ej. HORARIO_SABADO_CARLOS = "10:00-14:00" o "CERRADO").
+    
+    DURACION_CITA es el paso entre horarios ofrecidos y la duración de los
+    servicios sin duración propia; DURACION_<SERVICIO> (p. ej. DURACION_TINTE
+    = 90) es lo que una cita de ese servicio ocupa al barbero.
+    
+    Sobre el horario semanal se aplican, en este orden:
+    - DESCANSOS ("13:00-14:00, SABADO 12:00-12:30") para todos y
+      DESCANSOS_<BARBERO> para uno solo
+    - HORARIOS_ESPECIALES ("2024-12-24 09:00-13:00, 2024-12-31 CERRADO"), que
+      reemplazan el horario de todos en esas fechas
+    - DIAS_NO_LABORABLES, que cierran el local todo el día
+    
+    Todo se compila al crear el objeto (una vez por versión de la
+    configuración) en máscaras de minutos bloqueados: una por día de la
+    semana y una por cada fecha con excepción. La máscara de cualquier fecha
+    es entonces una búsqueda (ver `mascaras`).
+    """
+    
+    def __init__(self, config):
+        self.config = dict(config)
+        self.horarios = tuple(
+            parsear_rango(config.get(f"HORARIO_{dia}", "")) for dia in DIAS_SEMANA
+        )
+        try:
+            self.duracion = int(config.get("DURACION_CITA", DURACION_POR_DEFECTO))
+        except (TypeError, ValueError):
+            self.duracion = DURACION_POR_DEFECTO
+        if self.duracion <= 0:
+            self.duracion = DURACION_POR_DEFECTO
+        self.feriados = parsear_fechas(config.get("DIAS_NO_LABORABLES", ""))
+        # Clave del servicio (ver clave_duracion) -> minutos
+        self.duraciones = {
+            clave: minutos for clave, minutos in (
+                (clave, _minutos_positivos(valor)) for clave, valor in config.items()
+                if str(clave).startswith("DURACION_") and clave != "DURACION_CITA"
+            ) if minutos
+        }
+        self.barberos = parsear_barberos(config.get("BARBEROS", ""))
+        self.horarios_barbero = {barbero: self._horarios_de_barbero(barbero) for barbero in self.barberos}
+        self.descansos = parsear_descansos(config.get("DESCANSOS", ""))
+        self.descansos_barbero = {
+            barbero: parsear_descansos(config.get(f"DESCANSOS_{clave_config(barbero)}", "")) for barbero in self.barberos
+        }
+        self.especiales = parsear_especiales(config.get("HORARIOS_ESPECIALES", ""))
+        # Etiquetas "HH:MM" de los inicios ofrecidos, sin formatear en cada consulta
+        self.etiquetas = etiquetas_de_minutos()
+        self._compilar_mascaras()
+    
+    def _horarios_de_barbero(self, barbero):
+        horarios = []
+        for dia, del_local in zip(DIAS_SEMANA, self.horarios):
+            propio = str(self.config.get(f"HORARIO_{dia}_{clave_config(barbero)}", "")).strip()
+            horarios.append(parsear_rango(propio) if propio else del_local)
+        return tuple(horarios)
+    
+    def _compilar_mascaras(self):
+        """Precalcula (bloqueado, ofrecidos) por día de la semana y por fecha con excepción"""
+        minutos = np.arange(MINUTOS_DIA)
+        
+        def bloqueado(dia, rangos):
+            # Una fila por barbero: fuera de su rango o dentro de alguno de sus descansos
+            filas = []
+            for recurso, (apertura, cierre) in zip(self.recursos, rangos):
+                fila = (minutos < apertura) | (minutos >= cierre)
+                for dia_descanso, inicio, fin in self.descansos + self.descansos_barbero.get(recurso, ()):
+                    if dia_descanso is None or dia_descanso == dia:
+                        fila |= (minutos >= inicio) & (minutos < fin)
+                filas.append(fila)
+            return np.array(filas)
+        
+        semana = [
+            bloqueado(dia, [self.horarios_barbero.get(recurso, self.horarios)[dia] for recurso in self.recursos])
+            for dia in range(7)
+        ]
+        self._semana = np.array(semana), np.array([self._ofrecidos(mascara) for mascara in semana])
+        
+        self._excepciones = {}
+        for fecha, rango in self.especiales.items():
+            mascara = bloqueado(fecha.weekday(), [rango] * len(self.recursos))
+            self._excepciones[fecha] = mascara, self._ofrecidos(mascara)
+        cerrado = np.ones((len(self.recursos), MINUTOS_DIA), dtype=bool)
+        for fecha in self.feriados:
+            self._excepciones[fecha] = cerrado, self._ofrecidos(cerrado)
+    
+    def _ofrecidos(self, bloqueado):
+        """Minutos en que empieza un horario ofrecido: cada `duracion` desde la primera apertura hasta el último cierre"""
+        atiende = ~bloqueado.all(axis=0)
+        if not atiende.any():
+            return np.zeros(MINUTOS_DIA, dtype=bool)
+        origen = int(np.argmax(atiende))
+        fin = MINUTOS_DIA - int(np.argmax(atiende[::-1]))
+        minutos = np.arange(MINUTOS_DIA)
+        return (minutos >= origen) & (minutos < fin) & ((minutos - origen) % self.duracion == 0)
+    
+    def mascaras(self, fechas):
+        """(bloqueado, ofrecidos) de cada fecha: arreglos (fechas, barberos, minutos) y (fechas, minutos)
+        
+        `bloqueado` marca los minutos en que cada barbero no atiende (fuera de
+        horario, en descanso o día no laborable). Son copias: pueden modificarse.
+        """
+        dias = [fecha.weekday() for fecha in fechas]
+        bloqueado, ofrecidos = self._semana[0][dias], self._semana[1][dias]
+        for i, fecha in enumerate(fechas):
+            excepcion = self._excepciones.get(fecha)
+            if excepcion is not None:
+                bloqueado[i], ofrecidos[i] = excepcion
+        return bloqueado, ofrecidos
+    
+    def duracion_de(self, servicio):
+        """Minutos que ocupa una cita del servicio (DURACION_CITA si no tiene duración propia)"""
+        if not servicio:
+            return self.duracion
+        return self.duraciones.get(clave_duracion(servicio), self.duracion)
+    
+    @property
+    def recursos(self):
+        """Barberos que atienden; sin BARBEROS configurados, un único sillón sin nombre"""
+        return self.barberos or ("",)
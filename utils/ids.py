@@ -0,0 +1,82 @@
+"""Asignación de IDs de cita sin recorrer el historial
+
+El mayor ID entregado se guarda en memoria y en un archivo auxiliar. Se siembra
+una sola vez desde la cache de citas; después cada ID nuevo cuesta O(1) y el
+lock garantiza que dos sesiones que reservan a la vez no reciban el mismo.
+"""
+import os
+import threading
+
+
+class GeneradorIds:
+    """Entrega IDs consecutivos y únicos dentro del proceso
+    
+    `semilla` es una función que devuelve el mayor ID existente; se llama solo
+    la primera vez (o tras `reiniciar`). `ruta` es el archivo donde se persiste
+    el último ID entregado, para no repetir IDs tras reiniciar la app aunque la
+    hoja todavía no refleje la última reserva. Con `ruta=None` no se persiste.
+    """
+    
+    def __init__(self, semilla, ruta=None):
+        self.semilla = semilla
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._ultimo = None
+    
+    @property
+    def ultimo(self):
+        """Último ID entregado u observado (None si aún no se sembró)"""
+        return self._ultimo
+    
+    def siguiente(self):
+        """Reserva y devuelve el próximo ID"""
+        if self._ultimo is None:
+            # Fuera del lock: la semilla puede esperar una carga que llama a observar().
+            # Si falla no se siembra: mejor no reservar que duplicar IDs
+            semilla = max(int(self.semilla() or 0), self._leer_persistido())
+            with self._lock:
+                self._ultimo = max(self._ultimo or 0, semilla)
+        
+        with self._lock:
+            self._ultimo += 1
+            self._persistir(self._ultimo)
+            return self._ultimo
+    
+    def observar(self, cita_id):
+        """Sube la marca si aparece un ID mayor (p. ej. creado desde otra instancia)"""
+        try:
+            cita_id = int(cita_id)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            if self._ultimo is not None and cita_id > self._ultimo:
+                self._ultimo = cita_id
+    
+    def reiniciar(self):
+        """Olvida la marca; el próximo ID vuelve a sembrarse"""
+        with self._lock:
+            self._ultimo = None
+    
+    def _leer_persistido(self):
+        if not self.ruta:
+            return 0
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudo leer el contador de IDs {self.ruta}: {e}")
+            return 0
+    
+    def _persistir(self, valor):
+        if not self.ruta:
+            return
+        try:
+            # Escritura atómica: nunca queda un archivo a medias
+            temporal = f"{self.ruta}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                f.write(str(valor))
+            os.replace(temporal, self.ruta)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar el contador de IDs {self.ruta}: {e}")
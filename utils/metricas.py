@@ -0,0 +1,244 @@
+"""Métricas de la app: latencias, llamadas y filas transferidas
+
+Un registro por proceso (`metricas`) que comparten todas las sesiones. Guarda
+histogramas de latencia y contadores identificados por familia y etiquetas
+(método del manager, método de gspread, página...). Se exporta como
+diccionario (para JSON) o en el formato de texto de Prometheus, junto con los
+aciertos y fallos de las caches.
+"""
+import functools
+import threading
+import time as time_mod
+from contextlib import contextmanager
+
+from utils.cache import estadisticas_caches
+
+# Límites superiores de los intervalos del histograma, en segundos
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+# Familias de métricas de la app
+MANAGER = "gsheets_manager_segundos"
+API = "gsheets_api_segundos"
+FILAS_API = "gsheets_api_filas_total"
+PAGINA = "pagina_render_segundos"
+CACHE = "cache_consultas_total"
+COLA = "cola_escritura_pendientes"
+FICHAS = "cuota_fichas_disponibles"
+
+DESCRIPCIONES = {
+    MANAGER: "Duración de los métodos de GoogleSheetsManager",
+    API: "Duración de cada petición de gspread, con reintentos y espera de cuota",
+    FILAS_API: "Filas leídas o escritas por las peticiones de gspread",
+    PAGINA: "Duración de cada ejecución (rerun) de una página",
+    CACHE: "Consultas a las caches por resultado",
+    COLA: "Cambios de estado pendientes de guardar",
+    FICHAS: "Peticiones que admite ya la cuota de la API, por tipo",
+}
+
+# Contadores de CacheSWR.resumen() que se exportan, con su nombre de resultado
+_RESULTADOS_CACHE = {
+    "aciertos": "acierto", "obsoletos": "obsoleto", "fallos": "fallo",
+    "compartidas": "compartida", "cargas": "carga", "errores": "error",
+}
+
+
+class Histograma:
+    """Cuenta observaciones por intervalo de LIMITES_SEGUNDOS, con suma y máximo"""
+    
+    def __init__(self):
+        self.cubetas = [0] * len(LIMITES_SEGUNDOS)
+        self.cuenta = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self.errores = 0
+    
+    def observar(self, segundos, error=False):
+        for i, limite in enumerate(LIMITES_SEGUNDOS):
+            if segundos <= limite:
+                self.cubetas[i] += 1
+                break
+        self.cuenta += 1
+        self.suma += segundos
+        self.maximo = max(self.maximo, segundos)
+        if error:
+            self.errores += 1
+    
+    def percentil(self, q):
+        """Percentil q (0-1) estimado con el límite del intervalo que lo contiene"""
+        if not self.cuenta:
+            return None
+        acumulado = 0
+        for limite, cantidad in zip(LIMITES_SEGUNDOS, self.cubetas):
+            acumulado += cantidad
+            if acumulado >= q * self.cuenta:
+                return min(limite, self.maximo)
+        return self.maximo
+    
+    def resumen(self):
+        return {
+            "llamadas": self.cuenta,
+            "errores": self.errores,
+            "media_ms": _ms(self.suma / self.cuenta) if self.cuenta else None,
+            "p50_ms": _ms(self.percentil(0.5)),
+            "p95_ms": _ms(self.percentil(0.95)),
+            "max_ms": _ms(self.maximo) if self.cuenta else None,
+            "total_s": round(self.suma, 3),
+            "cubetas": {_limite(l): n for l, n in zip(LIMITES_SEGUNDOS, self.cubetas)},
+        }
+
+
+def _ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 2)
+
+
+def _limite(limite):
+    return "+Inf" if limite == float("inf") else f"{limite:g}"
+
+
+def _fecha_texto(marca):
+    return time_mod.strftime("%Y-%m-%d %H:%M:%S", time_mod.localtime(marca))
+
+
+def _texto_etiquetas(etiquetas):
+    """(('metodo', 'get'), ...) -> 'metodo=get,...' para el JSON"""
+    return ",".join(f"{clave}={valor}" for clave, valor in etiquetas) or "total"
+
+
+def _prometheus_etiquetas(etiquetas, extra=()):
+    pares = [f'{clave}="{_escapar(valor)}"' for clave, valor in (*etiquetas, *extra)]
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escapar(texto):
+    return str(texto).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _es_control_streamlit(error):
+    """st.rerun() y st.stop() interrumpen la página con excepciones que no son errores"""
+    return type(error).__module__.startswith("streamlit")
+
+
+class RegistroMetricas:
+    """Histogramas y contadores por familia y etiquetas, seguros entre hilos"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+        self._medidores = {}
+        self._inicio = time_mod.time()
+    
+    def observar(self, familia, segundos, error=False, **etiquetas):
+        clave = (familia, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            if clave not in self._histogramas:
+                self._histogramas[clave] = Histograma()
+            self._histogramas[clave].observar(segundos, error)
+    
+    def contar(self, familia, cantidad=1, **etiquetas):
+        clave = (familia, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + cantidad
+    
+    def fijar(self, familia, valor, **etiquetas):
+        """Valor instantáneo (gauge), p. ej. la profundidad de una cola"""
+        with self._lock:
+            self._medidores[(familia, tuple(sorted(etiquetas.items())))] = valor
+    
+    @contextmanager
+    def medir(self, familia, **etiquetas):
+        """Mide la duración del bloque; si lanza una excepción cuenta como error"""
+        inicio = time_mod.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception as e:
+            error = not _es_control_streamlit(e)
+            raise
+        finally:
+            self.observar(familia, time_mod.perf_counter() - inicio, error, **etiquetas)
+    
+    def reiniciar(self):
+        with self._lock:
+            self._histogramas.clear()
+            self._contadores.clear()
+            self._medidores.clear()
+            self._inicio = time_mod.time()
+    
+    # -- exportación --
+    
+    def instantanea(self):
+        """Todas las métricas en un diccionario apto para JSON"""
+        with self._lock:
+            histogramas = sorted(self._histogramas.items())
+            contadores = sorted(self._contadores.items())
+            medidores = sorted(self._medidores.items())
+            inicio = self._inicio
+        
+        datos = {
+            "generado": _fecha_texto(time_mod.time()),
+            "desde": _fecha_texto(inicio),
+            "histogramas": {},
+            "contadores": {},
+            "medidores": {},
+            "caches": estadisticas_caches(),
+        }
+        for (familia, etiquetas), histograma in histogramas:
+            datos["histogramas"].setdefault(familia, {})[_texto_etiquetas(etiquetas)] = histograma.resumen()
+        for (familia, etiquetas), valor in contadores:
+            datos["contadores"].setdefault(familia, {})[_texto_etiquetas(etiquetas)] = valor
+        for (familia, etiquetas), valor in medidores:
+            datos["medidores"].setdefault(familia, {})[_texto_etiquetas(etiquetas)] = valor
+        return datos
+    
+    def prometheus(self):
+        """Histogramas, contadores y medidores en el formato de texto de Prometheus"""
+        with self._lock:
+            histogramas = sorted(self._histogramas.items())
+            contadores = sorted(self._contadores.items())
+            medidores = sorted(self._medidores.items())
+        
+        lineas = []
+        familia_actual = None
+        for (familia, etiquetas), h in histogramas:
+            if familia != familia_actual:
+                lineas += [f"# HELP {familia} {DESCRIPCIONES.get(familia, familia)}", f"# TYPE {familia} histogram"]
+                familia_actual = familia
+            acumulado = 0
+            for limite, cantidad in zip(LIMITES_SEGUNDOS, h.cubetas):
+                acumulado += cantidad
+                lineas.append(f"{familia}_bucket{_prometheus_etiquetas(etiquetas, [('le', _limite(limite))])} {acumulado}")
+            lineas.append(f"{familia}_sum{_prometheus_etiquetas(etiquetas)} {h.suma:.6f}")
+            lineas.append(f"{familia}_count{_prometheus_etiquetas(etiquetas)} {h.cuenta}")
+        
+        # Los aciertos y fallos de cache los lleva cada CacheSWR; se leen al exportar
+        for nombre, resumen in sorted(estadisticas_caches().items()):
+            for clave, resultado in _RESULTADOS_CACHE.items():
+                contadores.append(((CACHE, (("cache", nombre), ("resultado", resultado))), resumen.get(clave, 0)))
+        
+        for tipo, valores in (("counter", contadores), ("gauge", medidores)):
+            familia_actual = None
+            for (familia, etiquetas), valor in valores:
+                if familia != familia_actual:
+                    lineas += [f"# HELP {familia} {DESCRIPCIONES.get(familia, familia)}", f"# TYPE {familia} {tipo}"]
+                    familia_actual = familia
+                lineas.append(f"{familia}{_prometheus_etiquetas(etiquetas)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+# Registro compartido por todo el proceso
+metricas = RegistroMetricas()
+
+
+def instrumentar(funcion):
+    """Decorador para métodos de GoogleSheetsManager: mide cada llamada por nombre"""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with metricas.medir(MANAGER, metodo=funcion.__name__):
+            return funcion(*args, **kwargs)
+    return envoltura
+
+
+def medir_pagina(pagina):
+    """Mide una ejecución completa de una página: `with medir_pagina("inicio"): main()`"""
+    return metricas.medir(PAGINA, pagina=pagina)
@@ -0,0 +1,861 @@
+import re
+import sqlite3
+import threading
+import time as time_mod
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import date, timedelta
+from itertools import zip_longest
+
+import gspread
+from gspread.utils import numericise, numericise_all, rowcol_to_a1
+
+from utils.cache import CacheSWR
+from utils.esquema import DURACION_SERVICIOS, valor_tipado
+from utils.horarios import clave_duracion
+
+# Columnas de la hoja Citas, en el orden en que están en la hoja.
+# Las columnas nuevas van siempre al final (ver SheetsBackend._asegurar_columnas)
+COLUMNAS_CITAS = [
+    "ID", "Cliente", "Correo", "Teléfono", "Fecha_Cita",
+    "Hora_Cita", "Estado", "Hora_Inicio", "Hora_Fin",
+    "Servicio", "Notas", "Fecha_Creacion", "Ultima_Actualizacion",
+    "Barbero"
+]
+
+# Letras de columna usadas para lecturas parciales de la hoja Citas
+_COL_ID = rowcol_to_a1(1, COLUMNAS_CITAS.index("ID") + 1)[:-1]
+_COL_MARCA = rowcol_to_a1(1, COLUMNAS_CITAS.index("Ultima_Actualizacion") + 1)[:-1]
+_ULTIMA_COL = rowcol_to_a1(1, len(COLUMNAS_CITAS))[:-1]
+_COL_FECHA = rowcol_to_a1(1, COLUMNAS_CITAS.index("Fecha_Cita") + 1)[:-1]
+_COL_HORA = rowcol_to_a1(1, COLUMNAS_CITAS.index("Hora_Cita") + 1)[:-1]
+_COL_SERVICIO = rowcol_to_a1(1, COLUMNAS_CITAS.index("Servicio") + 1)[:-1]
+_COL_BARBERO = rowcol_to_a1(1, COLUMNAS_CITAS.index("Barbero") + 1)[:-1]
+
+MENSAJE_CONFLICTO = "El horario ya fue reservado por otra persona"
+
+# Contenido inicial de Horarios_Config INCLUYENDO DOMINGO
+CONFIG_INICIAL = [
+    ["Tipo", "Valor", "Descripcion"],
+    ["HORARIO_LUNES", "09:00-18:00", "Horario para Lunes"],
+    ["HORARIO_MARTES", "09:00-18:00", "Horario para Martes"],
+    ["HORARIO_MIERCOLES", "09:00-18:00", "Horario para Miércoles"],
+    ["HORARIO_JUEVES", "09:00-18:00", "Horario para Jueves"],
+    ["HORARIO_VIERNES", "09:00-18:00", "Horario para Viernes"],
+    ["HORARIO_SABADO", "09:00-18:00", "Horario para Sábado"],
+    ["HORARIO_DOMINGO", "09:00-14:00", "Horario para Domingo"],  # ✅ DOMINGO INCLUIDO
+    ["DURACION_CITA", "30", "Duración de cada cita en minutos"],
+    ["DIAS_NO_LABORABLES", "", "Días festivos separados por comas"],
+    ["DESCANSOS", "", "Descansos de todos: 13:00-14:00 o SABADO 12:00-12:30, separados por comas"],
+    ["HORARIOS_ESPECIALES", "", "Horario de fechas puntuales: 2024-12-24 09:00-13:00 o CERRADO, separados por comas"]
+] + [
+    [clave_duracion(servicio), str(minutos), f"Duración de {servicio} en minutos"]
+    for servicio, minutos in DURACION_SERVICIOS.items()
+]
+
+
+def _clave(valor):
+    """Normaliza un valor de celda para comparar lecturas completas y parciales"""
+    return str(numericise(str(valor).strip()))
+
+
+def _mismo_horario(cita, otra):
+    """Criterio de choque por defecto: misma fecha, hora y barbero"""
+    return (_clave(cita.get("Fecha_Cita", "")) == _clave(otra.get("Fecha_Cita", ""))
+            and _clave(cita.get("Hora_Cita", "")) == _clave(otra.get("Hora_Cita", ""))
+            and str(cita.get("Barbero", "")).strip() == str(otra.get("Barbero", "")).strip())
+
+
+def _clave_cita(cita):
+    """(ID, fecha, hora) de una cita, normalizados para compararla con una fila de la hoja"""
+    return (_clave(cita.get("ID", "")), valor_tipado("Fecha_Cita", cita.get("Fecha_Cita", "")),
+            valor_tipado("Hora_Cita", cita.get("Hora_Cita", "")))
+
+
+def _reservas_leidas(horarios, servicios, barberos):
+    """Citas (Fecha_Cita, Hora_Cita, Servicio, Barbero) de rangos leídos en un mismo batch_get
+    
+    La API recorta las celdas vacías del final, así que las columnas Servicio
+    y Barbero pueden venir más cortas que la de horarios.
+    """
+    def columna(filas):
+        valores = [fila[0] if fila else "" for fila in filas]
+        return valores + [""] * (len(horarios) - len(valores))
+    
+    return [
+        {"Fecha_Cita": (list(valores) + [""])[0], "Hora_Cita": (list(valores) + ["", ""])[1],
+         "Servicio": servicio, "Barbero": barbero}
+        for valores, servicio, barbero in zip(horarios, columna(servicios), columna(barberos))
+    ]
+
+
+class ResultadoReserva:
+    """Resultado de intentar reservar un horario; es verdadero solo si la cita quedó guardada
+    
+    `conflicto` indica que el horario ya estaba tomado (o lo tomó otra sesión
+    al mismo tiempo) y `fila` es la fila de la hoja donde quedó la cita, si se conoce.
+    `barbero` es el barbero que atenderá la cita (el elegido o el asignado).
+    """
+    
+    def __init__(self, guardada, cita_id=None, fila=None, conflicto=False, mensaje=""):
+        self.guardada = guardada
+        self.cita_id = cita_id
+        self.fila = fila
+        self.conflicto = conflicto
+        self.mensaje = mensaje
+        self.barbero = ""
+    
+    def __bool__(self):
+        return self.guardada
+    
+    def __repr__(self):
+        return (f"ResultadoReserva(guardada={self.guardada}, cita_id={self.cita_id}, "
+                f"fila={self.fila}, conflicto={self.conflicto})")
+    
+    @classmethod
+    def ocupado(cls, cita_id=None):
+        return cls(False, cita_id, conflicto=True, mensaje=MENSAJE_CONFLICTO)
+
+
+class StorageBackend(ABC):
+    """Interfaz común de los motores de almacenamiento de citas y configuración"""
+    
+    # True si el backend resuelve consultas por fecha o ID con índices propios,
+    # sin pasar por el DataFrame completo de citas
+    consultas_indexadas = False
+    
+    # Spreadsheet de Google del backend (None si es solo local)
+    spreadsheet = None
+    
+    @abstractmethod
+    def leer_citas(self):
+        """Devuelve todas las citas como lista de diccionarios"""
+    
+    @abstractmethod
+    def agregar_cita(self, fila):
+        """Agrega una cita (lista de valores en el orden de COLUMNAS_CITAS)
+        
+        Devuelve la fila de la hoja donde quedó, o None si no aplica.
+        """
+    
+    def reservar_cita(self, fila, choca=None):
+        """Agrega la cita solo si no choca con otra ya guardada; devuelve un ResultadoReserva
+        
+        `choca(cita, otra)` recibe dos diccionarios con Fecha_Cita, Hora_Cita,
+        Servicio y Barbero; por defecto chocan si coinciden fecha, hora y barbero.
+        Esta versión comprueba y después agrega, así que depende del lock por
+        fecha de GoogleSheetsManager para no reservar dos veces el mismo horario.
+        """
+        choca = choca or _mismo_horario
+        cita = dict(zip(COLUMNAS_CITAS, fila))
+        fecha = str(cita["Fecha_Cita"])
+        if any(choca(cita, {"Fecha_Cita": fecha, "Hora_Cita": hora, "Servicio": servicio, "Barbero": barbero})
+               for barbero, hora, servicio in self.reservas_de(fecha)):
+            return ResultadoReserva.ocupado(cita["ID"])
+        return ResultadoReserva(True, cita["ID"], fila=self.agregar_cita(fila))
+    
+    @abstractmethod
+    def actualizar_cita(self, cita_id, cambios, fila=None):
+        """Actualiza las columnas indicadas en `cambios` de la cita con ese ID
+        
+        `fila` es la fila de la hoja donde debería estar la cita, si ya se conoce;
+        es solo una pista, si el ID no coincide la cita se busca por ID.
+        """
+    
+    def actualizar_citas(self, lote):
+        """Aplica varias actualizaciones (cita_id, cambios, fila) y devuelve los IDs actualizados"""
+        return [cita_id for cita_id, cambios, fila in lote if self.actualizar_cita(cita_id, cambios, fila)]
+    
+    @abstractmethod
+    def eliminar_citas(self, citas):
+        """Borra las citas (diccionarios con ID, Fecha_Cita y Hora_Cita), p. ej. tras archivarlas
+        
+        Devuelve cuántas borró. Si un ID se repite en la hoja solo se borra la
+        fila que coincide también en fecha y hora.
+        """
+    
+    def leer_cambios(self):
+        """Devuelve las citas nuevas o modificadas desde la última lectura
+        
+        Lista de (posición, cita), donde posición es el índice 0 de la cita
+        dentro de la hoja (fila - 2). Devuelve None cuando hace falta una
+        lectura completa con leer_citas().
+        """
+        return None
+    
+    def citas_por_fecha(self, fecha_str):
+        """Devuelve las citas de una fecha (YYYY-MM-DD)"""
+        return [c for c in self.leer_citas() if str(c.get("Fecha_Cita", "")) == fecha_str]
+    
+    def ids_existentes(self, ids):
+        """Subconjunto de `ids` (textos) que corresponde a alguna cita guardada"""
+        return {str(c.get("ID", "")).strip() for c in self.leer_citas()} & set(ids)
+    
+    def horas_ocupadas(self, fecha_str):
+        """Devuelve las horas ya reservadas en una fecha"""
+        return [str(c.get("Hora_Cita", "")) for c in self.citas_por_fecha(fecha_str)]
+    
+    def reservas_de(self, fecha_str):
+        """(barbero, hora, servicio) de las citas de una fecha; barbero "" si la cita no tiene"""
+        return [(str(c.get("Barbero", "") or "").strip(), str(c.get("Hora_Cita", "")), str(c.get("Servicio", "")))
+                for c in self.citas_por_fecha(fecha_str)]
+    
+    def reservas_entre(self, desde_str, hasta_str):
+        """(fecha, barbero, hora, servicio) de las citas entre dos fechas AAAA-MM-DD, incluidas"""
+        return [(str(c.get("Fecha_Cita", "")), str(c.get("Barbero", "") or "").strip(),
+                 str(c.get("Hora_Cita", "")), str(c.get("Servicio", "")))
+                for c in self.leer_citas() if desde_str <= str(c.get("Fecha_Cita", "")) <= hasta_str]
+    
+    @abstractmethod
+    def leer_configuracion(self):
+        """Devuelve las filas de configuración como diccionarios Tipo/Valor/Descripcion"""
+    
+    @abstractmethod
+    def escribir_configuracion(self, filas):
+        """Reemplaza la configuración por `filas` ([Tipo, Valor, Descripcion], sin encabezado)"""
+    
+    def invalidar(self):
+        """Descarta cualquier estado en cache del backend"""
+        pass
+
+
+class SheetsBackend(StorageBackend):
+    """Almacenamiento directo en la hoja de cálculo de Google Sheets"""
+    
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self.citas_sheet = None
+        self.horarios_config_sheet = None
+        # Filas ocupadas en Horarios_Config (encabezado incluido) en la última lectura/escritura
+        self._filas_config = None
+        # Estado de la sincronización incremental: ID, Ultima_Actualizacion y
+        # Fecha_Cita de cada fila de Citas tal como se leyeron por última vez
+        self._encabezados = list(COLUMNAS_CITAS)
+        self._sync_ids = None
+        self._sync_marcas = None
+        self._sync_fechas = None
+        # Los refrescos incrementales revisan las citas de hace hasta estos días en adelante
+        self.dias_revision = 7
+        # La recarga de fondo y las escrituras de las sesiones tocan ese estado a la vez
+        self._lock_sync = threading.Lock()
+        self._initialize_sheet_references()
+    
+    def _initialize_sheet_references(self):
+        """Inicializa las referencias a las hojas existentes"""
+        try:
+            # Hoja de CITAS (ya existe en tu estructura)
+            self.citas_sheet = self.spreadsheet.worksheet("Citas")
+            
+            # Hoja de CONFIGURACIÓN de horarios (ya existe en tu estructura)
+            self.horarios_config_sheet = self.spreadsheet.worksheet("Horarios_Config")
+            
+            self._asegurar_columnas()
+        
+        except gspread.WorksheetNotFound as e:
+            print(f"❌ No se encontró una hoja necesaria: {e}")
+            # Intentar crear las hojas si no existen
+            self._create_missing_sheets()
+    
+    def _asegurar_columnas(self):
+        """Agrega al final de Citas las columnas de COLUMNAS_CITAS que una hoja anterior no tiene"""
+        encabezados = self.citas_sheet.row_values(1)
+        if not encabezados or len(encabezados) >= len(COLUMNAS_CITAS):
+            return
+        if encabezados != COLUMNAS_CITAS[:len(encabezados)]:
+            print(f"⚠️ Los encabezados de Citas no coinciden con los esperados: {encabezados}")
+            return
+        
+        faltantes = COLUMNAS_CITAS[len(encabezados):]
+        if self.citas_sheet.col_count < len(COLUMNAS_CITAS):
+            self.citas_sheet.resize(cols=len(COLUMNAS_CITAS))
+        self.citas_sheet.update(range_name=rowcol_to_a1(1, len(encabezados) + 1), values=[faltantes])
+        print(f"✅ Columnas agregadas a la hoja Citas: {', '.join(faltantes)}")
+    
+    def _create_missing_sheets(self):
+        """Crea las hojas necesarias si no existen"""
+        try:
+            # Verificar y crear hoja Citas si no existe
+            try:
+                self.citas_sheet = self.spreadsheet.worksheet("Citas")
+            except gspread.WorksheetNotFound:
+                self.citas_sheet = self.spreadsheet.add_worksheet(
+                    title="Citas",
+                    rows="1000",
+                    cols=str(len(COLUMNAS_CITAS))
+                )
+                self.citas_sheet.update(range_name="A1", values=[COLUMNAS_CITAS])
+            
+            # Verificar y crear hoja Horarios_Config si no existe
+            try:
+                self.horarios_config_sheet = self.spreadsheet.worksheet("Horarios_Config")
+            except gspread.WorksheetNotFound:
+                self.horarios_config_sheet = self.spreadsheet.add_worksheet(
+                    title="Horarios_Config",
+                    rows="50",
+                    cols="3"
+                )
+                # Todo el bloque en una sola petición
+                self.horarios_config_sheet.update(range_name="A1", values=CONFIG_INICIAL)
+                self._filas_config = len(CONFIG_INICIAL)
+        
+        except Exception as e:
+            print(f"❌ Error al crear hojas: {e}")
+    
+    def leer_citas(self):
+        data = self.citas_sheet.get_all_records()
+        if data:
+            self._encabezados = list(data[0].keys())
+        with self._lock_sync:
+            self._sync_ids = [_clave(c.get("ID", "")) for c in data]
+            self._sync_marcas = [_clave(c.get("Ultima_Actualizacion", "")) for c in data]
+            self._sync_fechas = [_clave(c.get("Fecha_Cita", "")) for c in data]
+        return data
+    
+    def leer_cambios(self):
+        if self._sync_ids is None:
+            return None
+        
+        # Solo se revisan las filas desde la primera cita reciente o futura: las
+        # citas viejas ya no cambian, y si alguien las edita a mano el cambio
+        # llega con la próxima lectura completa. Se lee al menos la última fila
+        # conocida, así el rango nunca empieza fuera de la hoja
+        limite = _clave(f"{date.today() - timedelta(days=self.dias_revision):%Y-%m-%d}")
+        with self._lock_sync:
+            if self._sync_ids is None:
+                return None
+            conocidas = len(self._sync_ids)
+            inicio = next((pos for pos, fecha in enumerate(self._sync_fechas) if str(fecha) >= limite), conocidas)
+            inicio = min(inicio, max(conocidas - 1, 0))
+        
+        # Una petición para las columnas ID y Ultima_Actualizacion de esas filas
+        columna_ids, columna_marcas = self.citas_sheet.batch_get(
+            [f"{_COL_ID}{inicio + 2}:{_COL_ID}", f"{_COL_MARCA}{inicio + 2}:{_COL_MARCA}"]
+        )
+        leidas = max(len(columna_ids), len(columna_marcas))
+        total = inicio + leidas
+        ids = [_clave(f[0]) if f else "" for f in columna_ids] + [""] * (leidas - len(columna_ids))
+        marcas = [_clave(f[0]) if f else "" for f in columna_marcas] + [""] * (leidas - len(columna_marcas))
+        
+        with self._lock_sync:
+            if self._sync_ids is None or len(self._sync_ids) < conocidas:
+                return None
+            # Si se borraron o movieron filas, las posiciones ya no son válidas
+            if total < conocidas or ids[:conocidas - inicio] != self._sync_ids[inicio:conocidas]:
+                return None
+            modificadas = [pos for pos in range(inicio, conocidas) if marcas[pos - inicio] != self._sync_marcas[pos]]
+            ids = self._sync_ids[:inicio] + ids
+            marcas = self._sync_marcas[:inicio] + marcas
+            fechas = self._sync_fechas[:conocidas] + [""] * (total - conocidas)
+        
+        rangos = [f"A{pos + 2}:{_ULTIMA_COL}{pos + 2}" for pos in modificadas]
+        if total > conocidas:
+            rangos.append(f"A{conocidas + 2}:{_ULTIMA_COL}{total + 1}")
+        
+        cambios = []
+        if rangos:
+            # Una segunda petición para las filas modificadas y la cola nueva
+            bloques = self.citas_sheet.batch_get(rangos)
+            for pos, bloque in zip(modificadas, bloques):
+                cambios.append((pos, self._a_registro(bloque[0] if bloque else [])))
+            if total > conocidas:
+                cola = list(bloques[-1]) + [[]] * (total - conocidas - len(bloques[-1]))
+                cambios.extend((conocidas + i, self._a_registro(fila)) for i, fila in enumerate(cola))
+        
+        for pos, cita in cambios:
+            fechas[pos] = _clave(cita.get("Fecha_Cita", ""))
+        with self._lock_sync:
+            self._sync_ids = ids
+            self._sync_marcas = marcas
+            self._sync_fechas = fechas
+        return cambios
+    
+    def _a_registro(self, fila):
+        """Convierte una fila cruda en diccionario, igual que get_all_records"""
+        ancho = len(self._encabezados)
+        return dict(zip(self._encabezados, numericise_all((list(fila) + [""] * ancho)[:ancho])))
+    
+    def invalidar(self):
+        with self._lock_sync:
+            self._sync_ids = None
+            self._sync_marcas = None
+            self._sync_fechas = None
+    
+    def agregar_cita(self, fila):
+        respuesta = self.citas_sheet.append_row(fila)
+        
+        # La respuesta indica el rango escrito, p. ej. "Citas!A152:M152"
+        rango = (respuesta or {}).get("updates", {}).get("updatedRange", "")
+        coincidencia = re.search(r"![A-Z]+(\d+)", rango)
+        if not coincidencia:
+            return None
+        numero_fila = int(coincidencia.group(1))
+        
+        # Si la cita quedó justo al final de lo ya sincronizado, no hace falta volver a leerla
+        with self._lock_sync:
+            if self._sync_ids is not None and numero_fila - 2 == len(self._sync_ids):
+                self._sync_ids.append(_clave(fila[COLUMNAS_CITAS.index("ID")]))
+                self._sync_marcas.append(_clave(fila[COLUMNAS_CITAS.index("Ultima_Actualizacion")]))
+                self._sync_fechas.append(_clave(fila[COLUMNAS_CITAS.index("Fecha_Cita")]))
+        return numero_fila
+    
+    def reservar_cita(self, fila, choca=None):
+        choca = choca or _mismo_horario
+        cita = dict(zip(COLUMNAS_CITAS, fila))
+        
+        # 1) Justo antes de escribir, se leen las citas que pueden ser de ese día
+        reservas, primera_nueva = self._reservas_del_dia(cita["Fecha_Cita"])
+        if any(choca(cita, otra) for otra in reservas):
+            return ResultadoReserva.ocupado(cita["ID"])
+        
+        # 2) Escritura
+        numero_fila = self.agregar_cita(fila)
+        if numero_fila is None:
+            return ResultadoReserva(True, cita["ID"])
+        
+        # 3) Si otra sesión agregó filas entre la lectura y la escritura, se releen
+        # solo esas filas. Ante un empate gana la cita que quedó en la fila anterior
+        if numero_fila > primera_nueva:
+            intermedias, servicios, barberos = self.citas_sheet.batch_get([
+                f"{_COL_FECHA}{primera_nueva}:{_COL_HORA}{numero_fila - 1}",
+                f"{_COL_SERVICIO}{primera_nueva}:{_COL_SERVICIO}{numero_fila - 1}",
+                f"{_COL_BARBERO}{primera_nueva}:{_COL_BARBERO}{numero_fila - 1}",
+            ])
+            if any(choca(cita, otra) for otra in _reservas_leidas(intermedias, servicios, barberos)):
+                self.actualizar_cita(cita["ID"], {
+                    "Estado": "Cancelada",
+                    "Notas": f"{cita['Notas']} [Reserva duplicada: horario ya tomado]".strip(),
+                    "Ultima_Actualizacion": cita["Ultima_Actualizacion"],
+                }, numero_fila)
+                return ResultadoReserva(False, cita["ID"], fila=numero_fila, conflicto=True,
+                                        mensaje=MENSAJE_CONFLICTO)
+        return ResultadoReserva(True, cita["ID"], fila=numero_fila)
+    
+    def _reservas_del_dia(self, fecha):
+        """Citas que pueden ocupar `fecha` y primera fila que no se leyó
+        
+        Con una sincronización previa se leen, en una sola petición, las filas
+        que entonces tenían esa fecha y todas las agregadas después. Si no la
+        hay, o si alguna de esas filas ya no tiene el mismo ID (se borraron o
+        movieron filas), se leen completas las columnas Fecha_Cita, Hora_Cita,
+        Servicio y Barbero.
+        """
+        clave = _clave(fecha)
+        with self._lock_sync:
+            conocidas = len(self._sync_ids) if self._sync_fechas is not None else None
+            if conocidas is not None:
+                posiciones = [pos for pos, otra in enumerate(self._sync_fechas) if otra == clave]
+                ids = [self._sync_ids[pos] for pos in posiciones]
+        
+        if conocidas is not None:
+            try:
+                bloques = self.citas_sheet.batch_get(
+                    [f"A{pos + 2}:{_ULTIMA_COL}{pos + 2}" for pos in posiciones]
+                    + [f"A{conocidas + 2}:{_ULTIMA_COL}"]
+                )
+            except gspread.exceptions.APIError:
+                # P. ej. la cola empieza justo después de la última fila de la cuadrícula
+                bloques = None
+            if bloques is not None:
+                filas = [bloque[0] if bloque else [] for bloque in bloques[:-1]]
+                if all(_clave((list(fila) + [""])[0]) == cita_id for fila, cita_id in zip(filas, ids)):
+                    nuevas = list(bloques[-1])
+                    reservas = [self._a_registro(fila) for fila in filas + nuevas]
+                    return reservas, conocidas + 2 + len(nuevas)
+        
+        previas, servicios, barberos = self.citas_sheet.batch_get([
+            f"{_COL_FECHA}2:{_COL_HORA}", f"{_COL_SERVICIO}2:{_COL_SERVICIO}", f"{_COL_BARBERO}2:{_COL_BARBERO}"
+        ])
+        return _reservas_leidas(previas, servicios, barberos), len(previas) + 2
+    
+    def actualizar_cita(self, cita_id, cambios, fila=None):
+        return bool(self.actualizar_citas([(cita_id, cambios, fila)]))
+    
+    def actualizar_citas(self, lote):
+        # Una fila anotada queda corrida si alguien borró o insertó filas a mano en
+        # la hoja: se lee la celda ID de cada fila anotada, todas en una sola petición
+        anotadas = [(str(cita_id), fila) for cita_id, _, fila in lote if fila is not None]
+        verificadas = set()
+        if anotadas:
+            celdas = self.citas_sheet.batch_get([f"{_COL_ID}{fila}" for _, fila in anotadas])
+            verificadas = {
+                (cita_id, fila) for (cita_id, fila), valores in zip(anotadas, celdas)
+                if valores and valores[0] and _clave(valores[0][0]) == _clave(cita_id)
+            }
+        
+        # Las filas que no se conocen o no coinciden se buscan todas con una sola
+        # lectura de la columna ID
+        sin_fila = [str(cita_id) for cita_id, _, fila in lote if (str(cita_id), fila) not in verificadas]
+        filas_encontradas = self._buscar_filas(sin_fila) if sin_fila else {}
+        
+        rangos = []
+        aplicadas = []
+        for cita_id, cambios, fila in lote:
+            if (str(cita_id), fila) not in verificadas:
+                fila = filas_encontradas.get(str(cita_id))
+            if fila is None or not cambios:
+                continue
+            rangos.extend(
+                {"range": rowcol_to_a1(fila, COLUMNAS_CITAS.index(columna) + 1), "values": [[valor]]}
+                for columna, valor in cambios.items()
+            )
+            aplicadas.append((cita_id, cambios, fila))
+        if not rangos:
+            return []
+        
+        # Todas las celdas de todas las citas en una sola petición
+        self.citas_sheet.batch_update(rangos)
+        
+        # El cambio propio no debe contarse como modificación en la próxima sincronización
+        with self._lock_sync:
+            for _, cambios, fila in aplicadas:
+                pos = fila - 2
+                if self._sync_marcas is not None and 0 <= pos < len(self._sync_marcas) and "Ultima_Actualizacion" in cambios:
+                    self._sync_marcas[pos] = _clave(cambios["Ultima_Actualizacion"])
+        return [cita_id for cita_id, _, _ in aplicadas]
+    
+    def eliminar_citas(self, citas):
+        # Las filas se ubican con una lectura fresca de ID, fecha y hora y se borran
+        # por bloques contiguos en una sola petición (batchUpdate es atómico). Los
+        # bloques van de abajo hacia arriba para que borrar uno no mueva los que
+        # faltan; las citas agregadas mientras tanto van al final y no se tocan
+        filas = self._filas_de_citas(citas)
+        bloques = []
+        for fila in filas:
+            if bloques and bloques[-1][1] == fila - 1:
+                bloques[-1][1] = fila
+            else:
+                bloques.append([fila, fila])
+        if bloques:
+            self.spreadsheet.batch_update({"requests": [
+                {"deleteDimension": {"range": {
+                    "sheetId": self.citas_sheet.id, "dimension": "ROWS",
+                    "startIndex": inicio - 1, "endIndex": fin,
+                }}}
+                for inicio, fin in reversed(bloques)
+            ]})
+        # Las posiciones cambiaron: la próxima lectura tiene que ser completa
+        self.invalidar()
+        return len(filas)
+    
+    def _filas_de_citas(self, citas):
+        """Filas de la hoja que coinciden en ID, fecha y hora con alguna de `citas`
+        
+        Si la hoja no tiene exactamente tantas filas iguales como citas se
+        buscan (p. ej. un ID repetido a mano con la misma fecha y hora), esas
+        citas no se tocan y se avisa.
+        """
+        buscadas = Counter(_clave_cita(cita) for cita in citas)
+        ids, horarios = self.citas_sheet.batch_get([f"{_COL_ID}2:{_COL_ID}", f"{_COL_FECHA}2:{_COL_HORA}"])
+        encontradas = {}
+        for fila, (valor_id, valores) in enumerate(zip_longest(ids, horarios, fillvalue=[]), start=2):
+            valores = list(valores) + ["", ""]
+            clave = _clave_cita({"ID": (list(valor_id) + [""])[0], "Fecha_Cita": valores[0], "Hora_Cita": valores[1]})
+            if clave in buscadas:
+                encontradas.setdefault(clave, []).append(fila)
+        
+        filas = []
+        for clave, cantidad in buscadas.items():
+            coincidentes = encontradas.get(clave, [])
+            if len(coincidentes) == cantidad:
+                filas.extend(coincidentes)
+            else:
+                print(f"⚠️ La cita {clave[0]} no se borró de Citas: "
+                      f"{len(coincidentes)} filas coinciden en ID, fecha y hora")
+        return sorted(filas)
+    
+    def _buscar_filas(self, ids_buscados):
+        """Busca las filas de varias citas leyendo solo la columna ID"""
+        ids_buscados = set(ids_buscados)
+        ids = self.citas_sheet.col_values(COLUMNAS_CITAS.index("ID") + 1)
+        return {
+            str(valor).strip(): fila
+            for fila, valor in enumerate(ids[1:], start=2)
+            if str(valor).strip() in ids_buscados
+        }
+    
+    def leer_configuracion(self):
+        data = self.horarios_config_sheet.get_all_records()
+        self._filas_config = len(data) + 1
+        return data
+    
+    def escribir_configuracion(self, filas):
+        # Reemplaza el bloque completo con un único update; las filas sobrantes
+        # de la versión anterior se sobrescriben con celdas vacías
+        bloque = [CONFIG_INICIAL[0]] + [list(fila) for fila in filas]
+        sobrantes = (self._filas_config or 0) - len(bloque)
+        bloque += [["", "", ""] for _ in range(max(sobrantes, 0))]
+        self.horarios_config_sheet.update(range_name="A1", values=bloque)
+        self._filas_config = len(filas) + 1
+
+
+class SQLiteBackend(StorageBackend):
+    """Almacenamiento local en SQLite con índices por ID y por (Fecha_Cita, Hora_Cita)"""
+    
+    consultas_indexadas = True
+    
+    def __init__(self, ruta="citas.db"):
+        self.ruta = ruta
+        # Streamlit atiende cada sesión en su propio hilo
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._crear_esquema()
+    
+    def _crear_esquema(self):
+        """Crea las tablas e índices si no existen
+        
+        El ID se guarda como texto y sin restricción de unicidad, igual que en la
+        hoja: puede haber IDs repetidos o que no son números, y ninguna fila se
+        pierde al sincronizar. La clave de cada fila es el rowid de SQLite.
+        """
+        columnas = ", ".join(f'"{c}" TEXT' for c in COLUMNAS_CITAS)
+        with self._lock, self._conn:
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS citas ({columnas})')
+            info = {fila[1]: fila for fila in self._conn.execute("PRAGMA table_info(citas)")}
+            if info["ID"][5]:
+                # Bases anteriores con "ID" INTEGER PRIMARY KEY: se copian a la tabla nueva
+                self._conn.execute("ALTER TABLE citas RENAME TO citas_anterior")
+                self._conn.execute(f'CREATE TABLE citas ({columnas})')
+                comunes = ", ".join(f'"{c}"' for c in COLUMNAS_CITAS if c in info)
+                self._conn.execute(
+                    f'INSERT INTO citas ({comunes}) SELECT {comunes} FROM citas_anterior ORDER BY rowid'
+                )
+                self._conn.execute("DROP TABLE citas_anterior")
+            # Bases creadas antes de que existieran las últimas columnas de COLUMNAS_CITAS
+            existentes = {fila[1] for fila in self._conn.execute("PRAGMA table_info(citas)")}
+            for columna in COLUMNAS_CITAS:
+                if columna not in existentes:
+                    self._conn.execute(f'ALTER TABLE citas ADD COLUMN "{columna}" TEXT DEFAULT \'\'')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_citas_id ON citas ("ID")')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_citas_fecha_hora ON citas ("Fecha_Cita", "Hora_Cita")'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS configuracion ("Tipo" TEXT PRIMARY KEY, "Valor" TEXT, "Descripcion" TEXT)'
+            )
+            vacia = self._conn.execute("SELECT COUNT(*) FROM configuracion").fetchone()[0] == 0
+        if vacia:
+            self.escribir_configuracion(CONFIG_INICIAL[1:])
+    
+    def _consultar(self, sql, parametros=()):
+        with self._lock:
+            return [dict(fila) for fila in self._conn.execute(sql, parametros).fetchall()]
+    
+    def leer_citas(self):
+        return self._consultar("SELECT * FROM citas ORDER BY rowid")
+    
+    def agregar_cita(self, fila):
+        self.agregar_citas([fila])
+        return None
+    
+    def agregar_citas(self, filas):
+        """Inserta varias citas en una sola transacción"""
+        marcadores = ", ".join("?" for _ in COLUMNAS_CITAS)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO citas VALUES ({marcadores})",
+                [[str(v).strip() for v in fila[:1]] + [str(v) for v in fila[1:]] for fila in filas]
+            )
+    
+    def reemplazar_citas(self, citas):
+        """Reemplaza todas las citas por `citas` (lista de diccionarios)"""
+        filas = [
+            [c.get(col, "") for col in COLUMNAS_CITAS]
+            for c in citas
+            if str(c.get("ID", "")).strip() != ""
+        ]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM citas")
+            self.agregar_citas(filas)
+    
+    def actualizar_cita(self, cita_id, cambios, fila=None):
+        return bool(self.actualizar_citas([(cita_id, cambios, fila)]))
+    
+    def actualizar_citas(self, lote):
+        aplicadas = []
+        # Todo el lote en una sola transacción
+        with self._lock, self._conn:
+            for cita_id, cambios, _ in lote:
+                if not cambios:
+                    continue
+                asignaciones = ", ".join(f'"{columna}" = ?' for columna in cambios)
+                cursor = self._conn.execute(
+                    f'UPDATE citas SET {asignaciones} WHERE "ID" = ?',
+                    [str(v) for v in cambios.values()] + [str(cita_id).strip()]
+                )
+                if cursor.rowcount > 0:
+                    aplicadas.append(cita_id)
+        return aplicadas
+    
+    def eliminar_citas(self, citas):
+        # Con IDs repetidos solo se borra la fila que coincide también en fecha y hora
+        with self._lock, self._conn:
+            return self._conn.executemany(
+                'DELETE FROM citas WHERE "ID" = ? AND "Fecha_Cita" = ? AND "Hora_Cita" = ?',
+                [[str(cita["ID"]).strip(), str(cita["Fecha_Cita"]), str(cita["Hora_Cita"])] for cita in citas]
+            ).rowcount
+    
+    def reservar_cita(self, fila, choca=None):
+        choca = choca or _mismo_horario
+        cita = dict(zip(COLUMNAS_CITAS, fila))
+        # Comprobación e inserción bajo el mismo lock y la misma transacción
+        with self._lock:
+            del_dia = self._conn.execute(
+                'SELECT "Fecha_Cita", "Hora_Cita", "Servicio", COALESCE("Barbero", \'\') AS "Barbero" '
+                'FROM citas WHERE "Fecha_Cita" = ?',
+                (str(cita["Fecha_Cita"]),)
+            ).fetchall()
+            if any(choca(cita, dict(otra)) for otra in del_dia):
+                return ResultadoReserva.ocupado(cita["ID"])
+            self.agregar_citas([fila])
+        return ResultadoReserva(True, cita["ID"])
+    
+    def citas_por_fecha(self, fecha_str):
+        return self._consultar(
+            'SELECT * FROM citas WHERE "Fecha_Cita" = ? ORDER BY "Hora_Cita"', (fecha_str,)
+        )
+    
+    def ids_existentes(self, ids):
+        ids = [str(cita_id).strip() for cita_id in ids]
+        if not ids:
+            return set()
+        marcadores = ", ".join("?" for _ in ids)
+        filas = self._consultar(f'SELECT DISTINCT "ID" FROM citas WHERE "ID" IN ({marcadores})', ids)
+        return {fila["ID"] for fila in filas}
+    
+    def horas_ocupadas(self, fecha_str):
+        filas = self._consultar('SELECT "Hora_Cita" FROM citas WHERE "Fecha_Cita" = ?', (fecha_str,))
+        return [f["Hora_Cita"] for f in filas]
+    
+    def reservas_de(self, fecha_str):
+        filas = self._consultar(
+            'SELECT COALESCE("Barbero", \'\') AS "Barbero", "Hora_Cita", "Servicio" FROM citas WHERE "Fecha_Cita" = ?',
+            (fecha_str,)
+        )
+        return [(f["Barbero"].strip(), f["Hora_Cita"], f["Servicio"]) for f in filas]
+    
+    def reservas_entre(self, desde_str, hasta_str):
+        # Una sola consulta sobre el índice (Fecha_Cita, Hora_Cita) para todo el rango
+        filas = self._consultar(
+            'SELECT "Fecha_Cita", COALESCE("Barbero", \'\') AS "Barbero", "Hora_Cita", "Servicio" '
+            'FROM citas WHERE "Fecha_Cita" BETWEEN ? AND ?',
+            (desde_str, hasta_str)
+        )
+        return [(f["Fecha_Cita"], f["Barbero"].strip(), f["Hora_Cita"], f["Servicio"]) for f in filas]
+    
+    def leer_configuracion(self):
+        return self._consultar("SELECT * FROM configuracion ORDER BY rowid")
+    
+    def escribir_configuracion(self, filas):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM configuracion")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO configuracion VALUES (?, ?, ?)",
+                [[str(v) for v in fila] for fila in filas]
+            )
+
+
+class WriteThroughBackend(StorageBackend):
+    """SQLite local como cache de escritura directa delante de Google Sheets
+    
+    Las lecturas salen de SQLite (con índices); las escrituras van primero a la
+    hoja y, solo si tienen éxito, a SQLite. La copia local se recarga desde la
+    hoja cada `ttl` segundos, en segundo plano mientras no supere
+    `max_obsolescencia`, o al invalidarla.
+    """
+    
+    consultas_indexadas = True
+    
+    def __init__(self, remoto, local, ttl=300, max_obsolescencia=1800, timeout=15):
+        self.remoto = remoto
+        self.local = local
+        self._lock = threading.Lock()
+        self._sincronizacion = CacheSWR(
+            self.sincronizar, ttl=ttl, max_obsolescencia=max_obsolescencia,
+            timeout=timeout, nombre="sqlite+sheets"
+        )
+    
+    def sincronizar(self):
+        """Recarga la copia local completa desde la hoja"""
+        with self._lock:
+            self.local.reemplazar_citas(self.remoto.leer_citas())
+            self.local.escribir_configuracion([
+                [f.get("Tipo", ""), f.get("Valor", ""), f.get("Descripcion", "")]
+                for f in self.remoto.leer_configuracion()
+            ])
+            return time_mod.monotonic()
+    
+    @property
+    def spreadsheet(self):
+        return self.remoto.spreadsheet
+    
+    def _asegurar_sincronizado(self):
+        self._sincronizacion.obtener()
+    
+    def invalidar(self):
+        self._sincronizacion.invalidar()
+    
+    def leer_citas(self):
+        self._asegurar_sincronizado()
+        return self.local.leer_citas()
+    
+    def agregar_cita(self, fila):
+        self.remoto.agregar_cita(fila)
+        self.local.agregar_cita(fila)
+        return None
+    
+    def reservar_cita(self, fila, choca=None):
+        # La hoja decide; la copia local puede estar desactualizada
+        resultado = self.remoto.reservar_cita(fila, choca)
+        if resultado:
+            self.local.agregar_cita(fila)
+        resultado.fila = None
+        return resultado
+    
+    def actualizar_cita(self, cita_id, cambios, fila=None):
+        if not self.remoto.actualizar_cita(cita_id, cambios, fila):
+            return False
+        self.local.actualizar_cita(cita_id, cambios)
+        return True
+    
+    def actualizar_citas(self, lote):
+        aplicadas = self.remoto.actualizar_citas(lote)
+        hechas = set(map(str, aplicadas))
+        self.local.actualizar_citas([
+            (cita_id, cambios, None) for cita_id, cambios, _ in lote if str(cita_id) in hechas
+        ])
+        return aplicadas
+    
+    def eliminar_citas(self, citas):
+        citas = list(citas)
+        eliminadas = self.remoto.eliminar_citas(citas)
+        self.local.eliminar_citas(citas)
+        return eliminadas
+    
+    def citas_por_fecha(self, fecha_str):
+        self._asegurar_sincronizado()
+        return self.local.citas_por_fecha(fecha_str)
+    
+    def ids_existentes(self, ids):
+        self._asegurar_sincronizado()
+        return self.local.ids_existentes(ids)
+    
+    def horas_ocupadas(self, fecha_str):
+        self._asegurar_sincronizado()
+        return self.local.horas_ocupadas(fecha_str)
+    
+    def reservas_de(self, fecha_str):
+        self._asegurar_sincronizado()
+        return self.local.reservas_de(fecha_str)
+    
+    def reservas_entre(self, desde_str, hasta_str):
+        self._asegurar_sincronizado()
+        return self.local.reservas_entre(desde_str, hasta_str)
+    
+    def leer_configuracion(self):
+        self._asegurar_sincronizado()
+        return self.local.leer_configuracion()
+    
+    def escribir_configuracion(self, filas):
+        self.remoto.escribir_configuracion(filas)
+        self.local.escribir_configuracion(filas)